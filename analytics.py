@@ -0,0 +1,126 @@
+import pandas as pd
+
+from receipt_schema import (CURRENCY_FIELD, DEFAULT_CURRENCY, CURRENCY_ALIASES,
+                            normalize_date, normalize_vendor, parse_amount, parse_currency)
+
+# Values standing for a missing field (compared without case)
+MISSING_VALUES = ["", "unknown", "null", "none", "n/a", "error", "nan"]
+
+# Report columns normalize_results reads; the ledger only needs to load these
+SOURCE_COLUMNS = ["Date", "Item Category", "Vendor Name", "Price Amount", CURRENCY_FIELD]
+
+# Summary name -> (grouping column, label shown for it)
+SUMMARIES = {
+    "vendor": ("Vendor Key", "Vendor Name"),
+    "category": ("Item Category", "Item Category"),
+    "month": ("Month", "Month"),
+}
+
+
+def _text(series):
+    """Stripped strings, with the missing-value sentinels turned into NA."""
+    text = series.astype("string").str.strip()
+    return text.mask(text.str.lower().isin(MISSING_VALUES))
+
+
+def _map_unique(series, fn):
+    """Applies fn once per distinct value of series rather than once per row."""
+    values = series.dropna().unique()
+    return series.map(dict(zip(values, map(fn, values))))
+
+
+def normalize_results(df):
+    """
+    Returns a typed copy of result rows (report columns, as in the ledger)
+    built with column operations only:
+    - Date as datetime64; dates not already in YYYY-MM-DD are parsed with
+      normalize_date, and unreadable ones become NaT
+    - Price Amount as a float rounded to cents ("RM 1,234.50" -> 1234.5)
+    - Currency taken from its column, else from the amount text, else
+      DEFAULT_CURRENCY, with aliases applied (MYR -> RM)
+    - Item Category, Vendor Name and Currency as categoricals, plus a Vendor
+      Key grouping spellings of one vendor (see normalize_vendor) and the
+      Month of the date
+    "Unknown", "Error" and other sentinels become missing values. Other
+    columns are kept as they are.
+    """
+    typed = df.copy()
+
+    dates = _text(typed.get("Date", pd.Series(pd.NA, index=typed.index)))
+    parsed = pd.to_datetime(dates, format="%Y-%m-%d", errors="coerce")
+    retry = parsed.isna() & dates.notna()
+    if retry.any():
+        # Only dates in another format go through the per-value parser
+        parsed[retry] = pd.to_datetime(_map_unique(dates[retry], normalize_date), format="%Y-%m-%d", errors="coerce")
+    typed["Date"] = parsed
+    typed["Month"] = parsed.dt.to_period("M")
+
+    amounts = _text(typed.get("Price Amount", pd.Series(pd.NA, index=typed.index)))
+    # "RM 1,234.50" -> "1234.50": currency and thousands separators dropped in one pass
+    numbers = pd.to_numeric(amounts.str.replace(r"^[^0-9\-]+|[^0-9]+$|,", "", regex=True), errors="coerce").astype("float64")
+    retry = numbers.isna() & amounts.notna()
+    if retry.any():
+        # More than one number, e.g. "12.50 (incl. tax 0.50)": parse_amount takes the first
+        numbers[retry] = pd.to_numeric(_map_unique(amounts[retry], parse_amount), errors="coerce")
+    typed["Price Amount"] = numbers.round(2)
+
+    currency = _text(typed.get(CURRENCY_FIELD, pd.Series(pd.NA, index=typed.index)))
+    missing = currency.isna() & amounts.notna()
+    if missing.any():
+        # What is left of "RM 12.00" without the number, parsed once per distinct symbol
+        symbols = amounts[missing].str.replace(r"[0-9.,\-\s]+", " ", regex=True).str.strip()
+        currency[missing] = _map_unique(symbols.mask(symbols == ""), parse_currency)
+    currency = currency.fillna(DEFAULT_CURRENCY)
+    currency = currency.astype("category")
+    aliases = {code: CURRENCY_ALIASES.get(code.upper(), code) for code in currency.cat.categories}
+    typed[CURRENCY_FIELD] = currency.map(aliases).astype("category")
+
+    for column in ("Item Category", "Vendor Name"):
+        typed[column] = _text(typed.get(column, pd.Series(pd.NA, index=typed.index))).astype("category")
+
+    # normalize_vendor runs once per distinct spelling, not once per row
+    vendors = typed["Vendor Name"].cat.categories
+    keys = pd.Series([normalize_vendor(vendor) or vendor for vendor in vendors], index=vendors, dtype="string")
+    typed["Vendor Key"] = typed["Vendor Name"].map(keys).astype("category")
+    return typed
+
+
+def spending_summary(typed, by):
+    """
+    Totals of a typed frame (see normalize_results) per vendor, category or
+    month (by, one of SUMMARIES), and per currency, since amounts in
+    different currencies are never added up. Columns: the group's label,
+    Currency, Receipts, Total, Average, First and Last (dates). Receipts
+    without the grouping value are summed under "Unknown"; a vendor is
+    labelled with its most frequent spelling.
+    """
+    column, label = SUMMARIES[by]
+    grouped = typed.groupby([column, CURRENCY_FIELD], observed=True, dropna=False, sort=False)
+    summary = grouped.agg(
+        Receipts=("Price Amount", "size"),
+        Total=("Price Amount", "sum"),
+        Average=("Price Amount", "mean"),
+        First=("Date", "min"),
+        Last=("Date", "max"),
+    ).reset_index()
+
+    if by == "vendor":
+        spellings = (typed.groupby(["Vendor Key", "Vendor Name"], observed=True).size()
+                     .sort_values(ascending=False).reset_index())
+        names = spellings.drop_duplicates("Vendor Key").set_index("Vendor Key")["Vendor Name"].astype("string")
+        summary[label] = summary[column].map(names).astype("string")
+        summary = summary.drop(columns=[column])
+    if by == "month":
+        summary = summary.sort_values(column, na_position="last")
+    else:
+        summary = summary.sort_values("Total", ascending=False)
+
+    summary[label] = summary[label].astype("string").fillna("Unknown")
+    summary[["Total", "Average"]] = summary[["Total", "Average"]].round(2)
+    return summary[[label, CURRENCY_FIELD, "Receipts", "Total", "Average", "First", "Last"]].reset_index(drop=True)
+
+
+def summarize(df):
+    """Normalizes result rows and returns {summary name: spending_summary(...)} for every summary."""
+    typed = normalize_results(df)
+    return {by: spending_summary(typed, by) for by in SUMMARIES}
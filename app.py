@@ -1,18 +1,45 @@
 import streamlit as st
 import os
-import pandas as pd
 from dotenv import load_dotenv
-from utils import configure_gemini, extract_receipt_info, rename_file, copy_and_rename_file, generate_filename
+from utils import extract_receipt_info, extract_receipts_batch, rename_file, copy_and_rename_file, generate_filename, source_name
+from engine import iter_extractions, DEFAULT_MAX_WORKERS, DEFAULT_BATCH_SIZE
+from cache import ExtractionCache
+from dedup import PerceptualIndex
+from ratelimit import RequestGovernor
+from preprocess import DEFAULT_MAX_EDGE
+from journal import JobJournal, content_digest, job_id_for
+from ledger import Ledger
+from workspace import WorkspaceManager
+from export import CSV_MIME, XLSX_MIME, export_bytes
+from archive import SpooledZip, read_file
+from instrumentation import RunMetrics, logging_sink
+from backends import DEFAULT_BACKEND, backend_names, backend_label, get_backend
+from cascade import CascadeTally, extract_with_cascade, extract_batch_with_cascade, describe_summary
+from jobs import JobManager, QUEUED, FAILED, CANCELLED
 import subprocess
 import signal
 import sys
 
+import re
 import shutil
-import zipfile
-import io
+import uuid
+import tempfile
+import sqlite3
+from functools import partial
 
 load_dotenv()
 
+# Uploads larger than this are written to disk instead of processed in memory
+SPILL_THRESHOLD_MB = int(os.getenv("RECEIPT_SPILL_MB", "50"))
+
+# Columns of the results table, in display order
+RESULT_COLUMNS = ["Date", "Item Category", "Vendor Name", "Item Name", "Receipt_Invoice_No", "Price Amount",
+                  "Currency", "File Name", "Duplicate Of"]
+
+# Shapes of the job id (see job_id_for) and owner token accepted from the address
+JOB_ID = re.compile(r"[0-9a-f]{16}")
+OWNER_TOKEN = re.compile(r"[0-9a-f]{32}")
+
 st.set_page_config(page_title="Receipts Compiler", layout="wide")
 
 # PWA Integration - Inject meta tags and service worker
@@ -61,28 +88,108 @@ pwa_html = """
 
 st.components.v1.html(pwa_html, height=0)
 
+@st.cache_resource
+def get_extraction_cache():
+    """Shared extraction cache for all sessions of this server."""
+    return ExtractionCache()
+
+@st.cache_resource
+def get_duplicate_index():
+    """Shared perceptual-hash index of every processed image."""
+    return PerceptualIndex()
+
+@st.cache_resource
+def get_request_governor():
+    """Shared rate limiter so all sessions stay within one API quota."""
+    return RequestGovernor()
+
+@st.cache_resource
+def get_ledger():
+    """Shared ledger of every compiled receipt."""
+    return Ledger()
+
+@st.cache_resource
+def get_job_manager():
+    """Shared pool of background workers that run the processing jobs of every session."""
+    return JobManager()
+
+@st.cache_resource
+def get_workspace():
+    """Shared manager of per-session and per-job working directories."""
+    return WorkspaceManager()
+
+@st.cache_data(max_entries=4, show_spinner="Summarizing the ledger...")
+def get_ledger_summary(ledger_path, receipt_count):
+    """Spending totals of the whole ledger; receipt_count is part of the key so saving a batch refreshes them."""
+    from analytics import SOURCE_COLUMNS, summarize # Deferred: pulls in pandas
+    return summarize(get_ledger().to_dataframe(columns=SOURCE_COLUMNS))
+
 st.title("🧾 Receipts Compiler & Organizer")
 st.markdown("""
 This tool extracts information from receipts/invoices using AI, compiles them into a CSV or Excel file, 
 and renames the files for easy organization.
 """)
 
+# Each browser session gets its own workspace directory
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = uuid.uuid4().hex
+    # Secret token tying this browser to the jobs it submits; kept in the address (?owner=...) across reloads
+    owner = st.query_params.get("owner", "")
+    st.session_state['owner'] = owner if OWNER_TOKEN.fullmatch(owner) else uuid.uuid4().hex
+    st.session_state['job_ids'] = [] # Jobs submitted by this session, whose folders Reset App removes
+    # A reloaded page picks up the job it was following from the address (?job=...), if it submitted it
+    followed_id = st.query_params.get("job", "")
+    if JOB_ID.fullmatch(followed_id):
+        followed_job = get_job_manager().get(followed_id)
+        if followed_job is not None and followed_job.is_owned_by(st.session_state['owner']):
+            st.session_state['job_id'] = followed_id
+session_dir = get_workspace().session_dir(st.session_state['session_id'])
+
 # Sidebar for Configuration
 with st.sidebar:
     st.header("Configuration")
     
     if st.button("Reset App", type="primary"):
+        # Stop this session's jobs and remove its working files before forgetting about them
+        get_job_manager().cancel_session(st.session_state['session_id'])
+        followed_job = get_job_manager().get(st.session_state.get('job_id'))
+        if followed_job is not None and followed_job.is_owned_by(st.session_state['owner']):
+            followed_job.cancel() # Possibly started by an earlier session of this page
+        # Job folders are shared by identical uploads: leave those another owner's job is working in
+        job_ids = [job_id for job_id in st.session_state['job_ids']
+                   if (job := get_job_manager().get(job_id)) is None or job.finished
+                   or job.is_owned_by(st.session_state['owner'])]
+        get_workspace().remove_session(st.session_state['session_id'], job_ids)
         for key in list(st.session_state.keys()):
             del st.session_state[key]
+        st.query_params.clear()
         st.rerun()
 
+    # Extraction Backend
+    available_backends = backend_names()
+    backend_name = st.selectbox("Extraction Backend", available_backends,
+                                index=available_backends.index(DEFAULT_BACKEND) if DEFAULT_BACKEND in available_backends else 0,
+                                format_func=backend_label,
+                                help="Model the receipts are sent to. The local stand-in makes no API calls and returns made-up data, for trying out the app.")
+    backend = get_backend(backend_name)
+
+    # Model Cascade
+    cascade_mode = st.checkbox("Cascade Mode", value=False,
+                               help="Send every receipt to a cheaper first-pass model and escalate only those that fail validation (unknown fields, bad date or amount) to the backend above")
+    first_pass_name = st.selectbox("First-Pass Backend", available_backends,
+                                   index=available_backends.index("gemini-lite") if "gemini-lite" in available_backends else 0,
+                                   format_func=backend_label,
+                                   disabled=not cascade_mode)
+    first_pass_backend = get_backend(first_pass_name) if cascade_mode else None
+
     # Get API key from Streamlit secrets (cloud) or environment variable (local)
     try:
         api_key = st.secrets["GEMINI_API_KEY"]
     except (KeyError, FileNotFoundError):
         api_key = os.getenv("GEMINI_API_KEY", "")
     
-    if not api_key:
+    needs_api_key = backend.requires_api_key or (cascade_mode and first_pass_backend.requires_api_key)
+    if needs_api_key and not api_key:
         st.error("⚠️ Gemini API key not found. Please configure it in Streamlit secrets or .env file.")
         st.stop()
     
@@ -97,11 +204,61 @@ with st.sidebar:
     # Output Format
     output_format = st.selectbox("Output Format", ["CSV", "Excel (.xlsx)", "None"])
 
+    # Concurrency
+    max_workers = st.slider("Parallel Requests", min_value=1, max_value=16,
+                            value=DEFAULT_MAX_WORKERS,
+                            help="Number of receipts sent to Gemini at the same time")
+    batch_size = st.slider("Receipts per Request", min_value=1, max_value=10,
+                           value=DEFAULT_BATCH_SIZE,
+                           help="Send several receipts in one Gemini request to stay within request-per-minute quotas")
+
+    # Extraction Cache
+    use_cache = st.checkbox("Use Extraction Cache", value=True,
+                            help="Reuse earlier results for images that were already processed. Untick to force a fresh extraction.")
+    cache_stats = get_extraction_cache().stats()
+    st.caption(f"Cache: {cache_stats['entries']} entries, "
+               f"{cache_stats['hits']} hits / {cache_stats['misses']} misses")
+    if st.button("Clear Cache"):
+        get_extraction_cache().clear()
+        st.rerun()
+
+    # Near-duplicate Detection
+    detect_duplicates = st.checkbox("Detect Duplicate Receipts", value=True,
+                                    help="Flag receipts in the Duplicate Of column when the image looks the same as one already processed (re-uploads, re-saved or re-scanned copies) and the extracted date and amount match. Flagged receipts are still extracted and billed; only exact copies are answered by the extraction cache.")
+    st.caption(f"Duplicate index: {get_duplicate_index().size()} images")
+    if st.button("Clear Duplicate Index"):
+        get_duplicate_index().clear()
+        st.rerun()
+    duplicate_invoices = st.selectbox("Duplicate Invoices", ["Flag", "Drop", "Allow"],
+                                      help="Receipts with the same vendor, invoice number and amount as one already in the ledger (or earlier in the upload) are flagged in the Duplicate Of column, or left out of the results.")
+
+    # Image Optimization
+    optimize_images = st.checkbox("Optimize Images Before Upload", value=True,
+                                  help="Fix orientation, shrink and re-encode images to cut upload time. Falls back to the original if fields come back unknown.")
+    max_image_edge = st.number_input("Max Image Size (px)", min_value=512, max_value=8000,
+                                     value=DEFAULT_MAX_EDGE, step=100,
+                                     disabled=not optimize_images,
+                                     help="Longest edge of the image sent to Gemini")
+
+    # Job Journal
+    resume_jobs = st.checkbox("Resume Interrupted Jobs", value=True,
+                              help="When the same files are uploaded again, skip the ones already processed in an earlier run instead of paying for them twice")
+
+    # API Rate Limiting
+    api_metrics = get_request_governor().metrics()
+    st.caption(f"API: {api_metrics['requests_per_minute']} req/min, "
+               f"{api_metrics['retries']} retries, "
+               f"{api_metrics['throttle_seconds']:.0f}s throttled, "
+               f"concurrency limit {api_metrics['concurrency_limit']}")
+
+    # Workspace Disk Usage
+    workspace_usage = get_workspace().usage()
+    st.caption(f"Workspace: {workspace_usage['bytes'] / (1024 * 1024):.1f} MB of "
+               f"{workspace_usage['quota_bytes'] / (1024 * 1024):.0f} MB used")
+
     # Initialize session state
     if 'processed_data' not in st.session_state:
         st.session_state['processed_data'] = None
-    if 'data_saved' not in st.session_state:
-        st.session_state['data_saved'] = False
 
 # Main Area UI
 selection_container = st.empty()
@@ -114,11 +271,11 @@ with selection_container.container():
         st.subheader("1. Select Files")
         uploaded_files = st.file_uploader(
             "Upload receipt/invoice images",
-            type=["jpg", "jpeg", "png", "webp"],
+            type=["jpg", "jpeg", "png", "webp", "pdf"],
             accept_multiple_files=True,
-            help="Select one or more receipt/invoice images to process"
+            help="Select one or more receipt/invoice images or PDFs to process"
         )
-        st.info("Supported formats: .jpg, .jpeg, .png, .webp")
+        st.info("Supported formats: .jpg, .jpeg, .png, .webp, .pdf (multi-page invoices become one row)")
         if uploaded_files:
             st.success(f"Uploaded {len(uploaded_files)} file(s)")
 
@@ -131,7 +288,7 @@ with selection_container.container():
             format_string = st.text_area("Filename Format", value=default_format, height=100, help="Use placeholders like {Date}, {Vendor Name}, etc.")
             
             st.markdown("**Available Tags:**")
-            tags = ["{Date}", "{Vendor Name}", "{Price Amount}", "{Item Category}", "{Item Name}", "{Receipt_Invoice_No}"]
+            tags = ["{Date}", "{Vendor Name}", "{Price Amount}", "{Currency}", "{Item Category}", "{Item Name}", "{Receipt_Invoice_No}"]
             st.code(" ".join(tags), language="text")
             
             # Preview
@@ -142,7 +299,8 @@ with selection_container.container():
                 "Vendor Name": "Starbucks",
                 "Item Name": "Coffee",
                 "Receipt_Invoice_No": "12345",
-                "Price Amount": "15.50"
+                "Price Amount": "15.50",
+                "Currency": "RM"
             }
             preview_name = generate_filename(example_data, ".jpg", format_string)
             st.info(preview_name)
@@ -150,205 +308,505 @@ with selection_container.container():
             format_string = "" # Not used
 
     st.divider()
-    start_processing = st.button("Start Processing", type="primary", use_container_width=True)
+    active_job = get_job_manager().get(st.session_state.get('job_id'))
+    start_processing = st.button("Start Processing", type="primary", use_container_width=True,
+                                 disabled=active_job is not None and not active_job.finished)
+
+def save_to_ledger(ledger, outcome):
+    """
+    Appends a finished job's results to the ledger under its batch id,
+    recording in the outcome how many rows were added or why it failed. The
+    append is one transaction, so a failed save can simply be tried again.
+    """
+    if outcome["ledger_added"] is not None:
+        return # Saved already
+    try:
+        with outcome["run_metrics"].stage("ledger"):
+            outcome["ledger_added"] = ledger.append(outcome["results"], batch_id=outcome["batch_id"])
+        outcome["ledger_error"] = None
+    except sqlite3.Error as e:
+        print(f"DEBUG: Could not save batch {outcome['batch_id']} to the ledger: {e}")
+        outcome["ledger_error"] = str(e)
 
 if start_processing:
-    selection_container.empty() # Hide the selection UI
-    st.session_state['data_saved'] = False # Reset saved state on new run
-    
     if not uploaded_files:
         st.error("Please upload files to process.")
     else:
-        configure_gemini(api_key)
+        backend.configure(api_key)
+        if cascade_mode:
+            first_pass_backend.configure(api_key)
         
-        # Create temporary directory for uploaded files
-        import tempfile
-        temp_dir = tempfile.mkdtemp()
+        # Job directory for the journal, the ZIP and any spilled uploads. Keyed by content and model
+        # only, so the same upload resumes its journal from any tab or session
+        model_salt = f"{first_pass_backend.model_name}>{backend.model_name}" if cascade_mode else backend.model_name
+        upload_digests = [content_digest(f) for f in uploaded_files]
+        job_id = job_id_for(zip((f.name for f in uploaded_files), upload_digests), salt=model_salt)
+        temp_dir = get_workspace().job_dir(job_id)
+        get_workspace().cleanup(protect=[session_dir, temp_dir, *get_job_manager().active_dirs()])
         files_to_process = []
+        file_digests = [] # Content SHA-256 of each file, the key of its journal entries
+        
+        for uploaded_file, digest in zip(uploaded_files, upload_digests):
+            file_digests.append(digest)
+            if uploaded_file.size > SPILL_THRESHOLD_MB * 1024 * 1024:
+                # Spill very large uploads to the temp directory
+                temp_path = os.path.join(temp_dir, uploaded_file.name)
+                with open(temp_path, 'wb') as f:
+                    f.write(uploaded_file.getbuffer())
+                files_to_process.append(temp_path)
+            else:
+                # Extraction, hashing and zipping all share the uploaded buffer
+                files_to_process.append(uploaded_file)
         
-        for uploaded_file in uploaded_files:
-            # Save uploaded file to temp directory
-            temp_path = os.path.join(temp_dir, uploaded_file.name)
-            with open(temp_path, 'wb') as f:
-                f.write(uploaded_file.getbuffer())
-            files_to_process.append(temp_path)
+        # Validate spilled file paths (in-memory uploads are always present)
+        for file_path in files_to_process:
+            if isinstance(file_path, str) and not os.path.exists(file_path):
+                st.warning(f"Skipping file not found: {file_path}")
+        kept = [(p, d) for p, d in zip(files_to_process, file_digests) if not isinstance(p, str) or os.path.exists(p)]
+        files_to_process = [p for p, _ in kept]
+        file_digests = [d for _, d in kept]
         
         if not files_to_process:
             st.warning("No image files found.")
         else:
-            st.write(f"Found {len(files_to_process)} images. Processing...")
-            
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            results = []
-            failed_files = [] # List to store failed files
-            processed_files_map = {} # Map original filename to new path (if renamed) or old path
+            # ZIP for renamed files, spooled to disk as results arrive
+            zip_name = f"renamed_receipts_{st.session_state['session_id']}.zip"
+            zip_path = os.path.join(temp_dir, zip_name) if file_handling == "Rename Files" else None
             
-            # Initialize ZIP buffer for renamed files
-            zip_buffer = io.BytesIO()
-            zip_file = zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) if file_handling == "Rename Files" else None
+            run_metrics = RunMetrics(sinks=[logging_sink()]) # Per-stage timings and token usage
+            cascade_tally = CascadeTally(first_pass_backend, backend) if cascade_mode else None
+            governor = get_request_governor()
+            ledger = get_ledger()
+            save_results = output_format != "None"
+            extract_options = {"cache": get_extraction_cache() if use_cache else None,
+                               "preprocess": optimize_images,
+                               "max_edge": max_image_edge,
+                               "governor": governor,
+                               "metrics": run_metrics,
+                               "dedup": get_duplicate_index() if detect_duplicates else None}
             
-            for i, file_path in enumerate(files_to_process):
-                filename = os.path.basename(file_path)
-                status_text.text(f"Processing: {filename}")
+            def process_job(job):
+                """
+                Extracts, renames and zips the upload on a background worker,
+                reporting progress on job. Runs outside the Streamlit script,
+                so it must not call st.*; the page renders what it returns.
+                """
+                failed_files = [] # List to store failed files
+                upload_stats = {} # Per-file upload statistics from the preprocessing stage
+                ordered_results = [None] * len(files_to_process) # Keeps results in upload order
+                zip_file = SpooledZip(zip_path) if zip_path else None
+                if zip_file:
+                    job.outputs["zip"] = zip_file # For partial downloads while the job runs
                 
-                # Validate file path
-                if not os.path.exists(file_path):
-                    st.warning(f"Skipping file not found: {file_path}")
-                    continue
-
-                # Extract Info
-                data = extract_receipt_info(file_path)
+                def extract_fn(file_path):
+                    stats = {}
+                    if cascade_tally:
+                        data = extract_with_cascade(file_path, first_pass_backend, backend, tally=cascade_tally,
+                                                    stats=stats, **extract_options)
+                    else:
+                        data = extract_receipt_info(file_path, stats=stats, backend=backend, **extract_options)
+                    upload_stats[source_name(file_path)] = stats
+                    return data
+                
+                def extract_batch_fn(file_paths):
+                    stats = [{} for _ in file_paths]
+                    if cascade_tally:
+                        batch_results = extract_batch_with_cascade(file_paths, first_pass_backend, backend,
+                                                                   tally=cascade_tally, stats=stats, **extract_options)
+                    else:
+                        batch_results = extract_receipts_batch(file_paths, stats=stats, backend=backend, **extract_options)
+                    for file_path, file_stats in zip(file_paths, stats):
+                        upload_stats[source_name(file_path)] = file_stats
+                    return batch_results
                 
-                # Handle Files
-                if "Error Details" not in data:
-                    results.append(data) # Only add successful results
+                def handle_result(i, file_path, data, record=True):
+                    filename = source_name(file_path)
                     
-                    if file_handling == "Rename Files":
-                        # Generate new name for report and ZIP
-                        extension = os.path.splitext(filename)[1]
-                        new_filename = generate_filename(data, extension, format_string)
-                        processed_files_map[filename] = new_filename # Store new name for report
+                    # Handle Files
+                    if "Error Details" not in data:
+                        new_filename = filename
+                        
+                        if file_handling == "Rename Files":
+                            # Generate new name for report and ZIP
+                            extension = os.path.splitext(filename)[1]
+                            with run_metrics.stage("rename", filename):
+                                new_filename = generate_filename(data, extension, format_string)
+                            
+                            # Add to ZIP
+                            if zip_file:
+                                try:
+                                    with run_metrics.stage("zip", filename):
+                                        new_filename = zip_file.add(file_path, new_filename)
+                                except Exception as e:
+                                    print(f"Error adding to zip: {e}")
                         
-                        # Add to ZIP
-                        if zip_file:
-                            try:
-                                with open(file_path, 'rb') as f:
-                                    zip_file.writestr(new_filename, f.read())
-                            except Exception as e:
-                                print(f"Error adding to zip: {e}")
-                    else: # Keep Original
-                        processed_files_map[filename] = filename
-                else:
-                    # Add to failed files list
-                    failed_files.append({"filename": filename, "error": data["Error Details"]})
+                        if record:
+                            journal.record(file_digests[i], "done", data, new_filename)
+                        ordered_results[i] = {**data, "File Name": new_filename} # Only add successful results
+                        job.publish(ordered_results[i])
+                    else:
+                        # Add to failed files list
+                        failed_files.append({"filename": filename, "error": data["Error Details"]})
+                        if record:
+                            journal.record(file_digests[i], "failed", data)
                 
-                progress_bar.progress((i + 1) / len(files_to_process))
-            
-            # Close ZIP
-            if zip_file:
-                zip_file.close()
-
-            status_text.text("Processing Complete!")
-            
-            # Display failed files if any
-            if failed_files:
-                st.error(f"⚠️ Could not process {len(failed_files)} file(s):")
-                for fail in failed_files:
-                    st.write(f"- **{fail['filename']}**: {fail['error']}")
-
-            if not results:
-                st.warning("No valid receipts found in the uploaded files.")
-                st.session_state['processed_data'] = None
-            else:
-                # Create DataFrame
-                df = pd.DataFrame(results)
+                # Restore files finished by an earlier, interrupted run of the same upload
+                journal = JobJournal(os.path.join(temp_dir, "journal.jsonl"))
+                finished = journal.completed() if resume_jobs else {}
+                pending = [] # (index, file_path) of files that still need extraction
+                for i, file_path in enumerate(files_to_process):
+                    entry = finished.get(file_digests[i])
+                    if entry:
+                        handle_result(i, file_path, entry["data"], record=False)
+                    else:
+                        pending.append((i, file_path))
                 
-                # Reorder columns to match requirements + File Name at end
-                desired_columns = ["Date", "Item Category", "Vendor Name", "Item Name", "Receipt_Invoice_No", "Price Amount", "File Name"]
+                resumed = completed = len(files_to_process) - len(pending)
+                job.update(completed, f"Processing {len(files_to_process)} file(s) with up to {max_workers} parallel requests...")
                 
-                # Check if we have errors to show (shouldn't be any in results now, but kept for safety)
-                if "Error Details" in df.columns:
-                    desired_columns.append("Error Details")
-
-                # Ensure all columns exist
-                for col in desired_columns:
-                    if col not in df.columns:
-                        df[col] = ""
+                # Extract Info concurrently; results arrive in completion order
+                extractions = iter_extractions([file_path for _, file_path in pending], extract_fn,
+                                               max_workers, batch_size, extract_batch_fn)
+                try:
+                    for j, file_path, data in extractions:
+                        completed += 1
+                        handle_result(pending[j][0], file_path, data)
+                        job.update(completed, f"Processed: {source_name(file_path)} ({completed}/{len(files_to_process)})")
+                        job.check_cancelled()
+                finally:
+                    extractions.close() # Waits for requests in flight and drops queued ones
+                    journal.close()
+                    if zip_file:
+                        zip_file.close()
                 
-                # Update File Name column if renamed or copied
-                if file_handling != "Keep Original (No Action)":
-                    def get_new_name(row):
-                        old_name = row['File Name']
-                        if old_name in processed_files_map:
-                            return os.path.basename(processed_files_map[old_name])
-                        return old_name
-
-                    df['File Name'] = df.apply(get_new_name, axis=1)
-
-                final_df = df[desired_columns]
+                results = [data for data in ordered_results if data is not None]
+                
+                # Check for invoices already claimed, against the whole ledger
+                invoice_duplicates = {}
+                if duplicate_invoices != "Allow" and results:
+                    invoice_duplicates = ledger.find_duplicates(results)
+                    if duplicate_invoices == "Drop":
+                        results = [data for i, data in enumerate(results) if i not in invoice_duplicates]
+                    else:
+                        for i, original in invoice_duplicates.items():
+                            results[i]["Duplicate Of"] = original or "earlier receipt"
                 
-                # Store in session state
-                st.session_state['processed_data'] = {
-                    'df': final_df,
-                    'save_dir': temp_dir,
-                    'file_handling': file_handling,
-                    'zip_buffer': zip_buffer
+                outcome = {
+                    "results": results,
+                    "batch_id": uuid.uuid4().hex,
+                    "ledger_added": None,
+                    "ledger_error": None,
+                    "failed_files": failed_files,
+                    "upload_stats": upload_stats,
+                    "resumed": resumed,
+                    "invoice_duplicates": len(invoice_duplicates),
+                    "duplicate_invoices": duplicate_invoices,
+                    "api_metrics": governor.metrics(),
+                    "cascade_summary": cascade_tally.summary() if cascade_tally else None,
+                    "run_metrics": run_metrics,
+                    "file_handling": file_handling,
+                    "save_dir": temp_dir,
+                    "zip_path": zip_path,
                 }
+                if save_results and results:
+                    # Saved here rather than by the page, so reloads and other tabs cannot save the batch twice
+                    save_to_ledger(ledger, outcome)
+                return outcome
+            
+            try:
+                job = get_job_manager().submit(job_id, st.session_state['session_id'], len(files_to_process),
+                                               process_job, work_dir=temp_dir, owner=st.session_state['owner'])
+            except ValueError:
+                st.error("These files are already being processed in another tab or session. "
+                         "Follow them there, or submit again once that run has finished to pick up its results.")
+            else:
+                if job_id not in st.session_state['job_ids']:
+                    st.session_state['job_ids'].append(job_id)
+                st.session_state['job_id'] = job.id
+                st.session_state['processed_data'] = None
+                st.query_params["job"] = job.id
+                st.query_params["owner"] = st.session_state['owner']
+
+def partial_csv(job):
+    """CSV of the rows a job has finished so far."""
+    rows = ([row.get(column, "") for column in RESULT_COLUMNS] for row in job.rows_since(0))
+    return export_bytes(rows, RESULT_COLUMNS, "csv")
+
+def partial_zip(zip_file):
+    """ZIP of the images a job has renamed so far, spooled next to its archive and read back once."""
+    fd, path = tempfile.mkstemp(suffix=".zip", dir=os.path.dirname(zip_file.path))
+    os.close(fd)
+    try:
+        return read_file(zip_file.snapshot(path))
+    finally:
+        os.remove(path)
+
+def show_partial_results(job):
+    """Rows a job has finished so far, with downloads of everything finished up to the click."""
+    import pandas as pd # Deferred until rows arrive
+    live = st.session_state.get('live_results')
+    if live is None or live['job_id'] != job.id:
+        live = st.session_state['live_results'] = {'job_id': job.id, 'df': None}
+    shown = 0 if live['df'] is None else len(live['df'])
+    new_rows = job.rows_since(shown)
+    if new_rows:
+        # Only the rows finished since the last refresh are converted and appended
+        new_df = pd.DataFrame(new_rows).reindex(columns=RESULT_COLUMNS)
+        live['df'] = new_df if live['df'] is None else pd.concat([live['df'], new_df], ignore_index=True)
+    if live['df'] is None:
+        return
+
+    st.dataframe(live['df'], hide_index=True)
+    zip_file = job.outputs.get("zip")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="Download Partial CSV",
+            data=partial(partial_csv, job),
+            file_name="partial_receipts.csv",
+            mime=CSV_MIME,
+            key=f"partial_csv_{job.id}",
+            help="Every receipt finished so far"
+        )
+    if zip_file is not None and zip_file.count:
+        with col2:
+            st.download_button(
+                label="Download Partial ZIP",
+                data=partial(partial_zip, zip_file),
+                file_name="renamed_receipts_partial.zip",
+                mime="application/zip",
+                key=f"partial_zip_{job.id}",
+                help="Every renamed image finished so far"
+            )
+
+@st.fragment(run_every=1)
+def show_job_progress(job):
+    """
+    Progress and finished rows of a running job, refreshed every second
+    without rerunning the whole page; rows finished in between arrive as one update.
+    """
+    snapshot = job.snapshot()
+    if snapshot["state"] == QUEUED:
+        st.info(f"Waiting for a free worker ({get_job_manager().queue_position(job)} job(s) ahead)...")
+    else:
+        st.progress(snapshot["completed"] / max(1, snapshot["total"]))
+        st.text(snapshot["message"] or f"Found {snapshot['total']} images. Processing...")
+        if snapshot["rate"]:
+            eta = int(snapshot["eta"])
+            st.caption(f"{snapshot['rate']:.2f} files/s, about {eta // 60}m {eta % 60:02d}s left")
+    if st.button("Cancel Processing", disabled=job.cancelled):
+        job.cancel()
+    show_partial_results(job)
+    if job.finished:
+        st.rerun()
+
+# Background job of this session: progress while it runs, a summary once it is done
+current_job = get_job_manager().get(st.session_state.get('job_id'))
+if current_job is not None and not current_job.finished:
+    st.subheader("Processing")
+    st.caption("You can keep using the page; processing continues in the background.")
+    show_job_progress(current_job)
+elif current_job is not None and current_job.state == FAILED:
+    st.error(f"Processing failed: {current_job.error}")
+    show_partial_results(current_job)
+elif current_job is not None and current_job.state == CANCELLED:
+    st.warning("Processing was cancelled. Files finished so far are kept in the job journal "
+               "and skipped when the same upload is processed again.")
+    show_partial_results(current_job)
+elif current_job is not None:
+    import pandas as pd # Deferred until there are results, to keep the first page load fast
+    outcome = current_job.result
+    results = outcome["results"]
+    upload_stats = outcome["upload_stats"]
+    failed_files = outcome["failed_files"]
+    
+    if st.session_state.get('collected_batch') != outcome["batch_id"]:
+        # First rerun after the job finished: build the results table
+        st.session_state['collected_batch'] = outcome["batch_id"]
+        st.session_state.pop('live_results', None)
+        st.session_state['run_metrics'] = outcome["run_metrics"]
+        st.query_params.pop("job", None) # Collected: a reload starts afresh instead of showing the batch again
+        if not results:
+            st.session_state['processed_data'] = None
+        else:
+            # Create DataFrame
+            df = pd.DataFrame(results)
+            
+            # Reorder columns to match requirements + File Name at end
+            desired_columns = list(RESULT_COLUMNS)
+            
+            # Check if we have errors to show (shouldn't be any in results now, but kept for safety)
+            if "Error Details" in df.columns:
+                desired_columns.append("Error Details")
+
+            # Ensure all columns exist
+            for col in desired_columns:
+                if col not in df.columns:
+                    df[col] = ""
+            
+            final_df = df[desired_columns]
+            
+            # Store in session state
+            st.session_state['processed_data'] = {
+                'df': final_df,
+                'save_dir': outcome["save_dir"],
+                'outcome': outcome,
+                'file_handling': outcome["file_handling"],
+                'zip_path': outcome["zip_path"]
+            }
+    
+    snapshot = current_job.snapshot()
+    st.success(f"Processing Complete! {snapshot['total']} file(s) in {snapshot['elapsed']:.0f}s")
+    if outcome["resumed"]:
+        st.info(f"Resumed job: restored {outcome['resumed']} file(s) already processed in an earlier run.")
+    
+    api_metrics = outcome["api_metrics"]
+    if api_metrics["retries"]:
+        st.caption(f"Recovered from {api_metrics['retries']} API retries "
+                   f"({api_metrics['rate_limited']} rate-limited), "
+                   f"{api_metrics['throttle_seconds']:.0f}s spent throttled")
+    
+    if outcome["cascade_summary"]:
+        st.caption(describe_summary(outcome["cascade_summary"]))
+    
+    duplicates = {name: s["duplicate_of"] for name, s in upload_stats.items() if "duplicate_of" in s}
+    if duplicates:
+        st.warning(f"{len(duplicates)} file(s) repeat receipts processed before (same image, date and amount) "
+                   "and are flagged in the Duplicate Of column. Apart from exact copies answered by "
+                   "the extraction cache, they were still extracted and billed.")
+        with st.expander("Duplicate Receipts"):
+            for name, original in duplicates.items():
+                st.write(f"- **{name}** matches **{original}**")
+    
+    # Summarize upload savings from image optimization
+    uploaded = [s for s in upload_stats.values() if "original_bytes" in s]
+    if uploaded:
+        # PDFs are sent as rendered page images, usually larger than the vector file, so only images are compared
+        images = [s for s in uploaded if "pages" not in s]
+        original_mb = sum(s["original_bytes"] for s in images) / (1024 * 1024)
+        sent_mb = sum(s["processed_bytes"] for s in images) / (1024 * 1024)
+        if sent_mb < original_mb:
+            saved_pct = (1 - sent_mb / original_mb) * 100
+            st.caption(f"Uploaded {sent_mb:.1f} MB of images instead of {original_mb:.1f} MB ({saved_pct:.0f}% smaller)")
+        with st.expander("Image Optimization Details"):
+            st.dataframe(pd.DataFrame([
+                {"File": name,
+                 "Original KB": round(s["original_bytes"] / 1024, 1),
+                 "Sent KB": round(s["processed_bytes"] / 1024, 1),
+                 "Saved KB": round(s["bytes_saved"] / 1024, 1),
+                 "Pages": s.get("pages", 1),
+                 "Grayscale": s.get("grayscale", False),
+                 "Full-Res Retry": s.get("retried_full_resolution", False),
+                 "Tier": s.get("tier", "")}
+                for name, s in upload_stats.items() if "original_bytes" in s
+            ]))
+    
+    # Display failed files if any
+    if failed_files:
+        st.error(f"⚠️ Could not process {len(failed_files)} file(s):")
+        for fail in failed_files:
+            st.write(f"- **{fail['filename']}**: {fail['error']}")
+    
+    if outcome["invoice_duplicates"]:
+        action = "left out" if outcome["duplicate_invoices"] == "Drop" else "flagged in the Duplicate Of column"
+        st.warning(f"{outcome['invoice_duplicates']} receipt(s) repeat an invoice already recorded and were {action}.")
+    
+    if not results:
+        st.warning("No valid receipts found in the uploaded files.")
 
 # Display and Save Logic (Outside the button)
 if st.session_state['processed_data'] is not None:
     final_df = st.session_state['processed_data']['df']
-    save_dir = st.session_state['processed_data']['save_dir']
     file_handling_used = st.session_state['processed_data']['file_handling']
     
     st.subheader("Extracted Data")
     st.dataframe(final_df)
     
-    save_path = ""
-    if output_format == "CSV":
-        save_path = os.path.join(save_dir, "compiled_receipts.csv")
-    elif output_format == "Excel (.xlsx)":
-        save_path = os.path.join(save_dir, "compiled_receipts.xlsx")
-
-    if not st.session_state['data_saved']:
-        try:
-            if output_format == "CSV":
-                if os.path.exists(save_path):
-                    existing_df = pd.read_csv(save_path)
-                    combined_df = pd.concat([existing_df, final_df], ignore_index=True)
-                    combined_df.to_csv(save_path, index=False)
-                    st.success(f"Appended data to `{save_path}`")
-                else:
-                    final_df.to_csv(save_path, index=False)
-                    st.success(f"Saved compiled data to `{save_path}`")
-            elif output_format == "Excel (.xlsx)":
-                if os.path.exists(save_path):
-                    existing_df = pd.read_excel(save_path)
-                    combined_df = pd.concat([existing_df, final_df], ignore_index=True)
-                    combined_df.to_excel(save_path, index=False)
-                    st.success(f"Appended data to `{save_path}`")
-                else:
-                    final_df.to_excel(save_path, index=False)
-                    st.success(f"Saved compiled data to `{save_path}`")
-            
-            if file_handling_used == "Rename Files":
-                st.success("Files have been renamed.")
-            
-            st.session_state['data_saved'] = True
-            
-        except PermissionError:
-            st.error(f"Permission denied: The file `{save_path}` is open in another program. Please close it and try again.")
-            if st.button("Retry Save"):
-                # The button click triggers a rerun, which will re-execute this block
-                pass
-    else:
-        st.info("Data has been saved.")
-
-    # Download Buttons (Always Visible)
-    if os.path.exists(save_path):
-        with open(save_path, "rb") as f:
-            file_data = f.read()
-            file_name = os.path.basename(save_path)
-            mime_type = "text/csv" if output_format == "CSV" else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            
+    ledger = get_ledger()
+    saved_outcome = st.session_state['processed_data']['outcome']
+    batch_id = saved_outcome["batch_id"]
+    run_metrics = st.session_state.get('run_metrics') or RunMetrics()
+
+    # The job saved its rows to the ledger; a batch run without an output format is saved once one is chosen
+    if output_format != "None" and saved_outcome["ledger_added"] is None and saved_outcome["ledger_error"] is None:
+        save_to_ledger(ledger, saved_outcome)
+    if saved_outcome["ledger_error"] is not None:
+        st.error(f"Could not save to the ledger `{ledger.path}`: {saved_outcome['ledger_error']}")
+        if st.button("Retry Save"):
+            save_to_ledger(ledger, saved_outcome)
+            st.rerun()
+    elif saved_outcome["ledger_added"] is not None:
+        st.success(f"Added {saved_outcome['ledger_added']} receipt(s) to the ledger ({ledger.count()} in total) at `{ledger.path}`")
+    
+    if file_handling_used == "Rename Files":
+        st.success("Files have been renamed.")
+
+    # Download Buttons (Always Visible) - exports are generated from the ledger on click
+    if output_format != "None":
+        if output_format == "CSV":
+            file_ext, mime_type = "csv", CSV_MIME
+        else:
+            file_ext, mime_type = "xlsx", XLSX_MIME
+
+        col1, col2 = st.columns(2)
+        with col1:
             st.download_button(
                 label=f"Download {output_format} File",
-                data=file_data,
-                file_name=file_name,
+                data=partial(run_metrics.call, "export", ledger.export_bytes, file_ext, batch_id),
+                file_name=f"compiled_receipts.{file_ext}",
                 mime=mime_type,
                 type="primary"
             )
+        with col2:
+            st.download_button(
+                label=f"Download Full Ledger ({output_format})",
+                data=partial(run_metrics.call, "export", ledger.export_bytes, file_ext, None),
+                file_name=f"receipts_ledger.{file_ext}",
+                mime=mime_type
+            )
             
-    # Add ZIP Download Button if available
-    zip_buffer = st.session_state['processed_data'].get('zip_buffer')
-    if zip_buffer:
+    # Add ZIP Download Button if available; the archive is read from disk only when clicked
+    zip_path = st.session_state['processed_data'].get('zip_path')
+    if zip_path and os.path.exists(zip_path):
         st.download_button(
             label="Download Renamed Images (ZIP)",
-            data=zip_buffer.getvalue(),
+            data=partial(read_file, zip_path),
             file_name="renamed_receipts.zip",
             mime="application/zip",
             type="primary"
         )
 
+# Spending totals per vendor, category and month, computed only when asked for
+ledger_size = get_ledger().count()
+if ledger_size and st.toggle("Show Spending Summary"):
+    from analytics import SUMMARIES, summarize
+    st.subheader("Spending Summary")
+    scope = "Whole Ledger"
+    if st.session_state['processed_data'] is not None:
+        scope = st.radio("Receipts", ["Whole Ledger", "Last Batch"], horizontal=True)
+    if scope == "Last Batch":
+        summaries = summarize(st.session_state['processed_data']['df'])
+    else:
+        summaries = get_ledger_summary(get_ledger().path, ledger_size)
+    st.caption("Amounts in different currencies are totalled separately.")
+    for tab, by in zip(st.tabs([f"By {by.title()}" for by in SUMMARIES]), SUMMARIES):
+        with tab:
+            st.dataframe(summaries[by], hide_index=True)
+
+# Performance breakdown of the last run (export timings appear once a download was generated)
+if st.session_state.get('run_metrics') is not None:
+    import pandas as pd
+    run_metrics = st.session_state['run_metrics']
+    with st.expander("Performance Details"):
+        token_summary = run_metrics.summary()["tokens"]
+        if token_summary["requests"]:
+            st.caption(f"{token_summary['requests']} API responses used "
+                       f"{token_summary['prompt_tokens']} prompt and {token_summary['output_tokens']} output tokens "
+                       f"(p95 {token_summary['per_request']['p95']:.0f} tokens per request)")
+        st.dataframe(pd.DataFrame(run_metrics.summary_rows()))
+        st.download_button(
+            label="Download Metrics (JSON)",
+            data=run_metrics.to_json,
+            file_name="run_metrics.json",
+            mime="application/json"
+        )
@@ -0,0 +1,98 @@
+import os
+import copy
+import time
+import shutil
+import zipfile
+import threading
+
+from utils import read_source
+from renamer import NameIndex
+
+# Formats that are already compressed; deflating them again only burns CPU
+STORED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".heic", ".zip", ".pdf"}
+
+
+def compression_for(filename):
+    """Returns the ZIP compression method to use for a file name."""
+    if os.path.splitext(filename)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class SpooledZip:
+    """
+    ZIP archive written incrementally to a file on disk.
+
+    Entries are added as each file finishes processing and are streamed from
+    their source rather than held in memory. Already-compressed image formats
+    are stored as-is; everything else is deflated.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.count = 0
+        self._names = NameIndex()
+        self._lock = threading.Lock()
+        self._zip = zipfile.ZipFile(path, "w", allowZip64=True)
+
+    def add_file(self, source_path, arcname):
+        """Streams a file from disk into the archive under arcname. Returns the name used."""
+        with self._lock:
+            arcname = self._names.allocate(arcname)
+            self._zip.write(source_path, arcname, compress_type=compression_for(arcname))
+            self.count += 1
+            return arcname
+
+    def add_bytes(self, data, arcname):
+        """Writes an in-memory buffer into the archive under arcname. Returns the name used."""
+        with self._lock:
+            arcname = self._names.allocate(arcname)
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+            info.compress_type = compression_for(arcname)
+            with self._zip.open(info, "w", force_zip64=True) as entry:
+                entry.write(data)
+            self.count += 1
+            return arcname
+
+    def add(self, source, arcname):
+        """Adds a path, bytes-like or file-like source under arcname. Returns the name used."""
+        if isinstance(source, (str, os.PathLike)):
+            return self.add_file(source, arcname)
+        return self.add_bytes(read_source(source), arcname)
+
+    def snapshot(self, path):
+        """
+        Writes a complete ZIP of the entries added so far to path, e.g. to
+        download part of an archive that is still being written (which is not
+        a valid ZIP until closed). The spooled file is copied up to the end of
+        its last entry and given a central directory for those entries, so no
+        source is kept around or read again. Returns path.
+        """
+        with self._lock:
+            if self._zip.fp is None: # Closed: the archive is complete
+                return shutil.copyfile(self.path, path)
+            self._zip.fp.flush()
+            end = self._zip.fp.tell()
+            entries = [copy.copy(info) for info in self._zip.infolist()]
+        shutil.copyfile(self.path, path)
+        with open(path, "r+b") as f:
+            f.truncate(end) # Drops anything written after the snapshot was taken
+            f.seek(end)
+            with zipfile.ZipFile(f, "w", allowZip64=True) as archive:
+                archive.filelist = entries # Written out as the central directory on close
+        return path
+
+    def close(self):
+        """Finishes the archive; it can be downloaded afterwards."""
+        with self._lock:
+            self._zip.close()
+
+
+def read_file(path):
+    """Reads a finished file from disk, e.g. when a download button is clicked."""
+    with open(path, "rb") as f:
+        return f.read()
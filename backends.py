@@ -0,0 +1,140 @@
+import os
+import threading
+
+from fake_gemini import FakeGeminiModel
+
+MODEL_NAME = 'gemini-flash-latest'
+
+# Cheaper, faster model used for the first pass of a cascade
+FAST_MODEL_NAME = os.getenv("RECEIPT_FAST_MODEL", "gemini-flash-lite-latest")
+
+# Backend used when none is chosen in the sidebar or on the command line
+DEFAULT_BACKEND = os.getenv("RECEIPT_BACKEND", "gemini")
+
+
+class ExtractorBackend:
+    """
+    Source of the model that receipts are sent to.
+
+    get_model() returns an object with a generate_content(contents) method
+    taking the prompt and inline image parts and returning a response with
+    a text attribute (and usage_metadata, if the backend reports tokens).
+    model_name is part of the extraction cache key, so results from
+    different backends never answer for each other. Prices are in USD per
+    million tokens and are only used to estimate costs.
+
+    Backends with structured_output accept a generation_config keyword with
+    a JSON response schema and are sent the compact prompts; others get the
+    full text prompts and their answers are parsed leniently.
+    """
+    name = None
+    label = None
+    model_name = None
+    requires_api_key = False
+    structured_output = False
+    input_price = 0.0
+    output_price = 0.0
+
+    def configure(self, api_key=None):
+        """Applies credentials before a run; backends without any ignore it."""
+
+    def get_model(self):
+        raise NotImplementedError
+
+    def cost(self, prompt_tokens, output_tokens):
+        """Estimated cost in USD of a request with the given token counts."""
+        return (prompt_tokens * self.input_price + output_tokens * self.output_price) / 1e6
+
+
+class GeminiBackend(ExtractorBackend):
+    """
+    Google Gemini through the google-generativeai SDK. The SDK is imported on
+    first use rather than at startup, as it takes most of a second to load.
+    """
+    name = "gemini"
+    label = "Google Gemini"
+    requires_api_key = True
+    structured_output = True
+    input_price = 0.30
+    output_price = 2.50
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+
+    def configure(self, api_key=None):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+
+    def get_model(self):
+        import google.generativeai as genai
+        return genai.GenerativeModel(self.model_name)
+
+
+class GeminiLiteBackend(GeminiBackend):
+    """Gemini Flash-Lite: cheaper and faster, suited to clean receipts and cascade first passes."""
+    name = "gemini-lite"
+    label = "Google Gemini Flash-Lite"
+    input_price = 0.10
+    output_price = 0.40
+
+    def __init__(self, model_name=FAST_MODEL_NAME):
+        super().__init__(model_name)
+
+
+class LocalBackend(ExtractorBackend):
+    """
+    Local stand-in answering with made-up receipts, for trying out and
+    benchmarking the pipeline without spending API quota. Keyword options
+    are passed on to FakeGeminiModel.
+    """
+    name = "local"
+    label = "Local Stand-in (no API calls)"
+    model_name = "local-fake"
+    structured_output = True
+
+    def __init__(self, **options):
+        self.model = FakeGeminiModel(**options)
+
+    def get_model(self):
+        return self.model
+
+
+_registry = {}
+_instances = {}
+_lock = threading.Lock()
+
+
+def register_backend(backend_class):
+    """Makes a backend class selectable by its name. Usable as a class decorator."""
+    _registry[backend_class.name] = backend_class
+    return backend_class
+
+
+register_backend(GeminiBackend)
+register_backend(GeminiLiteBackend)
+register_backend(LocalBackend)
+
+
+def backend_names():
+    """Returns the names of the registered backends."""
+    return list(_registry)
+
+
+def backend_label(name):
+    """Returns the display name of a registered backend."""
+    return _registry[name].label or name
+
+
+def create_backend(name, **options):
+    """Returns a new instance of the named backend. Raises ValueError for unknown names."""
+    if name not in _registry:
+        raise ValueError(f"Unknown extractor backend '{name}'; choose one of {', '.join(_registry)}")
+    return _registry[name](**options)
+
+
+def get_backend(name=DEFAULT_BACKEND):
+    """Returns the shared instance of the named backend, creating it with default options."""
+    with _lock:
+        if name not in _instances:
+            _instances[name] = create_backend(name)
+        return _instances[name]
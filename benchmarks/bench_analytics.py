@@ -0,0 +1,68 @@
+"""
+Times loading a ledger, normalizing it into typed columns and building the
+per-vendor, per-category and per-month spending summaries, against the
+per-row route (normalize_receipt on every row, totals in a dictionary).
+
+A few rows get a non-ISO date or an "Unknown" amount, as real ledgers do.
+
+Usage: python benchmarks/bench_analytics.py [row_count ...]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ledger import Ledger
+from analytics import SOURCE_COLUMNS, SUMMARIES, normalize_results, spending_summary
+from receipt_schema import normalize_receipt
+from bench_export import synthetic_rows
+
+
+def ledger_rows(count):
+    for i, row in enumerate(synthetic_rows(count)):
+        if i % 50 == 0:
+            row["Date"] = f"{i % 28 + 1:02d}/{i % 12 + 1:02d}/2024"
+        if i % 97 == 0:
+            row["Price Amount"] = "Unknown"
+        yield row
+
+
+def per_row_totals(df):
+    """The per-row route: normalize each row in Python and total it in a dictionary."""
+    totals = {}
+    for row in df.to_dict("records"):
+        data, _ = normalize_receipt(row)
+        if data["Price Amount"] == "Unknown":
+            continue
+        for key in (data["Vendor Name"], data["Item Category"], data["Date"][:7]):
+            totals[key] = totals.get(key, 0.0) + float(data["Price Amount"])
+    return totals
+
+
+def run(count):
+    with tempfile.TemporaryDirectory() as folder:
+        ledger = Ledger(os.path.join(folder, "ledger.sqlite3"))
+        ledger.append(ledger_rows(count))
+
+        start = time.perf_counter()
+        df = ledger.to_dataframe(columns=SOURCE_COLUMNS)
+        loaded = time.perf_counter()
+        typed = normalize_results(df)
+        normalized = time.perf_counter()
+        summaries = {by: spending_summary(typed, by) for by in SUMMARIES}
+        summarized = time.perf_counter()
+        per_row_totals(df)
+        per_row = time.perf_counter() - summarized
+
+        print(f"{count:>8} rows: load {loaded - start:.3f}s, normalize {normalized - loaded:.3f}s, "
+              f"summaries {summarized - normalized:.3f}s (total {summarized - start:.3f}s); "
+              f"per-row normalize and totals {per_row:.3f}s; "
+              f"{len(summaries['vendor'])} vendors, {len(summaries['month'])} months")
+        ledger._conn.close()
+
+
+if __name__ == "__main__":
+    for count in [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]:
+        run(count)
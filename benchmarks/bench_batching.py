@@ -0,0 +1,84 @@
+"""
+Compares single-image extraction against batched extraction on a folder of
+receipt images using the live Gemini API.
+
+Usage: python benchmarks/bench_batching.py <image_folder> [batch_size ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from utils import configure_gemini, incomplete_fields, extract_receipt_info, extract_receipts_batch
+from engine import process_files
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def run(image_paths, batch_size, max_workers=4):
+    """Extracts every image and returns timing and request statistics."""
+    stats = {}
+
+    def extract_fn(file_path):
+        stats[file_path] = {}
+        return extract_receipt_info(file_path, stats=stats[file_path])
+
+    def extract_batch_fn(file_paths):
+        batch_stats = [{} for _ in file_paths]
+        results = extract_receipts_batch(file_paths, stats=batch_stats)
+        stats.update(zip(file_paths, batch_stats))
+        return results
+
+    start = time.perf_counter()
+    results = process_files(image_paths, extract_fn, max_workers,
+                            batch_size=batch_size, extract_batch_fn=extract_batch_fn)
+    elapsed = time.perf_counter() - start
+
+    fallbacks = sum(1 for s in stats.values() if s.get("batch_fallback"))
+    full_res_retries = sum(1 for s in stats.values() if s.get("retried_full_resolution"))
+    if batch_size == 1:
+        requests = len(image_paths)
+    else:
+        requests = -(-len(image_paths) // batch_size) + fallbacks
+    requests += full_res_retries
+
+    return {
+        "batch_size": batch_size,
+        "seconds": elapsed,
+        "files_per_sec": len(image_paths) / elapsed if elapsed else 0,
+        "requests": requests,
+        "fallbacks": fallbacks,
+        "errors": sum(1 for r in results if "Error Details" in r),
+        "incomplete_fields": sum(len(incomplete_fields(r)) for r in results),
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    load_dotenv()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        print("Error: No API key found in .env")
+        sys.exit(1)
+    configure_gemini(api_key)
+
+    folder = sys.argv[1]
+    batch_sizes = [int(size) for size in sys.argv[2:]] or [1, 3, 5, 10]
+    if 1 not in batch_sizes:
+        batch_sizes.insert(0, 1)
+
+    image_paths = sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    print(f"Benchmarking {len(image_paths)} images from {folder}")
+    print(f"{'batch':>5} {'seconds':>8} {'files/s':>8} {'requests':>8} {'fallbacks':>9} {'errors':>6} {'unknown':>7}")
+    for batch_size in batch_sizes:
+        r = run(image_paths, batch_size)
+        print(f"{r['batch_size']:>5} {r['seconds']:>8.1f} {r['files_per_sec']:>8.2f} {r['requests']:>8} "
+              f"{r['fallbacks']:>9} {r['errors']:>6} {r['incomplete_fields']:>7}")
@@ -0,0 +1,76 @@
+"""
+Compares the DataFrame-based export (to_csv / to_excel, then reading the file
+back for the download button) with the streaming export writers, reporting
+peak Python memory and wall time at several ledger sizes.
+
+Usage: python benchmarks/bench_export.py [row_count ...]
+"""
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ledger import Ledger
+
+VENDORS = ["Starbucks", "Tesco", "Shell", "Office Depot", "Grab", "TNB", "Aeon", "Watsons"]
+CATEGORIES = ["Food", "Transport", "Office Supplies", "Utilities", "Inventory"]
+
+
+def synthetic_rows(count):
+    """Yields realistic-looking result rows."""
+    for i in range(count):
+        yield {
+            "Date": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "Item Category": CATEGORIES[i % len(CATEGORIES)],
+            "Vendor Name": VENDORS[i % len(VENDORS)],
+            "Item Name": f"Item {i % 500}",
+            "Receipt_Invoice_No": f"INV-{i:08d}",
+            "Price Amount": f"RM {(i * 7919) % 100000 / 100:.2f}",
+            "File Name": f"receipt_{i:08d}.jpg",
+        }
+
+
+def dataframe_export(ledger, file_format, path):
+    """The original path: materialize a DataFrame, write it, read the file back."""
+    df = ledger.to_dataframe()
+    if file_format == "csv":
+        df.to_csv(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def streaming_export(ledger, file_format, path):
+    """The streaming path used by the app's download buttons."""
+    return ledger.export_bytes(file_format)
+
+
+def measure(fn, *args):
+    """Returns (seconds, peak traced bytes, output size) for one call."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    output = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, len(output)
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or [1000, 10000, 100000]
+    work_dir = tempfile.mkdtemp()
+
+    print(f"{'rows':>7} {'format':>6} {'method':>10} {'seconds':>8} {'peak MB':>8} {'file MB':>8}")
+    for size in sizes:
+        ledger = Ledger(os.path.join(work_dir, f"ledger_{size}.sqlite3"))
+        ledger.append(synthetic_rows(size), batch_id="bench")
+        for file_format in ("csv", "xlsx"):
+            path = os.path.join(work_dir, f"export_{size}.{file_format}")
+            for name, fn in (("dataframe", dataframe_export), ("streaming", streaming_export)):
+                seconds, peak, length = measure(fn, ledger, file_format, path)
+                print(f"{size:>7} {file_format:>6} {name:>10} {seconds:>8.2f} "
+                      f"{peak / 1e6:>8.1f} {length / 1e6:>8.2f}")
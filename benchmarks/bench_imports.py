@@ -0,0 +1,179 @@
+"""
+Cold-start benchmark: how long the app and the CLI take to import their
+modules, measured with python -X importtime in fresh interpreters.
+
+The imports of each entry point are read from its top-level import
+statements, so the benchmark follows app.py and cli.py as they change.
+Reports the median wall time (minus bare interpreter startup) over --runs
+runs and the third-party packages that cost the most, as pulled in by the
+project's own modules. --profile DIR keeps the raw importtime output of
+one run per entry point. Save a run with --json and pass it back with
+--baseline to fail (exit code 1) when startup regresses.
+
+Usage:
+    python benchmarks/bench_imports.py
+    python benchmarks/bench_imports.py --entries app --runs 10 --top 15 --profile importtime/
+    python benchmarks/bench_imports.py --json before.json
+    python benchmarks/bench_imports.py --baseline before.json
+"""
+import os
+import re
+import sys
+import ast
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {"app": "app.py", "cli": "cli.py"}
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def project_modules():
+    """Names of the project's own top-level modules."""
+    return {os.path.splitext(name)[0] for name in os.listdir(ROOT) if name.endswith(".py")}
+
+
+def startup_imports(script):
+    """Returns the source of the module-level import statements of a script."""
+    with open(os.path.join(ROOT, script), "r", encoding="utf-8") as f:
+        source = f.read()
+    return "\n".join(ast.get_source_segment(source, node) for node in ast.parse(source).body
+                     if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def run_python(args):
+    """Runs python with args in a fresh process. Returns (wall seconds, stderr)."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True,
+                               env=dict(os.environ, PYTHONWARNINGS="ignore"))
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "import failed")
+    return elapsed, completed.stderr
+
+
+def parse_importtime(output):
+    """
+    Parses -X importtime output into a forest of nodes
+    {"name", "self_us", "cumulative_us", "children"}. A module's children
+    are printed before it, one indentation level deeper.
+    """
+    pending = {} # level -> nodes still waiting for their parent
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        level = len(indent) // 2
+        node = {"name": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us),
+                "children": pending.pop(level + 1, [])}
+        pending.setdefault(level, []).append(node)
+    return pending.get(0, [])
+
+
+def heaviest_packages(roots, own_modules):
+    """
+    Sums, per top-level package, the cumulative import time of third-party
+    modules where they are first reached from the project's modules (or
+    imported directly). Returns {package: seconds}.
+    """
+    totals = {}
+
+    def visit(node):
+        package = node["name"].split(".")[0]
+        if package in own_modules:
+            for child in node["children"]:
+                visit(child)
+        else:
+            totals[package] = totals.get(package, 0.0) + node["cumulative_us"] / 1e6
+
+    for root in roots:
+        visit(root)
+    return totals
+
+
+def measure(entry, runs, profile_dir=None):
+    """Imports an entry point's modules runs times. Returns its statistics."""
+    code = startup_imports(ENTRY_POINTS[entry])
+    own_modules = project_modules()
+    baseline = statistics.median(run_python(["-c", "pass"])[0] for _ in range(runs))
+    # Modules the bare interpreter imports anyway (site, encodings, ...)
+    bare_output = run_python(["-X", "importtime", "-c", "pass"])[1]
+    interpreter_modules = {root["name"] for root in parse_importtime(bare_output)}
+
+    walls, import_totals, packages = [], [], []
+    for run in range(runs):
+        wall, output = run_python(["-X", "importtime", "-c", code])
+        roots = [root for root in parse_importtime(output) if root["name"] not in interpreter_modules]
+        walls.append(wall)
+        import_totals.append(sum(root["cumulative_us"] for root in roots) / 1e6)
+        packages.append(heaviest_packages(roots, own_modules))
+        if profile_dir and run == 0:
+            os.makedirs(profile_dir, exist_ok=True)
+            with open(os.path.join(profile_dir, f"{entry}.importtime.txt"), "w", encoding="utf-8") as f:
+                f.write(output)
+
+    names = {name for run_packages in packages for name in run_packages}
+    return {
+        "entry": entry,
+        "runs": runs,
+        "wall_seconds": statistics.median(walls),
+        "interpreter_seconds": baseline,
+        "startup_seconds": max(0.0, statistics.median(walls) - baseline),
+        "import_seconds": statistics.median(import_totals),
+        "packages": {name: statistics.median(run_packages.get(name, 0.0) for run_packages in packages)
+                     for name in names},
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns messages for entry points that start slower than the baseline by more than tolerance."""
+    previous = {r["entry"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get(r["entry"])
+        if before is not None and r["import_seconds"] > before["import_seconds"] * (1 + tolerance):
+            regressions.append(f"{r['entry']}: imports take {r['import_seconds']:.2f}s "
+                               f"(baseline {before['import_seconds']:.2f}s)")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time (cold start) benchmark of the app and the CLI.")
+    parser.add_argument("--entries", nargs="+", choices=sorted(ENTRY_POINTS), default=sorted(ENTRY_POINTS))
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per entry point")
+    parser.add_argument("--top", type=int, default=10, help="Heaviest packages to list")
+    parser.add_argument("--profile", metavar="DIR", help="Keep the raw -X importtime output of one run per entry point")
+    parser.add_argument("--json", metavar="PATH", help="Save the results for a later --baseline comparison")
+    parser.add_argument("--baseline", metavar="PATH", help="Earlier --json results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a regression is reported")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = []
+    for entry in args.entries:
+        r = measure(entry, max(1, args.runs), args.profile)
+        results.append(r)
+        print(f"{entry}: imports {r['import_seconds']:.2f}s, startup {r['startup_seconds']:.2f}s over a "
+              f"{r['interpreter_seconds']:.2f}s bare interpreter (median of {r['runs']} runs)")
+        heaviest = sorted(r["packages"].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        for name, seconds in heaviest:
+            print(f"  {seconds:>7.3f}s  {name}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        sys.exit(1 if regressions else 0)
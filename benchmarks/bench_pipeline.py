@@ -0,0 +1,257 @@
+"""
+Offline benchmark of the whole extraction, rename/ZIP and export pipeline,
+driven by the local stand-in backend instead of the live API. Other
+backends can be benchmarked side by side with --backends.
+
+Synthetic receipt images of realistic sizes are generated once, then each
+worker/batch-size combination runs in a fresh process so its peak RSS can
+be measured. Reports files/sec, per-file and API latency percentiles, peak
+RSS and bytes uploaded. Save a run with --json and pass it back with
+--baseline to fail (exit code 1) when throughput or p95 latency regress.
+
+Usage:
+    python benchmarks/bench_pipeline.py --files 200 --workers 4 8 --batch-sizes 1 5
+    python benchmarks/bench_pipeline.py --error-rate 0.02 --rate-limit-rate 0.05 --json before.json
+    python benchmarks/bench_pipeline.py --baseline before.json
+    python benchmarks/bench_pipeline.py --files 20 --backends local gemini
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from dotenv import load_dotenv
+
+from utils import RECEIPT_FIELDS, CURRENCY_FIELD, extract_receipt_info, extract_receipts_batch, generate_filename, source_name
+from engine import iter_extractions
+from ratelimit import RequestGovernor
+from preprocess import DEFAULT_MAX_EDGE
+from archive import SpooledZip
+from export import write_csv
+from instrumentation import RunMetrics
+from backends import create_backend, backend_names
+
+# Pixel sizes of typical inputs: phone photo, 200 dpi A4 scan, messaging-app image
+IMAGE_SIZES = {
+    "phone": (3024, 4032),
+    "scan": (1654, 2339),
+    "small": (900, 1600),
+}
+
+DEFAULT_FORMAT = "{Date} - {Item Category} - {Vendor Name} - {Item Name} - {Receipt_Invoice_No} - RM{Price Amount}"
+
+
+def synthetic_receipt(size, seed):
+    """Renders a photo-like JPEG of a receipt: paper on a background, text lines and sensor noise."""
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.new("RGB", size, (rng.randint(60, 120),) * 3)
+    draw = ImageDraw.Draw(image)
+
+    margin_x, margin_y = width // 6, height // 12
+    draw.rectangle([margin_x, margin_y, width - margin_x, height - margin_y], fill=(245, 242, 235))
+    line_height = max(12, height // 60)
+    for y in range(margin_y + line_height, height - margin_y - line_height, line_height * 2):
+        length = rng.randint((width - 2 * margin_x) // 4, width - 3 * margin_x)
+        draw.rectangle([margin_x + line_height, y, margin_x + line_height + length, y + line_height // 2],
+                       fill=(40, 40, 40))
+
+    # Noise keeps the JPEG close to real camera file sizes
+    noise = Image.effect_noise(size, 24).convert("RGB")
+    image = Image.blend(image, noise, 0.12)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=88)
+    return buffer.getvalue()
+
+
+def prepare_inputs(folder, count, image_size, templates=8):
+    """Writes count synthetic receipts to folder, cycling through a few rendered templates."""
+    sizes = list(IMAGE_SIZES.values()) if image_size == "mixed" else [IMAGE_SIZES[image_size]]
+    rendered = [synthetic_receipt(sizes[i % len(sizes)], seed=i) for i in range(min(templates, count))]
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"receipt_{i:06d}.jpg")
+        with open(path, "wb") as f:
+            f.write(rendered[i % len(rendered)])
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_scenario(paths, backend_name, workers, batch_size, model_options, optimize=True, work_dir=None):
+    """Runs the pipeline once, the way the app loop does, and returns its measurements."""
+    if backend_name == "local":
+        backend = create_backend(backend_name, **model_options)
+    else:
+        load_dotenv()
+        backend = create_backend(backend_name)
+    backend.configure(os.getenv("GEMINI_API_KEY"))
+    governor = RequestGovernor(rpm=100000, tpm=10 ** 9, max_concurrency=workers, initial_concurrency=workers,
+                               base_delay=0.05, max_delay=1.0)
+    metrics = RunMetrics()
+    upload_stats = {}
+    options = {"preprocess": optimize, "max_edge": DEFAULT_MAX_EDGE, "governor": governor,
+               "metrics": metrics, "backend": backend}
+
+    def extract_fn(file_path):
+        stats = {}
+        with metrics.stage("file"):
+            data = extract_receipt_info(file_path, stats=stats, **options)
+        upload_stats[file_path] = stats
+        return data
+
+    def extract_batch_fn(file_paths):
+        stats = [{} for _ in file_paths]
+        start = time.perf_counter()
+        results = extract_receipts_batch(file_paths, stats=stats, **options)
+        elapsed = time.perf_counter() - start
+        for file_path, file_stats in zip(file_paths, stats):
+            metrics.record("file", elapsed)
+            upload_stats[file_path] = file_stats
+        return results
+
+    work_dir = work_dir or tempfile.mkdtemp()
+    scenario = f"{backend_name}-w{workers}-b{batch_size}"
+    zip_file = SpooledZip(os.path.join(work_dir, f"bench_{scenario}.zip"))
+    rows = []
+    errors = 0
+
+    start = time.perf_counter()
+    for _, file_path, data in iter_extractions(paths, extract_fn, workers, batch_size, extract_batch_fn):
+        if "Error Details" in data:
+            errors += 1
+            continue
+        name = source_name(file_path)
+        with metrics.stage("rename", name):
+            new_name = generate_filename(data, os.path.splitext(name)[1], DEFAULT_FORMAT)
+        with metrics.stage("zip", name):
+            data["File Name"] = zip_file.add(file_path, new_name)
+        rows.append(data)
+    zip_file.close()
+    with metrics.stage("export"), open(os.path.join(work_dir, "bench.csv"), "wb") as f:
+        write_csv(rows, RECEIPT_FIELDS + [CURRENCY_FIELD, "File Name"], f)
+    elapsed = time.perf_counter() - start
+
+    summary = metrics.summary()["stages"]
+    api_metrics = governor.metrics()
+    return {
+        "scenario": scenario,
+        "backend": backend_name,
+        "workers": workers,
+        "batch_size": batch_size,
+        "files": len(paths),
+        "seconds": elapsed,
+        "files_per_sec": len(paths) / elapsed if elapsed else 0.0,
+        "file_p50": summary["file"]["p50"],
+        "file_p95": summary["file"]["p95"],
+        "file_p99": summary["file"]["p99"],
+        "api_p50": summary["api"]["p50"],
+        "api_p95": summary["api"]["p95"],
+        "api_p99": summary["api"]["p99"],
+        "peak_rss_mb": peak_rss_mb(),
+        "original_bytes": sum(s.get("original_bytes", 0) for s in upload_stats.values()),
+        "bytes_uploaded": sum(s.get("processed_bytes", 0) for s in upload_stats.values()),
+        "requests": api_metrics["requests"],
+        "retries": api_metrics["retries"],
+        "errors": errors,
+        "stages": summary,
+    }
+
+
+def run_isolated(*args, **kwargs):
+    """Runs one scenario in a fresh process so peak RSS is not shared between scenarios."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_scenario, *args, **kwargs).result()
+
+
+def compare(results, baseline, tolerance):
+    """Returns messages for scenarios slower than the baseline by more than tolerance."""
+    previous = {r["scenario"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get(r["scenario"])
+        if before is None:
+            continue
+        if r["files_per_sec"] < before["files_per_sec"] * (1 - tolerance):
+            regressions.append(f"{r['scenario']}: {r['files_per_sec']:.2f} files/s "
+                               f"(baseline {before['files_per_sec']:.2f})")
+        if r["file_p95"] > before["file_p95"] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}: p95 {r['file_p95']:.2f}s (baseline {before['file_p95']:.2f}s)")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark using a fake Gemini model.")
+    parser.add_argument("--files", type=int, default=100, help="Number of synthetic receipts")
+    parser.add_argument("--image-size", choices=sorted(IMAGE_SIZES) + ["mixed"], default="mixed")
+    parser.add_argument("--backends", nargs="+", choices=backend_names(), default=["local"],
+                        help="Backends to compare; anything but 'local' calls a real service")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1])
+    parser.add_argument("--latency", type=float, default=0.8, help="Median request latency in seconds")
+    parser.add_argument("--sigma", type=float, default=0.35, help="Spread of the log-normal latency")
+    parser.add_argument("--per-image", type=float, default=0.15, help="Extra latency per image in a request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with a 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests failing with a 429")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-optimize", action="store_true", help="Upload images at full resolution")
+    parser.add_argument("--json", metavar="PATH", help="Save the results for a later --baseline comparison")
+    parser.add_argument("--baseline", metavar="PATH", help="Earlier --json results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed slowdown before a regression is reported")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    work_dir = tempfile.mkdtemp()
+    input_dir = os.path.join(work_dir, "inputs")
+    os.makedirs(input_dir)
+
+    print(f"Rendering {args.files} synthetic receipts ({args.image_size})...")
+    paths = prepare_inputs(input_dir, args.files, args.image_size)
+    model_options = {"latency": args.latency, "sigma": args.sigma, "per_image": args.per_image,
+                     "error_rate": args.error_rate, "rate_limit_rate": args.rate_limit_rate, "seed": args.seed}
+
+    results = []
+    print(f"{'scenario':>16} {'files/s':>8} {'p50 s':>6} {'p95 s':>6} {'p99 s':>6} {'api p95':>7} "
+          f"{'RSS MB':>7} {'sent MB':>8} {'orig MB':>8} {'reqs':>5} {'retries':>7} {'errors':>6}")
+    scenarios = [(backend_name, workers, batch_size) for backend_name in args.backends
+                 for workers in args.workers for batch_size in args.batch_sizes]
+    for backend_name, workers, batch_size in scenarios:
+        r = run_isolated(paths, backend_name, workers, batch_size, model_options, not args.no_optimize, work_dir)
+        results.append(r)
+        rss = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "n/a"
+        print(f"{r['scenario']:>16} {r['files_per_sec']:>8.2f} {r['file_p50']:>6.2f} {r['file_p95']:>6.2f} "
+              f"{r['file_p99']:>6.2f} {r['api_p95']:>7.2f} {rss:>7} {r['bytes_uploaded'] / 1e6:>8.1f} "
+              f"{r['original_bytes'] / 1e6:>8.1f} {r['requests']:>5} {r['retries']:>7} {r['errors']:>6}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        sys.exit(1 if regressions else 0)
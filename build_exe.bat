@@ -1,9 +1,21 @@
 @echo off
+setlocal EnableDelayedExpansion
+
+rem Usage: build_exe.bat [onefile]
+rem The default one-folder build starts fastest: a --onefile executable has to
+rem unpack Python, Streamlit and pandas to a temporary folder on every launch.
+set MODE=--onedir
+if /I "%~1"=="onefile" set MODE=--onefile
+
 echo Installing requirements...
 pip install -r requirements.txt
 
-echo Building executable...
-pyinstaller --noconfirm --onefile --windowed ^
+rem Streamlit loads app.py from the bundle at run time, so ship every module next to it
+set ADD_DATA=
+for %%f in (*.py) do set ADD_DATA=!ADD_DATA! --add-data "%%f;."
+
+echo Building executable (%MODE%)...
+pyinstaller --noconfirm %MODE% --windowed ^
     --name "ReceiptsCompiler" ^
     --hidden-import=streamlit ^
     --hidden-import=pandas ^
@@ -11,12 +23,16 @@ pyinstaller --noconfirm --onefile --windowed ^
     --hidden-import=PIL ^
     --hidden-import=dotenv ^
     --hidden-import=openpyxl ^
+    --hidden-import=sqlite3 ^
     --collect-all streamlit ^
-    --add-data "app.py;." ^
-    --add-data "utils.py;." ^
-    --add-data "file_dialog.py;." ^
+    --collect-all pypdfium2 ^
+    !ADD_DATA! ^
     --add-data ".env.example;." ^
     run_executable.py
 
-echo Build complete! Executable is in the 'dist' folder.
+if /I "%MODE%"=="--onedir" (
+    echo Build complete! Run dist\ReceiptsCompiler\ReceiptsCompiler.exe; ship the whole dist\ReceiptsCompiler folder.
+) else (
+    echo Build complete! Executable is in the 'dist' folder.
+)
 pause
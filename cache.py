@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+from utils import DATA_DIR
+
+DEFAULT_CACHE_PATH = os.path.join(DATA_DIR, "extraction_cache.sqlite3")
+
+
+class ExtractionCache:
+    """
+    Persistent SQLite cache of extraction results, keyed by the SHA-256 of the
+    image bytes plus the model and prompt used to extract them.
+
+    Entries older than max_age_days are dropped, and the least recently used
+    entries are evicted once the stored results exceed max_bytes.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=50 * 1024 * 1024, max_age_days=180):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+
+        # One connection shared by the extraction worker threads, guarded by _lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS extractions (
+                    key TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_extractions_accessed ON extractions (accessed_at)")
+        self.evict()
+
+    @staticmethod
+    def make_key(image_bytes, model_name, prompt):
+        """Returns the cache key for an image extracted with the given model and prompt."""
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        version_hash = hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()[:16]
+        return f"{image_hash}:{version_hash}"
+
+    def get(self, key):
+        """Returns a copy of the cached result for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, created_at FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age_days * 86400:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE extractions SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, data):
+        """Stores a successful extraction result."""
+        if "Error Details" in data:
+            return
+        payload = json.dumps(data)
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO extractions (key, data, size, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, len(payload), now, now))
+            self._writes_since_evict += 1
+            evict_now = self._writes_since_evict >= 100
+        if evict_now:
+            self.evict()
+
+    def evict(self):
+        """Removes expired entries and trims the cache down to max_bytes."""
+        cutoff = time.time() - self.max_age_days * 86400
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM extractions WHERE created_at < ?", (cutoff,))
+            self._conn.execute("""
+                DELETE FROM extractions WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS running_size
+                        FROM extractions
+                    ) WHERE running_size > ?
+                )
+            """, (self.max_bytes,))
+            self._writes_since_evict = 0
+
+    def clear(self):
+        """Deletes every cached entry and resets the counters."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM extractions")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns hit/miss counters and the current size of the cache."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
@@ -0,0 +1,164 @@
+import time
+import threading
+from collections import Counter
+
+from utils import (extract_receipt_info, extract_receipts_batch, validation_problems, flag_duplicate,
+                   read_source, source_name)
+
+
+class CascadeTally:
+    """
+    Thread-safe record of which tier handled each receipt in a cascade run,
+    with the model time and estimated cost spent on it.
+
+    The single-tier comparison assumes every receipt had gone straight to the
+    strong tier: its cost is estimated from the first-pass token counts at
+    the strong tier's prices, and its time from the mean strong-tier time
+    per receipt observed on escalations.
+    """
+
+    def __init__(self, fast_backend, strong_backend):
+        self.fast_backend = fast_backend
+        self.strong_backend = strong_backend
+        self._lock = threading.Lock()
+        self.receipts = 0
+        self.escalated = 0
+        self.strong_used = 0
+        self.fast_seconds = 0.0
+        self.strong_seconds = 0.0
+        self.fast_cost = 0.0
+        self.strong_cost = 0.0
+        self.single_tier_cost = 0.0
+        self.reasons = Counter()
+
+    def record(self, fast_seconds, fast_stats, problems=(), strong_seconds=None, strong_stats=None, strong_used=False):
+        fast_cost = self.fast_backend.cost(fast_stats.get("prompt_tokens", 0), fast_stats.get("output_tokens", 0))
+        with self._lock:
+            self.receipts += 1
+            self.fast_seconds += fast_seconds
+            self.fast_cost += fast_cost
+            self.reasons.update(problems)
+            if strong_stats is None:
+                self.single_tier_cost += self.strong_backend.cost(fast_stats.get("prompt_tokens", 0),
+                                                                  fast_stats.get("output_tokens", 0))
+                return
+            strong_cost = self.strong_backend.cost(strong_stats.get("prompt_tokens", 0),
+                                                   strong_stats.get("output_tokens", 0))
+            self.escalated += 1
+            self.strong_used += int(strong_used)
+            self.strong_seconds += strong_seconds
+            self.strong_cost += strong_cost
+            self.single_tier_cost += strong_cost
+
+    def summary(self):
+        """Returns tier counts, actual versus single-tier time and cost, and escalation reasons."""
+        with self._lock:
+            actual_seconds = self.fast_seconds + self.strong_seconds
+            actual_cost = self.fast_cost + self.strong_cost
+            single_tier_seconds = None
+            if self.escalated:
+                single_tier_seconds = self.strong_seconds / self.escalated * self.receipts
+            return {
+                "receipts": self.receipts,
+                "fast_handled": self.receipts - self.strong_used,
+                "escalated": self.escalated,
+                "strong_handled": self.strong_used,
+                "actual_seconds": actual_seconds,
+                "single_tier_seconds": single_tier_seconds,
+                "seconds_saved": single_tier_seconds - actual_seconds if single_tier_seconds is not None else None,
+                "actual_cost": actual_cost,
+                "single_tier_cost": self.single_tier_cost,
+                "cost_saved": self.single_tier_cost - actual_cost,
+                "reasons": dict(self.reasons),
+            }
+
+
+def _escalate(image_path, data, fast_stats, fast_seconds, strong_backend, tally, stats, options):
+    """Validates a first-pass result and re-extracts it with the strong tier if it fails."""
+    problems = ["Extraction failed"] if "Error Details" in data else validation_problems(data)
+    strong_stats = strong_seconds = None
+    strong_used = False
+
+    if problems:
+        strong_stats = {}
+        start = time.perf_counter()
+        strong_data = extract_receipt_info(image_path, stats=strong_stats, backend=strong_backend, **options)
+        strong_seconds = time.perf_counter() - start
+        # Keep the strong result unless it failed or validates worse than the first pass
+        if "Error Details" not in strong_data and (
+                "Error Details" in data or len(validation_problems(strong_data)) <= len(problems)):
+            data = strong_data
+            strong_used = True
+
+    if stats is not None:
+        stats.update(fast_stats)
+        if strong_stats and "processed_bytes" in strong_stats:
+            stats["processed_bytes"] = stats.get("processed_bytes", 0) + strong_stats["processed_bytes"]
+            stats["bytes_saved"] = stats.get("bytes_saved", 0) - strong_stats["processed_bytes"]
+        stats["tier"] = "strong" if strong_used else "fast"
+        stats["escalation_reasons"] = problems
+
+    if tally is not None:
+        tally.record(fast_seconds, fast_stats, problems, strong_seconds, strong_stats, strong_used)
+    return data
+
+
+def extract_with_cascade(image_path, fast_backend, strong_backend, tally=None, stats=None, **options):
+    """
+    Extracts a receipt with fast_backend and escalates it to strong_backend
+    when the result fails validation (see utils.validation_problems) or the
+    first pass errored. Other keyword options (cache, preprocess, governor,
+    ...) are passed on to extract_receipt_info for both tiers.
+
+    A PerceptualIndex given as dedup is consulted once for the cascade as a
+    whole, so only the final answer is recorded and compared with earlier ones.
+    """
+    dedup = options.pop("dedup", None)
+    fast_stats = {}
+    start = time.perf_counter()
+    data = extract_receipt_info(image_path, stats=fast_stats, backend=fast_backend, **options)
+    fast_seconds = time.perf_counter() - start
+    data = _escalate(image_path, data, fast_stats, fast_seconds, strong_backend, tally, stats, options)
+    if dedup is not None:
+        _flag_duplicate(dedup, image_path, data, strong_backend, stats, options.get("metrics"))
+    return data
+
+
+def extract_batch_with_cascade(image_paths, fast_backend, strong_backend, tally=None, stats=None, **options):
+    """
+    Batched first pass with fast_backend; receipts failing validation are
+    then escalated one by one to strong_backend. stats, if given, is a list
+    with one statistics dictionary per image.
+    """
+    dedup = options.pop("dedup", None)
+    fast_stats = [{} for _ in image_paths]
+    start = time.perf_counter()
+    fast_results = extract_receipts_batch(image_paths, stats=fast_stats, backend=fast_backend, **options)
+    share = (time.perf_counter() - start) / max(1, len(image_paths))
+    results = []
+    for i, (data, image_stats) in enumerate(zip(fast_results, fast_stats)):
+        final_stats = stats[i] if stats is not None else None
+        data = _escalate(image_paths[i], data, image_stats, share, strong_backend, tally, final_stats, options)
+        if dedup is not None:
+            _flag_duplicate(dedup, image_paths[i], data, strong_backend, final_stats, options.get("metrics"))
+        results.append(data)
+    return results
+
+
+def _flag_duplicate(dedup, image_path, data, strong_backend, stats, metrics):
+    """Records a final cascade result in a PerceptualIndex under the strong tier's model; unreadable images are skipped."""
+    try:
+        image_bytes = read_source(image_path)
+    except Exception:
+        return
+    flag_duplicate(dedup, image_bytes, data, source_name(image_path), strong_backend.model_name, stats, metrics)
+
+
+def describe_summary(summary):
+    """One-line, human readable description of a CascadeTally summary."""
+    line = (f"Cascade: {summary['fast_handled']} of {summary['receipts']} receipt(s) handled by the first pass, "
+            f"{summary['escalated']} escalated ({summary['strong_handled']} answered by the strong tier). "
+            f"Estimated cost ${summary['actual_cost']:.4f} vs ${summary['single_tier_cost']:.4f} single-tier")
+    if summary["seconds_saved"] is not None:
+        line += f", {summary['seconds_saved']:.1f}s of model time saved"
+    return line
@@ -0,0 +1,327 @@
+"""
+Headless batch mode for Receipts Compiler.
+
+Examples:
+    python cli.py receipts/ -o compiled.csv
+    python cli.py "scans/**/*.jpg" -o compiled.jsonl --copy-to organized/ --workers 8
+    python cli.py receipts/ --rename --dry-run
+"""
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+import uuid
+
+from dotenv import load_dotenv
+from utils import extract_receipt_info, extract_receipts_batch, RECEIPT_FIELDS, CURRENCY_FIELD
+from engine import iter_extractions, DEFAULT_MAX_WORKERS, DEFAULT_BATCH_SIZE
+from cache import ExtractionCache
+from dedup import PerceptualIndex
+from ratelimit import RequestGovernor
+from preprocess import DEFAULT_MAX_EDGE
+from journal import JobJournal
+from ledger import Ledger
+from renamer import BulkRenamer
+from export import XlsxStreamWriter
+from instrumentation import RunMetrics, logging_sink
+from backends import DEFAULT_BACKEND, backend_names, get_backend
+from cascade import CascadeTally, extract_with_cascade, extract_batch_with_cascade, describe_summary
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".pdf")
+
+OUTPUT_COLUMNS = RECEIPT_FIELDS + [CURRENCY_FIELD, "File Name", "Source Path", "Error Details", "Duplicate Of"]
+
+DEFAULT_FORMAT = "{Date} - {Item Category} - {Vendor Name} - {Item Name} - {Receipt_Invoice_No} - RM{Price Amount}"
+
+
+def iter_input_files(inputs, recursive=True):
+    """Lazily yields receipt image paths from files, directories and glob patterns."""
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                for root, dirs, files in os.walk(item):
+                    dirs.sort()
+                    for name in sorted(files):
+                        if name.lower().endswith(IMAGE_EXTENSIONS):
+                            yield os.path.join(root, name)
+            else:
+                for name in sorted(os.listdir(item)):
+                    path = os.path.join(item, name)
+                    if os.path.isfile(path) and name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield path
+        elif os.path.isfile(item):
+            yield item
+        else:
+            for path in glob.iglob(item, recursive=True):
+                if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                    yield path
+
+
+class RowWriter:
+    """
+    Streams result rows to a CSV or JSONL file, flushing after every row.
+    XLSX output is streamed through openpyxl's write-only mode and becomes
+    readable once the run finishes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.is_jsonl = path.lower().endswith((".jsonl", ".ndjson"))
+        self.is_xlsx = path.lower().endswith(".xlsx")
+        append = os.path.exists(path) and os.path.getsize(path) > 0
+        if self.is_xlsx:
+            if append:
+                raise ValueError(f"Cannot append to existing Excel file {path}; choose a new output file")
+            self._xlsx = XlsxStreamWriter(path, OUTPUT_COLUMNS)
+            return
+        self._file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        if not self.is_jsonl:
+            self._writer = csv.DictWriter(self._file, fieldnames=OUTPUT_COLUMNS, extrasaction="ignore")
+            if not append:
+                self._writer.writeheader()
+
+    def write(self, row):
+        if self.is_xlsx:
+            self._xlsx.append([row.get(column, "") for column in OUTPUT_COLUMNS])
+            return
+        if self.is_jsonl:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        else:
+            self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        if self.is_xlsx:
+            self._xlsx.close()
+        else:
+            self._file.close()
+
+
+def format_duration(seconds):
+    """Formats a number of seconds as H:MM:SS."""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def print_progress(completed, total, failed, start_time, final=False):
+    """Prints throughput and ETA to stderr."""
+    elapsed = time.monotonic() - start_time
+    rate = completed / elapsed if elapsed > 0 else 0
+    eta = (total - completed) / rate if rate > 0 else 0
+    line = (f"[{completed}/{total}] {rate:.2f} files/s, {failed} failed, "
+            f"elapsed {format_duration(elapsed)}, ETA {format_duration(eta)}")
+    if sys.stderr.isatty() and not final:
+        sys.stderr.write("\r" + line)
+    else:
+        sys.stderr.write(line + "\n")
+    sys.stderr.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract, compile and rename receipts without the web UI.")
+    parser.add_argument("inputs", nargs="+", help="Image files, folders or glob patterns to process")
+    parser.add_argument("-o", "--output", help="Results file (.csv, .jsonl or .xlsx); CSV/JSONL are appended to if they exist")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="Parallel requests")
+    parser.add_argument("--backend", choices=backend_names(), default=DEFAULT_BACKEND,
+                        help="Extractor backend; 'local' makes no API calls and returns made-up data")
+    parser.add_argument("--cascade", metavar="FIRST_PASS_BACKEND", choices=backend_names(),
+                        help="Extract with this cheaper backend first and escalate receipts failing validation to --backend (e.g. --cascade gemini-lite)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Receipts per Gemini request")
+    parser.add_argument("--no-recursive", action="store_true", help="Do not descend into subfolders")
+    handling = parser.add_mutually_exclusive_group()
+    handling.add_argument("--rename", action="store_true", help="Rename source files in place")
+    handling.add_argument("--copy-to", metavar="DIR", help="Copy renamed files into DIR, leaving sources untouched")
+    parser.add_argument("--format", default=DEFAULT_FORMAT, help="Filename format string for --rename/--copy-to")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="With --rename/--copy-to, print the new name of every file instead of renaming or copying "
+                             "it; nothing is written. Extractions are cached, so the real run that follows is quick")
+    parser.add_argument("--rename-journal", metavar="PATH",
+                        help="Record every rename/copy in PATH (.jsonl) so the batch can be undone later with "
+                             "python renamer.py PATH; a batch in which any file fails is rolled back either way")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the extraction cache")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Do not flag images repeating a receipt processed before (same image, date and amount)")
+    parser.add_argument("--duplicates", choices=["flag", "drop", "allow"], default="flag",
+                        help="What to do with receipts repeating the vendor, invoice number and amount of one "
+                             "already in the ledger: flag them in the Duplicate Of column (default), leave them "
+                             "out of the output, or allow them. Checked rows are recorded in the ledger")
+    parser.add_argument("--no-optimize", action="store_true", help="Upload images at full resolution")
+    parser.add_argument("--max-edge", type=int, default=DEFAULT_MAX_EDGE, help="Longest image edge sent to Gemini")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="Job journal (.jsonl); files already completed in it are skipped, so rerunning the same command resumes the job")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Write per-stage timings and token usage (p50/p95/p99) to a JSON file at the end of the run")
+    args = parser.parse_args(argv)
+    if args.dry_run and not (args.rename or args.copy_to):
+        parser.error("--dry-run needs --rename or --copy-to")
+    if not args.output and not args.dry_run:
+        parser.error("the following arguments are required: -o/--output")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    load_dotenv()
+    backend = get_backend(args.backend)
+    first_pass_backend = get_backend(args.cascade) if args.cascade else None
+    api_key = os.getenv("GEMINI_API_KEY")
+    needs_api_key = backend.requires_api_key or (first_pass_backend is not None and first_pass_backend.requires_api_key)
+    if needs_api_key and not api_key:
+        print("Error: GEMINI_API_KEY is not set (add it to .env or the environment)", file=sys.stderr)
+        return 2
+    backend.configure(api_key)
+    if first_pass_backend is not None:
+        first_pass_backend.configure(api_key)
+
+    recursive = not args.no_recursive
+    journal = JobJournal(args.journal) if args.journal else None
+
+    def pending_files():
+        for file_path in iter_input_files(args.inputs, recursive):
+            if journal is None or not journal.is_done(os.path.abspath(file_path)):
+                yield file_path
+
+    # Counting pass keeps memory flat: paths are streamed again for processing
+    total = sum(1 for _ in pending_files())
+    already_done = len(journal.completed()) if journal is not None else 0
+    if total == 0:
+        print("No receipt images left to process.", file=sys.stderr)
+        if journal is not None:
+            journal.close()
+        return 0 if already_done else 1
+    if already_done:
+        print(f"Resuming job: {already_done} file(s) already done.", file=sys.stderr)
+    print(f"Found {total} images.", file=sys.stderr)
+
+    cache = None if args.no_cache else ExtractionCache()
+    dedup = None if args.no_dedup else PerceptualIndex()
+    ledger = None if args.duplicates == "allow" or args.dry_run else Ledger()
+    ledger_batch = uuid.uuid4().hex
+    governor = RequestGovernor(max_concurrency=max(args.workers, 1))
+    run_metrics = RunMetrics(sinks=[logging_sink()])
+    options = {"cache": cache, "preprocess": not args.no_optimize,
+               "max_edge": args.max_edge, "governor": governor, "metrics": run_metrics,
+               "dedup": dedup}
+    renamer = None
+    if args.rename or args.copy_to:
+        renamer = BulkRenamer(args.format, destination=args.copy_to, max_workers=args.workers,
+                              journal_path=args.rename_journal, metrics=run_metrics)
+    cascade_tally = CascadeTally(first_pass_backend, backend) if first_pass_backend is not None else None
+
+    def extract_fn(file_path):
+        if cascade_tally:
+            return extract_with_cascade(file_path, first_pass_backend, backend, tally=cascade_tally, **options)
+        return extract_receipt_info(file_path, backend=backend, **options)
+
+    def extract_batch_fn(file_paths):
+        if cascade_tally:
+            return extract_batch_with_cascade(file_paths, first_pass_backend, backend, tally=cascade_tally, **options)
+        return extract_receipts_batch(file_paths, backend=backend, **options)
+
+    try:
+        writer = None if args.dry_run else RowWriter(args.output)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    completed = failed = dropped = 0
+    start_time = time.monotonic()
+    last_report = 0.0
+    try:
+        extractions = iter_extractions(pending_files(), extract_fn,
+                                       args.workers, args.batch_size, extract_batch_fn)
+        for _, file_path, data in extractions:
+            new_path = file_path
+            if "Error Details" in data:
+                failed += 1
+            elif args.dry_run:
+                renamer.plan(file_path, data)
+            elif renamer is not None:
+                # Names are resolved in memory; the rename or copy itself runs in the background
+                new_path = renamer.add(file_path, data)
+                data["File Name"] = os.path.basename(new_path)
+
+            data["Source Path"] = file_path
+            duplicate_of = None
+            if ledger is not None and "Error Details" not in data:
+                with run_metrics.stage("ledger", file_path):
+                    duplicate_of = ledger.find_duplicates([data]).get(0)
+                    if duplicate_of is None or args.duplicates == "flag":
+                        if duplicate_of is not None:
+                            data["Duplicate Of"] = duplicate_of or "earlier receipt"
+                        ledger.append([data], batch_id=ledger_batch)
+            if duplicate_of is not None and args.duplicates == "drop":
+                dropped += 1
+            elif writer is not None:
+                with run_metrics.stage("export", file_path):
+                    writer.write(data)
+            completed += 1
+
+            if journal is not None and not args.dry_run:
+                status = "failed" if "Error Details" in data else "done"
+                journal.record(os.path.abspath(file_path), status, data, data["File Name"])
+                if args.rename and new_path != file_path:
+                    # The renamed file must not be picked up as new work on resume
+                    journal.record(os.path.abspath(new_path), status, data, data["File Name"])
+
+            now = time.monotonic()
+            if now - last_report >= 1.0:
+                print_progress(completed, total, failed, start_time)
+                last_report = now
+    except KeyboardInterrupt:
+        print("\nInterrupted; results written so far are kept.", file=sys.stderr)
+    finally:
+        if writer is not None:
+            writer.close()
+        rename_failures = renamer.finish() if renamer is not None else []
+        if rename_failures and ledger is not None:
+            # The rows name files that were rolled back; kept, they would flag the rerun as duplicates of itself
+            ledger.remove_batch(ledger_batch)
+        if rename_failures and journal is not None:
+            # The batch was rolled back, so its files are not done on resume
+            for source, _ in renamer.planned:
+                journal.record(os.path.abspath(source), "failed")
+        if journal is not None:
+            journal.close()
+
+    print_progress(completed, total, failed, start_time, final=True)
+    api_metrics = governor.metrics()
+    if args.dry_run:
+        changes = [(source, target) for source, target in renamer.planned if target != source]
+        for source, target in changes:
+            print(f"{source} -> {target}")
+        print(f"Dry run: {len(changes)} file(s) would be {'renamed' if args.rename else 'copied'}, "
+              f"nothing was changed ({api_metrics['requests']} API requests)", file=sys.stderr)
+    else:
+        print(f"Wrote {completed - dropped} rows to {args.output} "
+              f"({api_metrics['requests']} API requests, {api_metrics['retries']} retries)", file=sys.stderr)
+    stages = run_metrics.summary()["stages"]
+    if "api" in stages:
+        print(f"API latency: p50 {stages['api']['p50']:.2f}s, p95 {stages['api']['p95']:.2f}s, "
+              f"p99 {stages['api']['p99']:.2f}s", file=sys.stderr)
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(run_metrics.to_json())
+    if cascade_tally:
+        print(describe_summary(cascade_tally.summary()), file=sys.stderr)
+    if cache is not None:
+        print(f"Cache: {cache.hits} hits / {cache.misses} misses", file=sys.stderr)
+    if dropped:
+        print(f"Left out {dropped} receipt(s) repeating an invoice already in the ledger", file=sys.stderr)
+    if dedup is not None and dedup.duplicates:
+        print(f"Duplicates: {dedup.duplicates} image(s) repeat a receipt processed before "
+              f"(see the Duplicate Of column); unless answered by the cache as exact copies, "
+              f"they were still extracted and billed", file=sys.stderr)
+    if rename_failures:
+        print(f"Error: {len(rename_failures)} file(s) could not be {'renamed' if args.rename else 'copied'}, "
+              f"so the whole batch was rolled back; the File Name column of {args.output} lists names "
+              f"that were not applied and the batch was left out of the ledger", file=sys.stderr)
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
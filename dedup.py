@@ -0,0 +1,194 @@
+import io
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from PIL import Image, ImageOps
+
+from utils import DATA_DIR
+from pdfpages import is_pdf
+from receipt_schema import CURRENCY_FIELD
+
+DEFAULT_INDEX_PATH = os.path.join(DATA_DIR, "image_hashes.sqlite3")
+
+# The 64-bit lookup hash is split into BANDS bands of BAND_BITS bits. Two hashes
+# within Hamming distance BANDS - 1 agree exactly on at least one band, so a
+# lookup only has to compare the rows sharing a band instead of the whole table.
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# Near-duplicate thresholds: bits that may differ in the 64-bit lookup hash, and
+# in the 1024-bit hash used to confirm a candidate. Re-saved, resized or
+# recompressed copies stay within a few bits. So do other receipts printed
+# from the same template: an average hash does not see a different total or
+# invoice number, which is why a match also needs the same extracted fields.
+DEFAULT_MAX_DISTANCE = 3
+DEFAULT_MAX_FINE_DISTANCE = 12
+
+# Extracted fields a near-duplicate must agree on to be flagged
+MATCH_FIELDS = ("Date", "Price Amount", CURRENCY_FIELD)
+
+# Images whose grey levels span less than this are treated as blank and never matched
+MIN_CONTRAST = 32
+
+
+def mean_hash(img, size=8):
+    """
+    Average hash of a PIL image: shrinks it to size x size grey pixels and
+    sets one bit per pixel darker than the mean. Returns a size * size bit
+    integer. Unlike a difference hash it does not collapse to zero on text
+    documents, whose ink is mostly left-aligned.
+    """
+    small = img.convert("L").resize((size, size), Image.BOX)
+    pixels = small.tobytes()
+    mean = sum(pixels) / len(pixels)
+    value = 0
+    for pixel in pixels:
+        value = (value << 1) | (pixel < mean)
+    return value
+
+
+def image_hashes(image_bytes):
+    """
+    Returns the (64-bit, 1024-bit) average hashes of an encoded image,
+    after applying its EXIF orientation, or None for a (nearly) blank image,
+    which carries too little detail to be told apart from other blank ones.
+    JPEGs are decoded at reduced size.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.format == "JPEG":
+        img.draft("L", (256, 256))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((256, 256))
+    low, high = img.convert("L").getextrema()
+    if high - low < MIN_CONTRAST:
+        return None
+    return mean_hash(img, 8), mean_hash(img, 32)
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes."""
+    return (a ^ b).bit_count()
+
+
+def _bands(value):
+    return [(value >> (band * BAND_BITS)) & BAND_MASK for band in range(BANDS)]
+
+
+def same_receipt(data, other):
+    """True if two extraction results agree on MATCH_FIELDS, with a known amount."""
+    if str(data.get("Price Amount", "")).strip() in ("", "Unknown", "Error"):
+        return False
+    return all(str(data.get(field, "")).strip() == str(other.get(field, "")).strip() for field in MATCH_FIELDS)
+
+
+class PerceptualIndex:
+    """
+    Persistent index of the perceptual hashes of processed images and the
+    extraction result of each, used to flag near-duplicates: the same
+    receipt uploaded twice, re-saved or re-scanned.
+
+    Every image is still extracted, and billed. Exact copies are already
+    answered by the extraction cache, and an image that merely looks like an earlier one
+    may be a different receipt from the same template. record() therefore
+    only reports an earlier image that looks alike and whose result has the
+    same date, amount and currency (MATCH_FIELDS).
+
+    Lookups use multi-index hashing: every band of the lookup hash has its
+    own SQLite index, so a query touches only the rows sharing a band and
+    stays fast with hundreds of thousands of images. Candidates are then
+    confirmed against a finer 1024-bit hash.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, max_distance=DEFAULT_MAX_DISTANCE,
+                 max_fine_distance=DEFAULT_MAX_FINE_DISTANCE):
+        if max_distance >= BANDS:
+            raise ValueError(f"max_distance must be below {BANDS} for lookups to find every near-duplicate")
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_distance = max_distance
+        self.max_fine_distance = max_fine_distance
+        self.duplicates = 0
+        self._lock = threading.Lock()
+
+        # One connection shared by the extraction worker threads, guarded by _lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        band_columns = ", ".join(f"b{band} INTEGER NOT NULL" for band in range(BANDS))
+        with self._lock, self._conn:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS image_hashes (
+                    id INTEGER PRIMARY KEY,
+                    hash TEXT NOT NULL,
+                    fine_hash TEXT NOT NULL,
+                    scope TEXT NOT NULL,
+                    {band_columns},
+                    file_name TEXT,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            for band in range(BANDS):
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_image_hashes_b{band} ON image_hashes (b{band})")
+
+    def _lookup(self, scope, lookup_hash, fine_hash, data):
+        """Returns (file_name, distance) of the closest stored near-duplicate of the same receipt, or None. Caller holds _lock."""
+        where = " OR ".join(f"b{band} = ?" for band in range(BANDS))
+        rows = self._conn.execute(
+            f"SELECT hash, fine_hash, file_name, data FROM image_hashes WHERE ({where}) AND scope = ?",
+            [*_bands(lookup_hash), scope]).fetchall()
+        best = None
+        for stored_hash, stored_fine, file_name, stored in rows:
+            distance = hamming(lookup_hash, int(stored_hash, 16))
+            if distance > self.max_distance or hamming(fine_hash, int(stored_fine, 16)) > self.max_fine_distance:
+                continue
+            if (best is None or distance < best[1]) and same_receipt(data, json.loads(stored)):
+                best = (file_name, distance)
+        return best
+
+    def record(self, image_bytes, data, file_name=None, scope=""):
+        """
+        Adds an extracted image to the index (unless its extraction failed)
+        and returns (file_name, distance) of an earlier image it duplicates,
+        or None. Blank images, images that cannot be hashed and PDFs are
+        never matched. scope keeps results apart that must not be compared,
+        such as those of different models (pass the backend's model_name).
+        """
+        if data is None or "Error Details" in data or is_pdf(image_bytes):
+            return None
+        try:
+            hashes = image_hashes(image_bytes)
+        except Exception as e:
+            print(f"DEBUG: Perceptual hash failed: {e}")
+            return None
+        if hashes is None:
+            return None
+        lookup_hash, fine_hash = hashes
+
+        stored = {k: v for k, v in data.items() if k not in ("File Name", "Duplicate Of")}
+        with self._lock:
+            match = self._lookup(scope, lookup_hash, fine_hash, stored)
+            with self._conn:
+                self._conn.execute(
+                    f"INSERT INTO image_hashes (hash, fine_hash, scope, {', '.join(f'b{b}' for b in range(BANDS))}, "
+                    f"file_name, data, created_at) VALUES (?, ?, ?, {', '.join('?' * BANDS)}, ?, ?, ?)",
+                    [f"{lookup_hash:016x}", f"{fine_hash:0256x}", scope, *_bands(lookup_hash),
+                     file_name, json.dumps(stored, default=str), time.time()])
+            if match is not None:
+                self.duplicates += 1
+        return match
+
+    def size(self):
+        """Number of images in the index."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM image_hashes").fetchone()[0]
+
+    def clear(self):
+        """Forgets every stored image."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM image_hashes")
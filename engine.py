@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+
+from utils import extract_receipt_info, extract_receipts_batch, error_result, source_name
+
+# Number of extractions run in parallel unless the caller says otherwise
+DEFAULT_MAX_WORKERS = int(os.getenv("RECEIPT_MAX_WORKERS", "4"))
+
+# Number of receipts sent per Gemini request unless the caller says otherwise
+DEFAULT_BATCH_SIZE = int(os.getenv("RECEIPT_BATCH_SIZE", "1"))
+
+
+def _chunked(iterable, size):
+    """Yields lists of up to size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_extractions(file_paths, extract_fn=extract_receipt_info, max_workers=DEFAULT_MAX_WORKERS,
+                     batch_size=1, extract_batch_fn=extract_receipts_batch):
+    """
+    Runs extract_fn over file_paths on a bounded pool of worker threads.
+    Yields (index, file_path, data) tuples in completion order, where index is
+    the position of the file in file_paths. Entries of file_paths may be paths
+    or in-memory sources (bytes or file-like objects) understood by extract_fn.
+
+    With batch_size above 1, files are grouped and each group is handed to
+    extract_batch_fn, which must return one result per file in the group.
+
+    At most 2 * max_workers tasks are in flight at any time, so file_paths can
+    be a lazy iterator of any length.
+    """
+    max_workers = max(1, int(max_workers))
+    batch_size = max(1, int(batch_size))
+    window = max_workers * 2
+    pending_chunks = _chunked(enumerate(file_paths), batch_size)
+    in_flight = {}
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def run_chunk(chunk):
+        if batch_size == 1:
+            return [extract_fn(chunk[0][1])]
+        return extract_batch_fn([file_path for _, file_path in chunk])
+
+    def submit_next():
+        chunk = next(pending_chunks, None)
+        if chunk is None:
+            return False
+        in_flight[executor.submit(run_chunk, chunk)] = chunk
+        return True
+
+    try:
+        while len(in_flight) < window and submit_next():
+            pass
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = in_flight.pop(future)
+                try:
+                    chunk_results = future.result()
+                except Exception as e:
+                    print(f"DEBUG: Worker Error for {[source_name(file_path) for _, file_path in chunk]}: {e}")
+                    chunk_results = [error_result(source_name(file_path), e)
+                                     for _, file_path in chunk]
+                for (index, file_path), data in zip(chunk, chunk_results):
+                    yield index, file_path, data
+                submit_next()
+    finally:
+        # Stop queued work if the caller abandons the generator early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def process_files(file_paths, extract_fn=extract_receipt_info, max_workers=DEFAULT_MAX_WORKERS,
+                  on_result=None, batch_size=1, extract_batch_fn=extract_receipts_batch):
+    """
+    Extracts receipt info from every file concurrently.
+    Returns the extracted dictionaries in the same order as file_paths.
+
+    on_result, if given, is called from the calling thread as each file
+    finishes: on_result(index, file_path, data, completed, total).
+    """
+    file_paths = list(file_paths)
+    total = len(file_paths)
+    results = [None] * total
+
+    extractions = iter_extractions(file_paths, extract_fn, max_workers, batch_size, extract_batch_fn)
+    for completed, (index, file_path, data) in enumerate(extractions, start=1):
+        results[index] = data
+        if on_result:
+            on_result(index, file_path, data, completed, total)
+
+    return results
@@ -0,0 +1,73 @@
+import io
+import csv
+import tempfile
+
+# Rows buffered in memory before a CSV chunk is written out
+CSV_CHUNK_ROWS = 1000
+
+CSV_MIME = "text/csv"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def write_csv(rows, columns, fileobj):
+    """
+    Writes rows (sequences in column order) to a binary file object as UTF-8
+    CSV, one chunk of CSV_CHUNK_ROWS rows at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % CSV_CHUNK_ROWS == 0:
+            fileobj.write(buffer.getvalue().encode("utf-8"))
+            buffer.seek(0)
+            buffer.truncate()
+    fileobj.write(buffer.getvalue().encode("utf-8"))
+
+
+class XlsxStreamWriter:
+    """
+    Writes an Excel sheet row by row with openpyxl's write-only mode, which
+    spools rows to disk instead of building the workbook in memory.
+    openpyxl is only imported once an Excel file is actually written.
+    """
+
+    def __init__(self, target, columns, sheet_title="Receipts"):
+        from openpyxl import Workbook
+        self.target = target
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet(title=sheet_title)
+        self._sheet.append(list(columns))
+
+    def append(self, row):
+        self._sheet.append(list(row))
+
+    def close(self):
+        """Finishes the workbook and saves it to the target path or file object."""
+        self._workbook.save(self.target)
+
+
+def write_xlsx(rows, columns, target):
+    """Writes rows (sequences in column order) to an Excel file path or binary file object."""
+    writer = XlsxStreamWriter(target, columns)
+    for row in rows:
+        writer.append(row)
+    writer.close()
+
+
+def export_bytes(rows, columns, file_format):
+    """
+    Streams rows into a temporary file in the given format ("csv" or "xlsx")
+    and returns the finished file's bytes, e.g. for st.download_button.
+    Only the final file is held in memory, never an intermediate DataFrame.
+    """
+    with tempfile.TemporaryFile() as f:
+        if file_format == "csv":
+            write_csv(rows, columns, f)
+        elif file_format == "xlsx":
+            write_xlsx(rows, columns, f)
+        else:
+            raise ValueError(f"Unsupported export format: {file_format}")
+        f.seek(0)
+        return f.read()
@@ -0,0 +1,146 @@
+import json
+import time
+import random
+import threading
+
+VENDORS = ["Starbucks", "Tesco", "Shell", "Office Depot", "Grab", "TNB", "Aeon", "Watsons"]
+CATEGORIES = ["Food", "Transport", "Office Supplies", "Utilities", "Inventory"]
+
+
+class FakeAPIError(Exception):
+    """Error raised by the fake model; code mirrors the HTTP status the real API would return."""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class ResourceExhausted(FakeAPIError):
+    """Injected 429; named like the google.api_core error so the governor treats it alike."""
+
+    def __init__(self, message="Quota exceeded (injected)"):
+        super().__init__(message, 429)
+
+
+class ServiceUnavailable(FakeAPIError):
+    """Injected transient server error."""
+
+    def __init__(self, message="Service unavailable (injected)"):
+        super().__init__(message, 503)
+
+
+class _UsageMetadata:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    """Mimics the text and usage_metadata attributes of a Gemini response."""
+
+    def __init__(self, text, prompt_tokens, output_tokens):
+        self.text = text
+        self.usage_metadata = _UsageMetadata(prompt_tokens, output_tokens)
+
+
+def fake_compact_receipt(number, keys):
+    """Returns a fake receipt in the short-key form of the response schema, limited to keys."""
+    receipt = fake_receipt(number)
+    values = {
+        "date": receipt["Date"],
+        "category": receipt["Item Category"],
+        "vendor": receipt["Vendor Name"],
+        "item": receipt["Item Name"],
+        "invoice_no": receipt["Receipt_Invoice_No"],
+        "amount": float(receipt["Price Amount"].split()[1]),
+        "currency": "RM",
+    }
+    return {key: values[key] for key in keys if key in values}
+
+
+def fake_receipt(number):
+    """Returns a plausible, fully filled-in receipt for a number."""
+    return {
+        "Date": f"2024-{number % 12 + 1:02d}-{number % 28 + 1:02d}",
+        "Item Category": CATEGORIES[number % len(CATEGORIES)],
+        "Vendor Name": VENDORS[number % len(VENDORS)],
+        "Item Name": f"Item {number % 500}",
+        "Receipt_Invoice_No": f"INV-{number:08d}",
+        "Price Amount": f"RM {(number * 7919) % 100000 / 100:.2f}",
+    }
+
+
+class FakeGeminiModel:
+    """
+    Drop-in replacement for genai.GenerativeModel answering with made-up
+    receipts.
+
+    Each request sleeps for a log-normally distributed latency (median
+    latency seconds, spread sigma, plus per_image seconds for every image),
+    then fails with probability error_rate (503) or rate_limit_rate (429),
+    or answers with one receipt per image in the shape the prompts ask for:
+    bare JSON following the response schema when a generation_config with
+    one is passed, fenced JSON with the report column names otherwise.
+    Bytes of image data received are counted in bytes_uploaded.
+    """
+
+    def __init__(self, latency=0.8, sigma=0.35, per_image=0.15, error_rate=0.0, rate_limit_rate=0.0, seed=None):
+        self.latency = latency
+        self.sigma = sigma
+        self.per_image = per_image
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.images = 0
+        self.bytes_uploaded = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        images = [part for part in contents if isinstance(part, dict) and "data" in part]
+        with self._lock:
+            self.requests += 1
+            self.images += len(images)
+            self.bytes_uploaded += sum(len(part["data"]) for part in images)
+            number = self.images
+            latency = self.latency * self._random.lognormvariate(0, self.sigma) + self.per_image * len(images)
+            roll = self._random.random()
+
+        time.sleep(latency)
+
+        if roll < self.rate_limit_rate:
+            with self._lock:
+                self.rate_limited += 1
+            raise ResourceExhausted()
+        if roll < self.rate_limit_rate + self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise ServiceUnavailable()
+
+        schema = (generation_config or {}).get("response_schema")
+        if schema is not None:
+            items = schema.get("items", schema)
+            keys = list(items["properties"])
+            if schema["type"] == "array":
+                payload = [dict(fake_compact_receipt(number - len(images) + i, keys), index=i)
+                           for i in range(1, len(images) + 1)]
+            else:
+                payload = fake_compact_receipt(number, keys)
+            text = json.dumps(payload)
+        elif len(images) == 1:
+            text = "```json\n" + json.dumps(fake_receipt(number)) + "\n```"
+        else:
+            payload = [dict(fake_receipt(number - len(images) + i), index=i)
+                       for i in range(1, len(images) + 1)]
+            text = "```json\n" + json.dumps(payload) + "\n```"
+        # Roughly what Gemini charges: a fixed prompt plus 258 tokens per image, ~4 characters per output token
+        return FakeResponse(text, prompt_tokens=300 + 258 * len(images), output_tokens=len(text) // 4)
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "images": self.images, "bytes_uploaded": self.bytes_uploaded,
+                    "errors": self.errors, "rate_limited": self.rate_limited}
@@ -0,0 +1,147 @@
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Stages timed during a run, in pipeline order
+STAGES = ["image_open", "render", "dedup", "preprocess", "api", "parse", "rename", "zip", "ledger", "export"]
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100)) # ceil without floats
+    return sorted_values[int(rank) - 1]
+
+
+def _distribution(values):
+    """Returns count, total, mean, max and p50/p95/p99 of a list of numbers."""
+    values = sorted(values)
+    total = sum(values)
+    summary = {
+        "count": len(values),
+        "total": total,
+        "mean": total / len(values) if values else 0.0,
+        "max": values[-1] if values else 0.0,
+    }
+    for pct in PERCENTILES:
+        summary[f"p{pct}"] = percentile(values, pct)
+    return summary
+
+
+def logging_sink(logger=None, level=logging.DEBUG):
+    """Returns a sink that writes every event to a logger as one JSON line."""
+    logger = logger or logging.getLogger("receiptcompiler.metrics")
+
+    def sink(event):
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps(event, ensure_ascii=False))
+    return sink
+
+
+class RunMetrics:
+    """
+    Collects per-file stage timings and model token usage for a run.
+
+    Recording a sample is an append under a lock, so the hooks can stay
+    enabled in production. Sinks are callables receiving one event dict per
+    sample, e.g. logging_sink() or a function feeding a metrics backend;
+    a failing sink is reported and otherwise ignored.
+    """
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self._lock = threading.Lock()
+        self._timings = {} # stage -> list of seconds
+        self._tokens = [] # one (prompt, output, total) tuple per response
+        self.started_at = time.time()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def _emit(self, event):
+        for sink in self.sinks:
+            try:
+                sink(event)
+            except Exception as e:
+                print(f"DEBUG: Metrics Sink Error: {e}")
+
+    def record(self, stage, seconds, file_name=None):
+        """Records the duration of one stage for one file."""
+        with self._lock:
+            self._timings.setdefault(stage, []).append(seconds)
+        if self.sinks:
+            self._emit({"event": "stage", "stage": stage, "seconds": seconds, "file": file_name})
+
+    @contextmanager
+    def stage(self, name, file_name=None):
+        """Times the enclosed block as one sample of the named stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, file_name)
+
+    def call(self, name, fn, *args, **kwargs):
+        """Calls fn(*args, **kwargs), timing it as the named stage."""
+        with self.stage(name):
+            return fn(*args, **kwargs)
+
+    def record_usage(self, response, file_name=None, images=1):
+        """Records the token counts reported in a Gemini response's usage_metadata."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        prompt = getattr(usage, "prompt_token_count", 0) or 0
+        output = getattr(usage, "candidates_token_count", 0) or 0
+        total = getattr(usage, "total_token_count", 0) or prompt + output
+        with self._lock:
+            self._tokens.append((prompt, output, total))
+        if self.sinks:
+            self._emit({"event": "tokens", "prompt_tokens": prompt, "output_tokens": output,
+                        "total_tokens": total, "images": images, "file": file_name})
+
+    def summary(self):
+        """Returns per-stage and token distributions (seconds and tokens per request)."""
+        with self._lock:
+            timings = {stage: list(values) for stage, values in self._timings.items()}
+            tokens = list(self._tokens)
+
+        order = {stage: position for position, stage in enumerate(STAGES)}
+        stages = {stage: _distribution(timings[stage])
+                  for stage in sorted(timings, key=lambda stage: (order.get(stage, len(STAGES)), stage))}
+        return {
+            "started_at": self.started_at,
+            "stages": stages,
+            "tokens": {
+                "requests": len(tokens),
+                "prompt_tokens": sum(prompt for prompt, _, _ in tokens),
+                "output_tokens": sum(output for _, output, _ in tokens),
+                "per_request": _distribution([total for _, _, total in tokens]),
+            },
+        }
+
+    def to_json(self, indent=2):
+        """Returns the summary as a JSON string."""
+        return json.dumps(self.summary(), indent=indent)
+
+    def summary_rows(self):
+        """Returns one row per stage (milliseconds) for display as a table."""
+        rows = []
+        for stage, values in self.summary()["stages"].items():
+            row = {"Stage": stage, "Count": values["count"], "Total s": round(values["total"], 2)}
+            for key in ("mean", "p50", "p95", "p99", "max"):
+                row[f"{key} ms"] = round(values[key] * 1000, 1)
+            rows.append(row)
+        return rows
+
+
+def timed(metrics, stage, file_name=None):
+    """Returns metrics.stage(...) or a no-op context manager when metrics is None."""
+    if metrics is None:
+        return nullcontext()
+    return metrics.stage(stage, file_name)
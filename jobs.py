@@ -0,0 +1,213 @@
+import os
+import hmac
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Jobs processed at the same time for all users of this server; later jobs wait in a queue
+MAX_CONCURRENT_JOBS = int(os.getenv("RECEIPT_MAX_JOBS", "2"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function once its job has been cancelled."""
+
+
+class Job:
+    """
+    A batch of receipts processed in the background.
+
+    The job function reports progress through update() and calls
+    check_cancelled() between files; readers get a consistent view through
+    snapshot(). Rows finished so far are published with publish() and read
+    incrementally with rows_since(), and outputs holds objects the job
+    exposes while it runs (such as an archive being written); they are
+    dropped once the job finishes. Once the job is done, result holds what
+    the function returned.
+
+    owner is a secret token of the browser that submitted the job; only a
+    session presenting it may follow the job again (see is_owned_by).
+    """
+
+    def __init__(self, job_id, session_id, total, work_dir=None, owner=None):
+        self.id = job_id
+        self.session_id = session_id
+        self.owner = owner
+        self.total = total
+        self.work_dir = work_dir
+        self.state = QUEUED
+        self.completed = 0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.outputs = {}
+        self._rows = []
+        self._progress_start = None # (time, completed) of the first progress update
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def is_owned_by(self, owner):
+        """True if owner is the token the job was submitted with."""
+        return self.owner is not None and owner is not None and hmac.compare_digest(self.owner, owner)
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def update(self, completed=None, message=None):
+        """Records progress: the number of files completed and/or a status message."""
+        with self._lock:
+            if completed is not None:
+                if self._progress_start is None:
+                    # Files restored from an earlier run count as done, not as throughput
+                    self._progress_start = (time.time(), completed)
+                self.completed = completed
+            if message is not None:
+                self.message = message
+
+    def publish(self, row):
+        """Makes one finished row available to readers while the job runs."""
+        with self._lock:
+            self._rows.append(row)
+
+    def rows_since(self, start=0):
+        """Returns the rows published after the first start ones."""
+        with self._lock:
+            return self._rows[start:]
+
+    def cancel(self):
+        """Asks the job to stop after the files already in flight."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """Raises JobCancelled if the job has been cancelled."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def snapshot(self):
+        """Returns the job's state and progress (with throughput in files/s and ETA in seconds) as a dictionary."""
+        with self._lock:
+            rate = eta = None
+            if self._progress_start is not None:
+                started, start_completed = self._progress_start
+                elapsed = (self.finished_at or time.time()) - started
+                if self.completed > start_completed and elapsed > 0:
+                    rate = (self.completed - start_completed) / elapsed
+                    eta = (self.total - self.completed) / rate
+            return {
+                "id": self.id,
+                "state": self.state,
+                "completed": self.completed,
+                "total": self.total,
+                "message": self.message,
+                "error": self.error,
+                "elapsed": (self.finished_at or time.time()) - (self.started_at or time.time()),
+                "rate": rate,
+                "eta": eta,
+                "rows": len(self._rows),
+            }
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded pool of background threads shared by every
+    session, so a long batch neither blocks the Streamlit script runner nor
+    stops when the page reruns, and concurrent users queue for max_jobs
+    workers instead of each starting their own.
+
+    Jobs are keyed by id: submitting an id that is still queued or running
+    returns the existing job, but only to its owner. Finished jobs are
+    forgotten after keep_seconds.
+    """
+
+    def __init__(self, max_jobs=MAX_CONCURRENT_JOBS, keep_seconds=6 * 3600):
+        self.max_jobs = max(1, int(max_jobs))
+        self.keep_seconds = keep_seconds
+        self._executor = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="receipt-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, session_id, total, fn, work_dir=None, owner=None):
+        """
+        Queues fn(job) to run in the background and returns the Job.
+        fn reports progress on the job and returns the job's result.
+        Raises ValueError if a job with this id is still running for another owner.
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            if job is not None and not job.finished:
+                if not job.is_owned_by(owner):
+                    raise ValueError(f"Job {job_id} belongs to another session")
+                return job
+            job = Job(job_id, session_id, total, work_dir, owner)
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        with job._lock:
+            if job.cancelled:
+                job.state = CANCELLED
+                job.finished_at = time.time()
+                return
+            job.state = RUNNING
+            job.started_at = time.time()
+        try:
+            result = fn(job)
+            state, error = DONE, None
+        except JobCancelled:
+            result, state, error = None, CANCELLED, None
+        except Exception as e:
+            print(f"DEBUG: Job {job.id} failed: {e}")
+            traceback.print_exc()
+            result, state, error = None, FAILED, str(e)
+        with job._lock:
+            job.result = result
+            job.error = error
+            job.state = state
+            job.finished_at = time.time()
+            job.outputs = {} # Finished jobs are kept for keep_seconds; their outputs are not
+
+    def get(self, job_id):
+        """Returns the job with the given id, or None."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_position(self, job):
+        """Returns how many queued jobs were submitted before job."""
+        with self._lock:
+            return sum(1 for other in self._jobs.values()
+                       if other.state == QUEUED and other.submitted_at < job.submitted_at)
+
+    def active_dirs(self):
+        """Returns the working directories of jobs that are queued or running."""
+        with self._lock:
+            return [job.work_dir for job in self._jobs.values() if not job.finished and job.work_dir]
+
+    def cancel_session(self, session_id):
+        """Cancels every unfinished job of a session."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.session_id == session_id and not job.finished:
+                    job.cancel()
+
+    def _prune(self):
+        """Forgets finished jobs older than keep_seconds. Caller holds _lock."""
+        cutoff = time.time() - self.keep_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
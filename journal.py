@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from workspace import WORKSPACE_ROOT
+
+# Folder holding one sub-folder per batch job
+JOBS_DIR = os.path.join(WORKSPACE_ROOT, "jobs")
+
+
+def content_digest(source):
+    """Returns the SHA-256 (hex) of a file's bytes, given its path or an in-memory upload."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    return hashlib.sha256(source.getbuffer()).hexdigest()
+
+
+def job_id_for(files, salt=""):
+    """
+    Returns a stable job id for a batch, given (file name, content SHA-256)
+    pairs (see content_digest). Uploading the same files again yields the
+    same id, which is what lets an interrupted job be found and resumed; a
+    file whose contents changed gives a new id. salt (e.g. the model name)
+    keeps otherwise identical batches apart.
+    """
+    digest = hashlib.sha256(salt.encode("utf-8"))
+    for name, content_hash in sorted(files):
+        digest.update(f"{name}\0{content_hash}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class JobJournal:
+    """
+    Append-only JSONL journal of per-file progress for one batch job.
+
+    Each completed file is written (and flushed) as soon as it finishes, so a
+    crashed or interrupted job can be resumed by skipping the files whose
+    latest entry has status "done".
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # Partially written last line from a crash
+                    self._entries[entry["key"]] = entry
+
+        self._file = open(path, "a", encoding="utf-8")
+
+    @classmethod
+    def for_job(cls, job_id, jobs_dir=JOBS_DIR):
+        """Opens the journal of the given job, creating it if needed."""
+        return cls(os.path.join(jobs_dir, job_id, "journal.jsonl"))
+
+    def record(self, key, status, data=None, new_name=None):
+        """Appends the outcome of one file ("done" or "failed") to the journal."""
+        entry = {"key": key, "status": status, "data": data, "new_name": new_name, "time": time.time()}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._entries[key] = entry
+
+    def get(self, key):
+        """Returns the latest entry recorded for key, or None."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def is_done(self, key):
+        entry = self.get(key)
+        return entry is not None and entry["status"] == "done"
+
+    def completed(self):
+        """Returns {key: entry} for every file that finished successfully."""
+        with self._lock:
+            return {key: entry for key, entry in self._entries.items() if entry["status"] == "done"}
+
+    def close(self):
+        with self._lock:
+            self._file.close()
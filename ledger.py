@@ -0,0 +1,178 @@
+import os
+import time
+import sqlite3
+import threading
+
+from utils import DATA_DIR
+from receipt_schema import invoice_key
+from export import write_csv, write_xlsx, export_bytes
+
+DEFAULT_LEDGER_PATH = os.path.join(DATA_DIR, "ledger.sqlite3")
+
+# Report column -> ledger table column
+COLUMN_MAP = {
+    "Date": "date",
+    "Item Category": "item_category",
+    "Vendor Name": "vendor_name",
+    "Item Name": "item_name",
+    "Receipt_Invoice_No": "receipt_invoice_no",
+    "Price Amount": "price_amount",
+    "Currency": "currency",
+    "File Name": "file_name",
+    "Duplicate Of": "duplicate_of",
+}
+LEDGER_COLUMNS = list(COLUMN_MAP)
+
+
+class Ledger:
+    """
+    Persistent, append-only store of compiled receipts.
+
+    New batches are appended in a single transaction, so saving costs
+    O(batch) no matter how long the history is. CSV and Excel files are
+    produced on demand as exports of the ledger.
+
+    Every row also stores its invoice key (see receipt_schema.invoice_key)
+    in an indexed column, so find_duplicates can check new rows against the
+    whole history with one index lookup each.
+    """
+
+    def __init__(self, path=DEFAULT_LEDGER_PATH):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        columns = ", ".join(f"{column} TEXT" for column in COLUMN_MAP.values())
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS receipts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    batch_id TEXT,
+                    added_at REAL NOT NULL,
+                    {columns}
+                )
+            """)
+            # Add columns introduced after the ledger was created
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(receipts)")}
+            for column in [*COLUMN_MAP.values(), "invoice_key"]:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE receipts ADD COLUMN {column} TEXT")
+            for column in ("date", "vendor_name", "receipt_invoice_no", "batch_id", "invoice_key"):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_receipts_{column} ON receipts ({column})")
+            if "invoice_key" not in existing:
+                self._backfill_invoice_keys()
+
+    def _backfill_invoice_keys(self):
+        """Computes the invoice key of rows saved before the column existed. Caller holds _lock."""
+        rows = self._conn.execute(
+            "SELECT id, vendor_name, receipt_invoice_no, price_amount FROM receipts").fetchall()
+        self._conn.executemany("UPDATE receipts SET invoice_key = ? WHERE id = ?", [
+            (invoice_key({"Vendor Name": vendor, "Receipt_Invoice_No": invoice, "Price Amount": amount}), row_id)
+            for row_id, vendor, invoice, amount in rows])
+
+    def append(self, rows, batch_id=None):
+        """Appends result rows (dictionaries keyed by report column) and returns how many were added."""
+        now = time.time()
+        records = [
+            (batch_id, now, invoice_key(row),
+             *[None if row.get(name) is None else str(row.get(name)) for name in LEDGER_COLUMNS])
+            for row in rows
+        ]
+        placeholders = ", ".join("?" * (len(LEDGER_COLUMNS) + 3))
+        columns = ", ".join(["batch_id", "added_at", "invoice_key"] + list(COLUMN_MAP.values()))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO receipts ({columns}) VALUES ({placeholders})", records)
+        return len(records)
+
+    def remove_batch(self, batch_id):
+        """Deletes the receipts appended with batch_id and returns how many were removed."""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM receipts WHERE batch_id = ?", (batch_id,)).rowcount
+
+    def find_duplicates(self, rows, chunk_size=500):
+        """
+        Returns {position: file name} for the rows whose invoice key (same
+        vendor, invoice number and amount) is already in the ledger or
+        appears earlier in rows; the value names the earlier receipt's file.
+        Rows without a usable key are never reported.
+        """
+        keys = [invoice_key(row) for row in rows]
+        wanted = list({key for key in keys if key is not None})
+        earlier = {}
+        with self._lock:
+            for start in range(0, len(wanted), chunk_size):
+                chunk = wanted[start:start + chunk_size]
+                found = self._conn.execute(
+                    f"SELECT invoice_key, MIN(id), file_name FROM receipts "
+                    f"WHERE invoice_key IN ({', '.join('?' * len(chunk))}) GROUP BY invoice_key", chunk)
+                for key, _, file_name in found:
+                    earlier[key] = file_name or ""
+
+        duplicates = {}
+        for position, (row, key) in enumerate(zip(rows, keys)):
+            if key is None:
+                continue
+            if key in earlier:
+                duplicates[position] = earlier[key]
+            else:
+                earlier[key] = row.get("File Name", "")
+        return duplicates
+
+    def count(self, batch_id=None):
+        """Returns the number of receipts in the ledger, or in one batch."""
+        with self._lock:
+            if batch_id is None:
+                return self._conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM receipts WHERE batch_id = ?", (batch_id,)).fetchone()[0]
+
+    def _select(self, batch_id=None, columns=LEDGER_COLUMNS):
+        columns = ", ".join(f'{COLUMN_MAP[name]} AS "{name}"' for name in columns)
+        if batch_id is None:
+            return f"SELECT {columns} FROM receipts ORDER BY id", ()
+        return f"SELECT {columns} FROM receipts WHERE batch_id = ? ORDER BY id", (batch_id,)
+
+    def iter_rows(self, batch_id=None, chunk_size=1000):
+        """
+        Yields ledger rows as tuples in LEDGER_COLUMNS order, fetching
+        chunk_size rows at a time on a separate read connection.
+        """
+        query, params = self._select(batch_id)
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                yield from chunk
+        finally:
+            conn.close()
+
+    def to_dataframe(self, batch_id=None, columns=LEDGER_COLUMNS):
+        """Loads the ledger (or one batch of it) into a DataFrame, optionally only some report columns."""
+        import pandas as pd # Deferred: only needed for this view of the ledger
+        query, params = self._select(batch_id, columns)
+        with self._lock:
+            return pd.read_sql_query(query, self._conn, params=params)
+
+    def export_csv(self, path, batch_id=None):
+        """Streams the ledger (or one batch of it) to a CSV file."""
+        with open(path, "wb") as f:
+            write_csv(self.iter_rows(batch_id), LEDGER_COLUMNS, f)
+        return path
+
+    def export_excel(self, path, batch_id=None):
+        """Streams the ledger (or one batch of it) to an Excel file."""
+        write_xlsx(self.iter_rows(batch_id), LEDGER_COLUMNS, path)
+        return path
+
+    def export_bytes(self, file_format, batch_id=None):
+        """Returns the ledger (or one batch of it) as CSV or XLSX bytes for downloading."""
+        return export_bytes(self.iter_rows(batch_id), LEDGER_COLUMNS, file_format)
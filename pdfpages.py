@@ -0,0 +1,68 @@
+import io
+import os
+import threading
+
+from preprocess import DEFAULT_MAX_EDGE, JPEG_QUALITY, is_grayscale
+
+# Pages of a PDF sent to the model: all of a short document, else the first
+# MAX_PDF_PAGES - 1 (vendor, date, invoice number) and the last (the total)
+MAX_PDF_PAGES = int(os.getenv("RECEIPT_PDF_MAX_PAGES", "6"))
+
+# Pages of one PDF extracted in parallel; rendering stays this far ahead at most
+PDF_PAGE_WORKERS = int(os.getenv("RECEIPT_PDF_PAGE_WORKERS", "3"))
+
+# Small pages are not rendered beyond this resolution
+MAX_RENDER_DPI = 200
+
+# pdfium is not thread-safe, so every call into it goes through this lock
+_PDFIUM_LOCK = threading.Lock()
+
+
+def is_pdf(data):
+    """True if data (bytes-like) is a PDF document; the header may follow a few bytes of junk."""
+    return b"%PDF-" in bytes(data[:1024])
+
+
+def pages_to_extract(page_count, max_pages=MAX_PDF_PAGES):
+    """Returns the indexes of the pages worth sending to the model (see MAX_PDF_PAGES)."""
+    max_pages = max(1, int(max_pages))
+    if page_count <= max_pages:
+        return list(range(page_count))
+    return list(range(max_pages - 1)) + [page_count - 1]
+
+
+def render_scale(width, height, max_edge=DEFAULT_MAX_EDGE):
+    """Scale from PDF points (1/72 inch) giving max_edge pixels on the longest side, capped at MAX_RENDER_DPI."""
+    return min(max_edge / max(width, height, 1), MAX_RENDER_DPI / 72)
+
+
+def iter_pages(pdf_bytes, max_edge=DEFAULT_MAX_EDGE, max_pages=MAX_PDF_PAGES):
+    """
+    Lazily renders the pages of a PDF worth extracting as JPEG bytes sized
+    and encoded for the model (as prepare_image would, so they need no
+    preprocessing), one page at a time: only the page being rendered and
+    those already handed out are in memory, however long the document.
+    Yields (page_number, page_count, jpeg_bytes) with page numbers from 1.
+    """
+    import pypdfium2 as pdfium # Deferred: only needed for PDF input
+
+    with _PDFIUM_LOCK:
+        document = pdfium.PdfDocument(pdf_bytes)
+        page_count = len(document)
+    try:
+        for index in pages_to_extract(page_count, max_pages):
+            with _PDFIUM_LOCK:
+                page = document[index]
+                try:
+                    bitmap = page.render(scale=render_scale(*page.get_size(), max_edge))
+                    buffer = io.BytesIO()
+                    img = bitmap.to_pil()
+                    img = img.convert("L") if is_grayscale(img) else img.convert("RGB")
+                    img.save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True)
+                    bitmap.close()
+                finally:
+                    page.close()
+            yield index + 1, page_count, buffer.getvalue()
+    finally:
+        with _PDFIUM_LOCK:
+            document.close()
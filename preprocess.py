@@ -0,0 +1,88 @@
+import os
+import io
+from PIL import Image, ImageOps, ImageStat
+
+# Longest image edge (in pixels) sent to the model
+DEFAULT_MAX_EDGE = int(os.getenv("RECEIPT_MAX_IMAGE_EDGE", "2000"))
+
+# Mean HSV saturation (0-255) below which a photo is treated as black and white
+GRAYSCALE_SATURATION = 16
+
+# Quality of the JPEGs sent to the model
+JPEG_QUALITY = 85
+
+
+def is_grayscale(img):
+    """Returns True if the image carries (almost) no colour information."""
+    if img.mode in ("1", "L", "LA", "I", "F"):
+        return True
+    thumb = img.convert("RGB")
+    thumb.thumbnail((64, 64))
+    saturation = thumb.convert("HSV").getchannel("S")
+    return ImageStat.Stat(saturation).mean[0] < GRAYSCALE_SATURATION
+
+
+def original_image_part(image_bytes):
+    """Wraps the untouched image bytes as a Gemini inline image part."""
+    img = Image.open(io.BytesIO(image_bytes))
+    mime_type = Image.MIME.get(img.format, "image/jpeg")
+    return {"mime_type": mime_type, "data": bytes(image_bytes)}
+
+
+def prepare_image(image_bytes, max_edge=DEFAULT_MAX_EDGE, image_format="JPEG", quality=JPEG_QUALITY):
+    """
+    Shrinks an image before it is uploaded to Gemini.
+    Applies the EXIF orientation, drops colour from black-and-white receipts,
+    caps the long edge at max_edge pixels and re-encodes to JPEG or WEBP.
+
+    Returns (image_part, stats) where image_part is a Gemini inline image part
+    and stats describes the bytes saved. If re-encoding would not make the
+    upload smaller, the original bytes are sent unchanged.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    original_format = img.format
+    original_size = img.size
+
+    # Let the JPEG decoder downscale by powers of two while decoding
+    if original_format == "JPEG":
+        img.draft("RGB", (max_edge, max_edge))
+
+    # Orientation 1 means the pixels are already upright
+    rotated = img.getexif().get(0x0112, 1) != 1
+    img = ImageOps.exif_transpose(img)
+
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+
+    grayscale = is_grayscale(img)
+    img = img.convert("L") if grayscale else img.convert("RGB")
+
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    save_options = {"quality": quality}
+    if image_format == "JPEG":
+        save_options["optimize"] = True
+    img.save(buffer, format=image_format, **save_options)
+    processed = buffer.getvalue()
+
+    reduced = len(processed) < len(image_bytes) or rotated
+    if reduced:
+        image_part = {"mime_type": Image.MIME[image_format], "data": processed}
+    else:
+        image_part = {"mime_type": Image.MIME.get(original_format, "image/jpeg"), "data": bytes(image_bytes)}
+
+    stats = {
+        "original_bytes": len(image_bytes),
+        "processed_bytes": len(image_part["data"]),
+        "bytes_saved": len(image_bytes) - len(image_part["data"]),
+        "original_size": original_size,
+        "processed_size": img.size if reduced else original_size,
+        "grayscale": grayscale and reduced,
+        "reduced": reduced,
+    }
+    return image_part, stats
@@ -0,0 +1,182 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+
+# Default quota shared by every request made through a governor
+DEFAULT_RPM = int(os.getenv("RECEIPT_RPM", "60"))
+DEFAULT_TPM = int(os.getenv("RECEIPT_TPM", "250000"))
+
+# Rough token cost of one receipt image plus prompt and answer, used until
+# the response reports the real usage
+DEFAULT_REQUEST_TOKENS = 800
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+                         "InternalServerError", "DeadlineExceeded", "GatewayTimeout"}
+RATE_LIMIT_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests"}
+
+
+def _status_code(error):
+    """Returns the HTTP status code carried by an API exception, if any."""
+    code = getattr(error, "code", None)
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limited(error):
+    """Returns True if the error is a 429 / quota exhaustion."""
+    return _status_code(error) == 429 or type(error).__name__ in RATE_LIMIT_ERROR_NAMES
+
+
+def is_retryable(error):
+    """Returns True if the request that raised error is worth retrying."""
+    return _status_code(error) in RETRYABLE_STATUS_CODES or type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+class RequestGovernor:
+    """
+    Shared gatekeeper for model requests.
+
+    Every call waits for a slot in two token buckets (requests per minute and
+    tokens per minute) and for a free concurrency slot. Retryable errors are
+    retried with exponential backoff and jitter. The concurrency limit follows
+    AIMD: it halves on a 429 and grows by roughly one slot per round of
+    successful calls, up to max_concurrency.
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, max_concurrency=16, min_concurrency=1,
+                 initial_concurrency=4, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._request_tokens = float(rpm)
+        self._token_tokens = float(tpm)
+        self._last_refill = time.monotonic()
+        self._limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._recent = deque() # Start times of requests in the last minute
+
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.throttle_seconds = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_tokens = min(self.rpm, self._request_tokens + elapsed * self.rpm / 60.0)
+        self._token_tokens = min(self.tpm, self._token_tokens + elapsed * self.tpm / 60.0)
+
+    def _acquire(self, tokens):
+        """Blocks until the request fits the quota and concurrency limit."""
+        tokens = min(tokens, self.tpm)
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if (self._in_flight < int(self._limit)
+                        and self._request_tokens >= 1
+                        and self._token_tokens >= tokens):
+                    break
+                if self._in_flight >= int(self._limit):
+                    timeout = None # Woken up by _release
+                else:
+                    request_wait = (1 - self._request_tokens) * 60.0 / self.rpm
+                    token_wait = (tokens - self._token_tokens) * 60.0 / self.tpm
+                    timeout = max(request_wait, token_wait, 0.01)
+                self._cond.wait(timeout)
+
+            self._request_tokens -= 1
+            self._token_tokens -= tokens
+            self._in_flight += 1
+            self.requests += 1
+            self._recent.append(now)
+            self.throttle_seconds += now - start
+
+    def _release(self, success, rate_limited=False):
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if success:
+                self.successes += 1
+                self._limit = min(self.max_concurrency, self._limit + 1.0 / self._limit)
+            else:
+                self.failures += 1
+                # Only back off once per burst of 429s from the same round of requests
+                if rate_limited and now - self._last_decrease > 1.0:
+                    self._limit = max(self.min_concurrency, self._limit / 2)
+                    self._last_decrease = now
+            self._cond.notify_all()
+
+    def _record_usage(self, estimated_tokens, response):
+        """Charges the token bucket with the difference between estimated and reported usage."""
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", None)
+        if actual:
+            with self._cond:
+                self._token_tokens -= actual - min(estimated_tokens, self.tpm)
+
+    def call(self, fn, *args, tokens=DEFAULT_REQUEST_TOKENS, **kwargs):
+        """
+        Calls fn(*args, **kwargs) within the quota, retrying retryable errors.
+        tokens is the estimated token cost of the request.
+        Raises the last error once retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            self._acquire(tokens)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                rate_limited = is_rate_limited(e)
+                self._release(success=False, rate_limited=rate_limited)
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+
+                # Exponential backoff with equal jitter
+                cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+                delay = cap / 2 + random.uniform(0, cap / 2)
+                with self._cond:
+                    self.retries += 1
+                    if rate_limited:
+                        self.rate_limited += 1
+                    self.throttle_seconds += delay
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self._release(success=True)
+            self._record_usage(tokens, result)
+            return result
+
+    def metrics(self):
+        """Returns a snapshot of the governor's counters."""
+        with self._cond:
+            cutoff = time.monotonic() - 60
+            while self._recent and self._recent[0] < cutoff:
+                self._recent.popleft()
+            return {
+                "requests_per_minute": len(self._recent),
+                "concurrency_limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "requests": self.requests,
+                "successes": self.successes,
+                "failures": self.failures,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "throttle_seconds": round(self.throttle_seconds, 2),
+            }
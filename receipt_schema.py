@@ -0,0 +1,202 @@
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+RECEIPT_FIELDS = ["Date", "Item Category", "Vendor Name", "Item Name", "Receipt_Invoice_No", "Price Amount"]
+
+# Currency reported in its own column, split off the amount
+CURRENCY_FIELD = "Currency"
+DEFAULT_CURRENCY = "RM"
+CURRENCY_ALIASES = {"MYR": "RM", "RM": "RM"}
+
+# Report column -> short key used in the response schema (fewer output tokens)
+FIELD_KEYS = {
+    "Date": "date",
+    "Item Category": "category",
+    "Vendor Name": "vendor",
+    "Item Name": "item",
+    "Receipt_Invoice_No": "invoice_no",
+    "Price Amount": "amount",
+}
+
+FIELD_SCHEMAS = {
+    "date": {"type": "string", "description": "YYYY-MM-DD"},
+    "category": {"type": "string", "description": "e.g. Food, Transport, Office Supplies, Inventory, Utilities"},
+    "vendor": {"type": "string"},
+    "item": {"type": "string", "description": "short summary of the main item(s)"},
+    "invoice_no": {"type": "string"},
+    "amount": {"type": "number", "description": "total paid"},
+    "currency": {"type": "string", "description": "code or symbol, e.g. RM"},
+}
+
+COMPACT_PROMPT = "Extract this receipt. Use null for missing or illegible fields."
+COMPACT_BATCH_PROMPT = ("Extract each of the {count} receipts; index is the image number. "
+                        "Use null for missing or illegible fields.")
+FIELD_RETRY_PROMPT = "Read only these fields from this receipt: {fields}. Use null if absent."
+
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y",
+                "%d %b %Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y", "%d %b %y", "%Y%m%d"]
+
+CENTS = Decimal("0.01")
+
+# Company-form words dropped from vendor names before comparing them
+VENDOR_SUFFIXES = {"sdn", "bhd", "berhad", "enterprise", "inc", "ltd", "llc", "plc", "co", "corp",
+                   "company", "limited", "gmbh", "pte", "the"}
+
+
+def _object_schema(fields, with_index=False):
+    keys = [FIELD_KEYS[field] for field in fields]
+    if "Price Amount" in fields:
+        keys.append("currency")
+    properties = {key: dict(FIELD_SCHEMAS[key], nullable=True) for key in keys}
+    required = list(keys)
+    if with_index:
+        properties["index"] = {"type": "integer"}
+        required.insert(0, "index")
+    return {"type": "object", "properties": properties, "required": required}
+
+
+def generation_config(fields=RECEIPT_FIELDS, batch=False):
+    """Gemini generation config constraining the answer to JSON with the given fields."""
+    schema = _object_schema(fields, with_index=batch)
+    if batch:
+        schema = {"type": "array", "items": schema}
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def field_retry_prompt(fields):
+    """Prompt asking again for just the given fields."""
+    return FIELD_RETRY_PROMPT.format(fields=", ".join(FIELD_KEYS[field] for field in fields))
+
+
+def parse_amount(value):
+    """Returns the number in an amount such as "RM 1,234.50" as a Decimal, or None."""
+    if isinstance(value, (int, Decimal)) and not isinstance(value, bool):
+        return Decimal(value)
+    if isinstance(value, float):
+        return Decimal(str(value))
+    match = re.search(r"-?\d[\d,]*(?:\.\d+)?", str(value))
+    if not match:
+        return None
+    try:
+        return Decimal(match.group().replace(",", ""))
+    except InvalidOperation:
+        return None
+
+
+def parse_currency(value):
+    """Returns the currency code or symbol written around an amount (e.g. "RM" in "RM 12.00"), or None."""
+    match = re.search(r"[A-Za-z]{1,3}\$?|[$€£¥]", str(value or ""))
+    if not match:
+        return None
+    currency = match.group().upper()
+    return CURRENCY_ALIASES.get(currency, currency)
+
+
+def normalize_date(value):
+    """Returns a date written in any common format as YYYY-MM-DD, or None."""
+    text = str(value).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def _is_blank(value):
+    return value is None or str(value).strip().lower() in ("", "unknown", "null", "none", "n/a", "error")
+
+
+def normalize_receipt(payload, fields=RECEIPT_FIELDS):
+    """
+    Converts a model answer into a report row with typed, normalized values:
+    an ISO date, a two-decimal amount and the currency in its own column.
+    Accepts the short schema keys as well as the report column names, so
+    older cached results normalize the same way.
+
+    Returns (data, failed), where failed maps each field that is missing to
+    "missing" and each field whose value could not be normalized to "invalid".
+    """
+    data = {}
+    failed = {}
+    for field in fields:
+        value = payload.get(FIELD_KEYS[field], payload.get(field))
+        if _is_blank(value):
+            data[field] = "Unknown"
+            failed[field] = "missing"
+        elif field == "Date":
+            date = normalize_date(value)
+            data[field] = date or str(value).strip()
+            if date is None:
+                failed[field] = "invalid"
+        elif field == "Price Amount":
+            amount = parse_amount(value)
+            data[field] = f"{amount.quantize(CENTS)}" if amount is not None else str(value).strip()
+            if amount is None:
+                failed[field] = "invalid"
+        else:
+            data[field] = str(value).strip()
+
+    if "Price Amount" in fields:
+        currency = payload.get("currency", payload.get(CURRENCY_FIELD))
+        if _is_blank(currency):
+            currency = parse_currency(payload.get(FIELD_KEYS["Price Amount"], payload.get("Price Amount")))
+        if _is_blank(currency):
+            currency = DEFAULT_CURRENCY
+        currency = str(currency).strip()
+        data[CURRENCY_FIELD] = CURRENCY_ALIASES.get(currency.upper(), currency)
+
+    return data, failed
+
+
+def merge_page_results(pages):
+    """
+    Combines the results of the pages of one document (in page order) into
+    one receipt row. Each field comes from the first page where it was read,
+    as the vendor, date and invoice number head the first page, and a date
+    that normalizes wins over one that does not; the amount and currency
+    come from the last page with a readable amount, where the total is.
+    Returns None if no page yielded any field.
+    """
+    merged = {}
+    for field in RECEIPT_FIELDS:
+        values = [page[field] for page in pages if not _is_blank(page.get(field))]
+        if field == "Date":
+            values = [value for value in values if normalize_date(value)] or values
+        if field == "Price Amount":
+            readable = [page for page in pages
+                        if not _is_blank(page.get(field)) and parse_amount(page[field]) is not None]
+            if readable:
+                merged[field] = readable[-1][field]
+                merged[CURRENCY_FIELD] = readable[-1].get(CURRENCY_FIELD) or DEFAULT_CURRENCY
+                continue
+        if values:
+            merged[field] = values[0]
+    if not merged:
+        return None
+    for field in RECEIPT_FIELDS:
+        merged.setdefault(field, "Unknown")
+    merged.setdefault(CURRENCY_FIELD, DEFAULT_CURRENCY)
+    return merged
+
+
+def normalize_vendor(value):
+    """Returns a vendor name reduced for comparison: "The Corner Cafe Sdn. Bhd." -> "cornercafe"."""
+    words = re.findall(r"[a-z0-9]+", str(value).casefold().replace("&", " and "))
+    return "".join(word for word in words if word not in VENDOR_SUFFIXES)
+
+
+def invoice_key(data):
+    """
+    Returns the key identifying the claim a receipt row represents, built
+    from its normalized vendor name, invoice number and amount, or None if
+    any of them is missing (such rows cannot be matched reliably).
+    """
+    vendor = normalize_vendor(data.get("Vendor Name", "")) if not _is_blank(data.get("Vendor Name")) else ""
+    invoice = re.sub(r"[^A-Z0-9]", "", str(data.get("Receipt_Invoice_No", "")).upper())
+    invoice = re.sub(r"(?<![0-9])0+(?=[0-9])", "", invoice) # INV-00123 == INV123
+    amount = parse_amount(data.get("Price Amount", "")) if not _is_blank(data.get("Price Amount")) else None
+    if not vendor or not invoice or _is_blank(data.get("Receipt_Invoice_No")) or amount is None:
+        return None
+    return f"{vendor}|{invoice}|{amount.quantize(CENTS)}"
@@ -0,0 +1,244 @@
+"""
+Bulk renaming and copying of processed receipts.
+
+Rolls back the file operations recorded in a rename journal, e.g. after a
+run was interrupted:
+    python renamer.py renames.jsonl
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import generate_filename, read_source, source_name
+from instrumentation import timed
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class NameIndex:
+    """
+    In-memory set of the file names in one folder, handing out unique names
+    without asking the filesystem about each candidate. A taken name gets
+    " (n)" before its extension, as rename_file does; the next counter to
+    try is remembered per name, so n files generating the same name cost
+    O(n) rather than O(n^2) checks. Names are compared with os.path.normcase,
+    i.e. without case on Windows.
+    """
+
+    def __init__(self, names=()):
+        self._taken = {os.path.normcase(name) for name in names}
+        self._next = {} # name -> next counter to try
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_directory(cls, directory):
+        """Lists directory once; a folder that does not exist yet gives an empty index."""
+        try:
+            with os.scandir(directory) as entries:
+                return cls(entry.name for entry in entries)
+        except FileNotFoundError:
+            return cls()
+
+    def __contains__(self, name):
+        with self._lock:
+            return os.path.normcase(name) in self._taken
+
+    def allocate(self, filename):
+        """Reserves and returns filename, or the first free "name (n).ext" variant of it."""
+        key = os.path.normcase(filename)
+        with self._lock:
+            if key not in self._taken:
+                self._taken.add(key)
+                return filename
+            name, extension = os.path.splitext(filename)
+            counter = self._next.get(key, 1)
+            candidate = f"{name} ({counter}){extension}"
+            while os.path.normcase(candidate) in self._taken:
+                counter += 1
+                candidate = f"{name} ({counter}){extension}"
+            self._next[key] = counter + 1
+            self._taken.add(os.path.normcase(candidate))
+            return candidate
+
+
+def _undo(operations):
+    """Reverts completed operations, newest first. Returns the number that could not be reverted."""
+    failed = 0
+    for entry in reversed(operations):
+        try:
+            if entry["op"] == "rename":
+                os.rename(entry["target"], entry["source"])
+            else:
+                os.remove(entry["target"])
+        except OSError as e:
+            print(f"DEBUG: Could not roll back {entry['target']}: {e}")
+            failed += 1
+    return failed
+
+
+def rollback(journal_path):
+    """
+    Reverts the renames and copies recorded in a rename journal (renamed
+    files get their old names back, copies are deleted) and removes the
+    journal. Returns the number of operations that could not be reverted.
+    """
+    operations = []
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                operations.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue # Partially written last line from a crash
+    failed = _undo(operations)
+    if not failed:
+        os.remove(journal_path)
+    return failed
+
+
+class BulkRenamer:
+    """
+    Renames files in place (destination None) or copies them into
+    destination, named from their extracted data with generate_filename.
+
+    Each target folder is listed once, when its first file is planned, and
+    names are then resolved against that in-memory index, so collisions with
+    existing files and within the batch cost no filesystem calls. plan()
+    only picks names, which makes it a dry run; add() also starts the rename
+    or copy on a thread pool. Completed operations are kept (and appended to
+    journal_path, if given) so finish() can roll the whole batch back when
+    one of them fails, and rollback() can do so after a crash.
+
+    A file whose generated name is already its own name is left alone.
+    Copies never overwrite: a file appearing in the folder after it was
+    listed makes that copy fail rather than being clobbered.
+    """
+
+    def __init__(self, format_string, destination=None, max_workers=DEFAULT_MAX_WORKERS,
+                 journal_path=None, metrics=None):
+        self.format_string = format_string
+        self.destination = destination
+        self.journal_path = journal_path
+        self.metrics = metrics
+        self.planned = [] # (source, target) for every file planned so far
+        self.completed = [] # journal entries of finished operations
+        self._indexes = {}
+        self._futures = []
+        self._lock = threading.Lock()
+        self._max_workers = max(1, int(max_workers))
+        self._executor = None
+        self._journal = None
+
+    def _index(self, directory):
+        with self._lock:
+            index = self._indexes.get(directory)
+            if index is None:
+                index = self._indexes[directory] = NameIndex.for_directory(directory or os.curdir)
+            return index
+
+    def plan(self, source, data):
+        """Picks the target path for source (a path or named file-like object) without touching any file."""
+        name = source_name(source)
+        new_name = generate_filename(data, os.path.splitext(name)[1], self.format_string)
+        if self.destination is None:
+            directory = os.path.dirname(source)
+            if os.path.normcase(new_name) == os.path.normcase(name):
+                target = source
+            else:
+                target = os.path.join(directory, self._index(directory).allocate(new_name))
+        else:
+            target = os.path.join(self.destination, self._index(self.destination).allocate(new_name))
+        self.planned.append((source, target))
+        return target
+
+    def add(self, source, data):
+        """Plans the target path for source and starts renaming or copying it in the background. Returns the path."""
+        target = self.plan(source, data)
+        if target is source:
+            return target
+        if self._executor is None:
+            if self.destination is not None:
+                os.makedirs(self.destination, exist_ok=True)
+            if self.journal_path is not None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="receipt-rename")
+        self._futures.append((source, target, self._executor.submit(self._apply, source, target)))
+        return target
+
+    def _apply(self, source, target):
+        with timed(self.metrics, "rename", os.path.basename(target)):
+            if self.destination is None:
+                # The only stat per file: something may have taken the name since the folder was listed
+                if os.path.exists(target):
+                    raise FileExistsError(f"{target} already exists")
+                os.rename(source, target)
+                self._record({"op": "rename", "source": source, "target": target})
+                return
+            try:
+                with open(target, "xb") as f:
+                    if isinstance(source, (str, os.PathLike)):
+                        with open(source, "rb") as src:
+                            shutil.copyfileobj(src, f)
+                    else:
+                        f.write(read_source(source))
+                if isinstance(source, (str, os.PathLike)):
+                    shutil.copystat(source, target)
+            except FileExistsError:
+                raise
+            except Exception:
+                # Remove the partial copy; it was created by us ("x" mode)
+                if os.path.exists(target):
+                    os.remove(target)
+                raise
+            self._record({"op": "copy", "source": source_name(source), "target": target})
+
+    def _record(self, entry):
+        entry["time"] = time.time()
+        with self._lock:
+            self.completed.append(entry)
+            if self._journal is not None:
+                self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._journal.flush()
+
+    def finish(self, rollback_on_error=True):
+        """
+        Waits for the operations started by add(). Returns [(source, target,
+        error)] for those that failed; with rollback_on_error, any failure
+        reverts every completed operation of the batch (and removes the
+        journal). Otherwise the journal is kept for a later rollback().
+        """
+        failures = []
+        for source, target, future in self._futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"DEBUG: Could not rename {source_name(source)} to {os.path.basename(target)}: {e}")
+                failures.append((source, target, e))
+        self._futures = []
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+        undo_failed = 0
+        if failures and rollback_on_error:
+            undo_failed = _undo(self.completed)
+            self.completed = []
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+            if failures and rollback_on_error and not undo_failed:
+                os.remove(self.journal_path)
+        return failures
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(2)
+    not_reverted = rollback(sys.argv[1])
+    if not_reverted:
+        print(f"{not_reverted} operation(s) could not be rolled back", file=sys.stderr)
+    sys.exit(1 if not_reverted else 0)
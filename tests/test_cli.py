@@ -0,0 +1,54 @@
+"""
+Tests for the command-line batch run: a batch whose renames are rolled back
+must leave nothing behind in the ledger.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+import csv
+import functools
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli
+from ledger import Ledger
+from renamer import BulkRenamer
+
+
+def make_images(folder, count):
+    folder.mkdir()
+    for number in range(count):
+        Image.new("RGB", (200, 300), (number * 60, 90, 120)).save(folder / f"scan{number}.jpg", "JPEG")
+
+
+def run(tmp_path, output):
+    return cli.main([str(tmp_path / "in"), "-o", str(output), "--copy-to", str(tmp_path / "out"),
+                     "--backend", "local", "--no-cache", "--no-dedup", "--workers", "2"])
+
+
+def test_rolled_back_batch_is_removed_from_ledger(tmp_path, monkeypatch):
+    make_images(tmp_path / "in", 3)
+    ledger_path = str(tmp_path / "ledger.sqlite3")
+    monkeypatch.setattr(cli, "Ledger", functools.partial(Ledger, ledger_path))
+
+    apply = BulkRenamer._apply
+
+    def failing_apply(self, source, target):
+        if os.path.basename(source) == "scan2.jpg":
+            raise OSError("disk full")
+        return apply(self, source, target)
+
+    monkeypatch.setattr(BulkRenamer, "_apply", failing_apply)
+    assert run(tmp_path, tmp_path / "first.csv") == 1
+    assert Ledger(ledger_path).count() == 0
+    assert os.listdir(tmp_path / "out") == []
+
+    # The rerun is not mistaken for a repeat of the batch that was rolled back
+    monkeypatch.setattr(BulkRenamer, "_apply", apply)
+    assert run(tmp_path, tmp_path / "second.csv") == 0
+    assert Ledger(ledger_path).count() == 3
+    with open(tmp_path / "second.csv", newline="", encoding="utf-8") as f:
+        assert not any(row["Duplicate Of"] for row in csv.DictReader(f))
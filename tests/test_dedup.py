@@ -0,0 +1,146 @@
+"""
+Regression tests for near-duplicate detection: receipts printed from the
+same template hash alike, so their results must never stand in for each
+other.
+
+Usage: python -m pytest tests
+"""
+import io
+import os
+import sys
+import json
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import PerceptualIndex, hamming, image_hashes, DEFAULT_MAX_DISTANCE, DEFAULT_MAX_FINE_DISTANCE
+from fake_gemini import FakeResponse
+from utils import extract_receipt_info
+
+
+def render_receipt(invoice_no, total, quality=90):
+    """A till receipt as JPEG bytes; only the invoice number and total change between calls."""
+    img = Image.new("RGB", (600, 900), "white")
+    draw = ImageDraw.Draw(img)
+    lines = ["KEDAI MAKAN ALI SDN BHD", "No. 12, Jalan Besar", "", f"Invoice: {invoice_no}",
+             "Date: 2024-03-05", "", "Nasi Lemak      x2", "Teh Tarik       x2", "", f"TOTAL  RM {total}",
+             "", "Thank you, come again"]
+    for number, line in enumerate(lines):
+        draw.text((40, 40 + number * 60), line, fill="black")
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class StubModel:
+    """Answers each request with the next of a list of compact-schema receipts."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        answer = self.answers[min(self.calls, len(self.answers) - 1)]
+        self.calls += 1
+        return FakeResponse(json.dumps(answer), 100, 20)
+
+
+class StubBackend:
+    structured_output = True
+    requires_api_key = False
+    model_name = "stub"
+
+    def __init__(self, answers):
+        self.model = StubModel(answers)
+
+    def get_model(self):
+        return self.model
+
+
+def answer(invoice_no, amount):
+    return {"date": "2024-03-05", "category": "Food", "vendor": "Kedai Makan Ali", "item": "Nasi Lemak",
+            "invoice_no": invoice_no, "amount": amount, "currency": "RM"}
+
+
+def test_same_template_receipts_are_extracted_separately(tmp_path):
+    first = render_receipt("INV-0001", "123.40")
+    second = render_receipt("INV-0987", "987.65")
+    (coarse_a, fine_a), (coarse_b, fine_b) = image_hashes(first), image_hashes(second)
+    # The situation being guarded against: the hashes cannot tell the two apart
+    assert hamming(coarse_a, coarse_b) <= DEFAULT_MAX_DISTANCE
+    assert hamming(fine_a, fine_b) <= DEFAULT_MAX_FINE_DISTANCE
+
+    index = PerceptualIndex(str(tmp_path / "hashes.sqlite3"))
+    backend = StubBackend([answer("INV-0001", 123.40), answer("INV-0987", 987.65)])
+    data_a = extract_receipt_info(first, preprocess=False, backend=backend, dedup=index)
+    data_b = extract_receipt_info(second, preprocess=False, backend=backend, dedup=index)
+
+    assert backend.model.calls == 2
+    assert data_a["Price Amount"] == "123.40"
+    assert data_b["Price Amount"] == "987.65"
+    assert data_b["Receipt_Invoice_No"] == "INV-0987"
+    assert "Duplicate Of" not in data_b
+    assert index.duplicates == 0
+
+
+def test_resaved_copy_is_flagged(tmp_path):
+    original = io.BytesIO(render_receipt("INV-0001", "123.40"))
+    original.name = "receipt.jpg"
+    copy = io.BytesIO(render_receipt("INV-0001", "123.40", quality=60))
+    copy.name = "receipt (scan).jpg"
+
+    index = PerceptualIndex(str(tmp_path / "hashes.sqlite3"))
+    backend = StubBackend([answer("INV-0001", 123.40)])
+    extract_receipt_info(original, preprocess=False, backend=backend, dedup=index)
+    stats = {}
+    data = extract_receipt_info(copy, preprocess=False, backend=backend, dedup=index, stats=stats)
+
+    assert backend.model.calls == 2
+    assert data["Duplicate Of"] == "receipt.jpg"
+    assert stats["duplicate_of"] == "receipt.jpg"
+    assert index.duplicates == 1
+
+
+def test_cached_reupload_is_flagged(tmp_path):
+    from cache import ExtractionCache
+
+    original = io.BytesIO(render_receipt("INV-0001", "123.40"))
+    original.name = "receipt.jpg"
+    reupload = io.BytesIO(original.getvalue())
+    reupload.name = "receipt (1).jpg"
+
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+    index = PerceptualIndex(str(tmp_path / "hashes.sqlite3"))
+    backend = StubBackend([answer("INV-0001", 123.40)])
+    extract_receipt_info(original, cache=cache, preprocess=False, backend=backend, dedup=index)
+    stats = {}
+    data = extract_receipt_info(reupload, cache=cache, preprocess=False, backend=backend, dedup=index, stats=stats)
+
+    assert backend.model.calls == 1
+    assert stats["cached"] is True
+    assert data["Duplicate Of"] == "receipt.jpg"
+    assert index.duplicates == 1
+
+
+def test_cached_reupload_in_batch_is_flagged(tmp_path):
+    from cache import ExtractionCache
+    from utils import extract_receipts_batch
+
+    original = io.BytesIO(render_receipt("INV-0001", "123.40"))
+    original.name = "receipt.jpg"
+    other = io.BytesIO(render_receipt("INV-0987", "987.65"))
+    other.name = "other.jpg"
+    reupload = io.BytesIO(original.getvalue())
+    reupload.name = "receipt (1).jpg"
+
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite3"))
+    index = PerceptualIndex(str(tmp_path / "hashes.sqlite3"))
+    backend = StubBackend([answer("INV-0001", 123.40), answer("INV-0987", 987.65)])
+    extract_receipt_info(original, cache=cache, preprocess=False, backend=backend, dedup=index)
+    results = extract_receipts_batch([reupload, other], cache=cache, preprocess=False, backend=backend, dedup=index)
+
+    assert backend.model.calls == 2
+    assert results[0]["Duplicate Of"] == "receipt.jpg"
+    assert "Duplicate Of" not in results[1]
+    assert index.duplicates == 1
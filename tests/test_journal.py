@@ -0,0 +1,37 @@
+"""
+Tests for the job journal that lets an interrupted batch resume.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import JobJournal, job_id_for
+
+
+def test_reopened_journal_resumes_from_latest_entries(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = JobJournal(path)
+    journal.record("a", "done", {"Price Amount": "1.00"}, "a-new.jpg")
+    journal.record("b", "done", {"Price Amount": "2.00"}, "b-new.jpg")
+    journal.record("b", "failed") # e.g. its rename was rolled back
+    journal.record("c", "failed")
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "d", "status": "do') # Cut short by a crash
+
+    resumed = JobJournal(path)
+    assert set(resumed.completed()) == {"a"}
+    assert resumed.get("a")["new_name"] == "a-new.jpg"
+    assert not resumed.is_done("b")
+    assert resumed.get("d") is None
+    resumed.close()
+
+
+def test_job_id_depends_on_contents_and_salt_only():
+    files = [("a.jpg", "1" * 64), ("b.jpg", "2" * 64)]
+    assert job_id_for(files, salt="model") == job_id_for(list(reversed(files)), salt="model")
+    assert job_id_for(files, salt="model") != job_id_for(files, salt="other model")
+    assert job_id_for(files) != job_id_for([("a.jpg", "1" * 64), ("b.jpg", "3" * 64)])
@@ -0,0 +1,59 @@
+"""
+Tests for the receipt ledger: duplicate invoices across and within batches,
+invoice keys of ledgers saved before the column existed, and removing a
+batch.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+import time
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ledger import Ledger
+
+
+def receipt(file_name, vendor="Kedai Ali Sdn Bhd", invoice_no="INV-0001", amount="12.00"):
+    return {"Date": "2024-03-05", "Vendor Name": vendor, "Receipt_Invoice_No": invoice_no,
+            "Price Amount": amount, "File Name": file_name}
+
+
+def test_find_duplicates_checks_history_and_earlier_rows(tmp_path):
+    ledger = Ledger(str(tmp_path / "ledger.sqlite3"))
+    ledger.append([receipt("a.jpg")], batch_id="first")
+
+    duplicates = ledger.find_duplicates([
+        receipt("b.jpg", vendor="KEDAI ALI", invoice_no="inv1"),
+        receipt("c.jpg", invoice_no="INV-0002"),
+        receipt("d.jpg", invoice_no="INV-0002"),
+        receipt("e.jpg", invoice_no="INV-0003", amount="Unknown"),
+        receipt("f.jpg", invoice_no="INV-0003", amount="Unknown"),
+    ])
+    assert duplicates == {0: "a.jpg", 2: "c.jpg"}
+
+
+def test_remove_batch(tmp_path):
+    ledger = Ledger(str(tmp_path / "ledger.sqlite3"))
+    ledger.append([receipt("a.jpg")], batch_id="kept")
+    ledger.append([receipt("b.jpg", invoice_no="INV-0002"), receipt("c.jpg", invoice_no="INV-0003")],
+                  batch_id="undone")
+
+    assert ledger.remove_batch("undone") == 2
+    assert ledger.count() == 1
+    assert ledger.find_duplicates([receipt("b.jpg", invoice_no="INV-0002")]) == {}
+
+
+def test_invoice_keys_are_backfilled_for_old_ledgers(tmp_path):
+    path = str(tmp_path / "ledger.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE receipts (id INTEGER PRIMARY KEY AUTOINCREMENT, batch_id TEXT, "
+                     "added_at REAL NOT NULL, vendor_name TEXT, receipt_invoice_no TEXT, price_amount TEXT, "
+                     "file_name TEXT)")
+        conn.execute("INSERT INTO receipts (batch_id, added_at, vendor_name, receipt_invoice_no, price_amount, "
+                     "file_name) VALUES ('old', ?, 'Kedai Ali', 'INV-0001', '12.00', 'old.jpg')", (time.time(),))
+    conn.close()
+
+    ledger = Ledger(path)
+    assert ledger.find_duplicates([receipt("new.jpg")]) == {0: "old.jpg"}
@@ -0,0 +1,57 @@
+"""
+Tests for the request governor's retries and AIMD concurrency limit.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import RequestGovernor
+
+
+class ResourceExhausted(Exception):
+    """Named like the Gemini quota error, which is what marks it as a 429."""
+
+
+def governor(**options):
+    return RequestGovernor(rpm=6000, tpm=10_000_000, base_delay=0.001, max_delay=0.001, **options)
+
+
+def test_rate_limit_halves_concurrency_and_is_retried():
+    gov = governor(max_concurrency=16, initial_concurrency=8)
+    attempts = []
+
+    def request():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ResourceExhausted("429")
+        return "ok"
+
+    assert gov.call(request) == "ok"
+    metrics = gov.metrics()
+    assert metrics["retries"] == 1
+    assert metrics["rate_limited"] == 1
+    assert metrics["concurrency_limit"] == 4
+
+
+def test_successes_grow_concurrency_up_to_the_maximum():
+    gov = governor(max_concurrency=6, initial_concurrency=2)
+    for _ in range(100):
+        gov.call(lambda: None)
+    assert gov.metrics()["concurrency_limit"] == 6
+
+
+def test_other_errors_are_not_retried():
+    gov = governor()
+
+    def request():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        gov.call(request)
+    assert gov.metrics()["retries"] == 0
+    assert gov.metrics()["failures"] == 1
@@ -0,0 +1,57 @@
+"""
+Tests for the normalization of model answers into report rows.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from receipt_schema import parse_amount, normalize_receipt, merge_page_results, invoice_key
+
+
+def test_parse_amount():
+    assert parse_amount("RM 1,234.50") == Decimal("1234.50")
+    assert parse_amount(12.5) == Decimal("12.5")
+    assert parse_amount(7) == Decimal(7)
+    assert parse_amount("free") is None
+    assert parse_amount(True) is None
+
+
+def test_normalize_receipt_types_values_and_reports_failures():
+    data, failed = normalize_receipt({"date": "05/03/2024", "vendor": "Kedai Ali", "invoice_no": None,
+                                      "amount": "RM 1,234.5"})
+    assert data["Date"] == "2024-03-05"
+    assert data["Price Amount"] == "1234.50"
+    assert data["Currency"] == "RM"
+    assert data["Receipt_Invoice_No"] == "Unknown"
+    assert failed["Receipt_Invoice_No"] == "missing"
+    assert "Date" not in failed and "Price Amount" not in failed
+
+
+def test_normalize_receipt_keeps_unreadable_values_as_invalid():
+    data, failed = normalize_receipt({"Date": "soon", "Price Amount": "free", "Currency": "MYR"})
+    assert data["Date"] == "soon"
+    assert data["Price Amount"] == "free"
+    assert data["Currency"] == "RM"
+    assert failed["Date"] == "invalid"
+    assert failed["Price Amount"] == "invalid"
+
+
+def test_merge_page_results_takes_the_total_from_the_last_page():
+    first = {"Date": "2024-03-05", "Vendor Name": "Kedai Ali", "Price Amount": "Unknown"}
+    last = {"Date": "Unknown", "Vendor Name": "Unknown", "Price Amount": "88.00", "Currency": "RM"}
+    merged = merge_page_results([first, last])
+    assert merged["Vendor Name"] == "Kedai Ali"
+    assert merged["Date"] == "2024-03-05"
+    assert merged["Price Amount"] == "88.00"
+    assert merge_page_results([{"Date": "Unknown"}]) is None
+
+
+def test_invoice_key_ignores_vendor_suffixes_and_invoice_formatting():
+    assert invoice_key({"Vendor Name": "The Corner Cafe Sdn. Bhd.", "Receipt_Invoice_No": "INV-00123",
+                        "Price Amount": "12.00"}) == \
+        invoice_key({"Vendor Name": "corner cafe", "Receipt_Invoice_No": "inv123", "Price Amount": "12"})
+    assert invoice_key({"Vendor Name": "Corner Cafe", "Receipt_Invoice_No": "Unknown", "Price Amount": "12"}) is None
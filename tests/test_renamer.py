@@ -0,0 +1,58 @@
+"""
+Tests for bulk renaming: name collisions are resolved without clobbering
+files, and a batch with a failed operation is rolled back as a whole.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from renamer import BulkRenamer, NameIndex
+
+FORMAT = "{Vendor Name} - {Price Amount}"
+
+
+def receipt(amount="12.00"):
+    return {"Vendor Name": "Kedai Ali", "Price Amount": amount}
+
+
+def make_files(folder, names):
+    for name in names:
+        (folder / name).write_bytes(name.encode("utf-8"))
+    return [str(folder / name) for name in names]
+
+
+def test_name_index_numbers_repeated_names():
+    index = NameIndex(["a.jpg", "a (1).jpg"])
+    assert index.allocate("a.jpg") == "a (2).jpg"
+    assert index.allocate("a.jpg") == "a (3).jpg"
+    assert index.allocate("b.jpg") == "b.jpg"
+
+
+def test_collisions_with_existing_files_and_within_the_batch(tmp_path):
+    sources = make_files(tmp_path, ["scan1.jpg", "scan2.jpg", "Kedai Ali - 12.00.jpg"])
+    renamer = BulkRenamer(FORMAT)
+    targets = [renamer.add(source, receipt()) for source in sources[:2]]
+    assert renamer.finish() == []
+
+    assert [os.path.basename(target) for target in targets] == ["Kedai Ali - 12.00 (1).jpg",
+                                                                "Kedai Ali - 12.00 (2).jpg"]
+    assert sorted(os.listdir(tmp_path)) == ["Kedai Ali - 12.00 (1).jpg", "Kedai Ali - 12.00 (2).jpg",
+                                            "Kedai Ali - 12.00.jpg"]
+    assert (tmp_path / "Kedai Ali - 12.00.jpg").read_bytes() == b"Kedai Ali - 12.00.jpg"
+
+
+def test_failed_rename_rolls_back_the_batch(tmp_path):
+    sources = make_files(tmp_path, ["scan1.jpg", "scan2.jpg"])
+    renamer = BulkRenamer(FORMAT, journal_path=str(tmp_path / "renames.jsonl"), max_workers=1)
+    renamer.add(sources[0], receipt("1.00"))
+    # Taken after the folder was listed, so the rename must fail instead of overwriting it
+    (tmp_path / "Kedai Ali - 2.00.jpg").write_bytes(b"other")
+    renamer.add(sources[1], receipt("2.00"))
+
+    failures = renamer.finish()
+    assert [os.path.basename(source) for source, _, _ in failures] == ["scan2.jpg"]
+    assert sorted(os.listdir(tmp_path)) == ["Kedai Ali - 2.00.jpg", "scan1.jpg", "scan2.jpg"]
+    assert (tmp_path / "Kedai Ali - 2.00.jpg").read_bytes() == b"other"
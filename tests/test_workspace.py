@@ -0,0 +1,62 @@
+"""
+Tests for the managed workspace: eviction must never remove protected
+directories, however the workspace root is spelled.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from workspace import WorkspaceManager
+
+
+def fill(path, size):
+    with open(os.path.join(path, "data.bin"), "wb") as f:
+        f.write(b"\0" * size)
+
+
+def test_cleanup_keeps_protected_dirs_under_a_symlinked_root(tmp_path):
+    real_root = tmp_path / "real"
+    real_root.mkdir()
+    linked_root = tmp_path / "linked"
+    linked_root.symlink_to(real_root, target_is_directory=True)
+
+    workspace = WorkspaceManager(str(linked_root), quota_bytes=0, max_age_seconds=0)
+    session_dir = workspace.session_dir("session")
+    job_dir = workspace.job_dir("0123456789abcdef")
+    other_dir = workspace.job_dir("fedcba9876543210")
+    for path in (session_dir, job_dir, other_dir):
+        fill(path, 1000)
+
+    removed = workspace.cleanup(protect=[session_dir, job_dir])
+
+    assert removed == 1
+    assert os.path.isdir(session_dir)
+    assert os.path.isdir(job_dir)
+    assert not os.path.exists(other_dir)
+
+
+def test_cleanup_evicts_least_recently_used_until_within_quota(tmp_path):
+    workspace = WorkspaceManager(str(tmp_path), quota_bytes=2500, max_age_seconds=3600)
+    paths = [workspace.job_dir(f"{number:016x}") for number in range(3)]
+    for age, path in zip((300, 200, 100), paths):
+        fill(path, 1000)
+        os.utime(path, (os.path.getmtime(path) - age,) * 2)
+
+    assert workspace.cleanup() == 1
+    assert not os.path.exists(paths[0]) # Oldest
+    assert os.path.isdir(paths[1]) and os.path.isdir(paths[2])
+    assert workspace.usage()["bytes"] == 2000
+
+
+def test_remove_session_refuses_paths_outside_the_workspace(tmp_path):
+    workspace = WorkspaceManager(str(tmp_path / "workspace"))
+    victim = tmp_path / "victim"
+    victim.mkdir()
+
+    workspace.remove_session("session", ["../../victim", ".."])
+
+    assert victim.is_dir()
+    assert os.path.isdir(workspace.jobs_dir)
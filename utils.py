@@ -1,158 +1,533 @@
 import os
-import google.generativeai as genai
-from PIL import Image
-import pandas as pd
 import json
 import re
 import shutil
+from datetime import datetime
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from preprocess import prepare_image, original_image_part, DEFAULT_MAX_EDGE
+from pdfpages import is_pdf, iter_pages, PDF_PAGE_WORKERS
+from ratelimit import DEFAULT_REQUEST_TOKENS
+from instrumentation import timed
+from backends import get_backend
+from receipt_schema import (RECEIPT_FIELDS, CURRENCY_FIELD, DEFAULT_CURRENCY, COMPACT_PROMPT, COMPACT_BATCH_PROMPT,
+                            generation_config, field_retry_prompt, normalize_receipt, merge_page_results,
+                            parse_amount)
 
+# Local folder for persistent app data (extraction cache, etc.)
+DATA_DIR = os.getenv("RECEIPT_DATA_DIR", os.path.join(os.path.expanduser("~"), ".receiptcompiler"))
 
+FIELD_INSTRUCTIONS = """
+    - Date (YYYY-MM-DD format)
+    - Item Category (e.g., Food, Transport, Office Supplies, Inventory, Utilities, etc. Choose the most appropriate one.)
+    - Vendor Name
+    - Item Name (A concise summary of the main item or service. If multiple, summarize e.g., "Groceries" or "Office Stationery")
+    - Receipt_Invoice_No (The receipt or invoice number)
+    - Price Amount (The total amount in format "RM 0.00", e.g., "RM 150.00". If currency is missing, assume RM.)
+"""
+
+EXTRACTION_PROMPT = """
+    Analyze this receipt/invoice image and extract the following information in JSON format:""" + FIELD_INSTRUCTIONS + """
+    Ensure the keys in the JSON are exactly: "Date", "Item Category", "Vendor Name", "Item Name", "Receipt_Invoice_No", "Price Amount".
+    If a field is missing or illegible, use "Unknown".
+    """
+
+BATCH_EXTRACTION_PROMPT = """
+    Below are {count} receipt/invoice images, each preceded by a label "Image <number>:".
+    For every image, extract the following information:""" + FIELD_INSTRUCTIONS + """
+    Return a JSON array with exactly one object per image. Each object must have an "index" key holding the image number,
+    plus the keys "Date", "Item Category", "Vendor Name", "Item Name", "Receipt_Invoice_No", "Price Amount".
+    If a field is missing or illegible, use "Unknown". Never merge or skip images.
+    """
 
 def configure_gemini(api_key):
     """Configures the Gemini API with the provided key."""
+    import google.generativeai as genai # Deferred: the SDK takes most of a second to import
     genai.configure(api_key=api_key)
 
-def extract_receipt_info(image_path):
+def error_result(file_name, error):
+    """Builds the result dictionary used for a file that could not be extracted."""
+    return {
+        "Date": "Error",
+        "Item Category": "Error",
+        "Vendor Name": "Error",
+        "Item Name": "Error",
+        "Receipt_Invoice_No": "Error",
+        "Price Amount": "Error",
+        "Currency": "Error",
+        "File Name": file_name,
+        "Error Details": str(error)
+    }
+
+def source_name(source):
+    """Returns the file name of an image given as a path or a named file-like object."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(source)
+    name = getattr(source, "name", None)
+    return os.path.basename(name) if isinstance(name, str) else "receipt"
+
+def read_source(source):
     """
-    Sends an image to Gemini and extracts receipt information.
-    Returns a dictionary with the extracted fields.
+    Returns the contents of an image given as a path, a bytes-like object or a
+    file-like object. In-memory buffers (bytes, io.BytesIO, Streamlit uploads)
+    are returned without copying, so hashing, decoding, uploading and zipping
+    can all share the same buffer.
     """
-    model = genai.GenerativeModel('gemini-flash-latest')
-    
-    try:
-        img = Image.open(image_path)
-    except Exception as e:
-        return {"Error": f"Failed to open image: {e}"}
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
 
-    prompt = """
-    Analyze this receipt/invoice image and extract the following information in JSON format:
-    - Date (YYYY-MM-DD format)
-    - Item Category (e.g., Food, Transport, Office Supplies, Inventory, Utilities, etc. Choose the most appropriate one.)
-    - Vendor Name
-    - Item Name (A concise summary of the main item or service. If multiple, summarize e.g., "Groceries" or "Office Stationery")
-    - Receipt_Invoice_No (The receipt or invoice number)
-    - Price Amount (The total amount, just the number, e.g., 150.00)
+def incomplete_fields(data):
+    """Returns the receipt fields that are missing, "Unknown" or "Error" in a result."""
+    return [key for key in RECEIPT_FIELDS
+            if str(data.get(key, "")).strip() in ("", "Unknown", "Error")]
 
-    Ensure the keys in the JSON are exactly: "Date", "Item Category", "Vendor Name", "Item Name", "Receipt_Invoice_No", "Price Amount".
-    If a field is missing or illegible, use "Unknown".
+def validation_problems(data):
+    """
+    Returns the reasons an extracted receipt looks unreliable: missing fields,
+    a date that is not a real YYYY-MM-DD date, or a non-numeric amount.
+    An empty list means the result passed every check.
     """
+    missing = incomplete_fields(data)
+    problems = [f"{key} missing" for key in missing]
+    if "Date" not in missing:
+        try:
+            datetime.strptime(str(data["Date"]).strip(), "%Y-%m-%d")
+        except ValueError:
+            problems.append("Date not YYYY-MM-DD")
+    if "Price Amount" not in missing and parse_amount(data["Price Amount"]) is None:
+        problems.append("Price Amount not numeric")
+    return problems
 
+def _count_tokens(stats, response, share=1):
+    """Adds the token usage reported in a response to a stats dictionary, split evenly over share images."""
+    usage = getattr(response, "usage_metadata", None)
+    if stats is None or usage is None:
+        return
+    stats["prompt_tokens"] = stats.get("prompt_tokens", 0) + (getattr(usage, "prompt_token_count", 0) or 0) / share
+    stats["output_tokens"] = stats.get("output_tokens", 0) + (getattr(usage, "candidates_token_count", 0) or 0) / share
+
+def _parse_json(text_response):
+    """Parses the JSON value out of a model response. Numbers with a fraction become Decimals."""
     try:
-        response = model.generate_content([prompt, img])
-        text_response = response.text
-        # Clean up potential markdown code blocks
-        if "```json" in text_response:
-            text_response = text_response.split("```json")[1].split("```")[0]
-        elif "```" in text_response:
-            text_response = text_response.split("```")[1].split("```")[0]
-        
-        data = json.loads(text_response)
-        data['File Name'] = os.path.basename(image_path)
+        # Schema-constrained responses are bare JSON
+        return json.loads(text_response, parse_float=Decimal)
+    except json.JSONDecodeError:
+        pass
+    # Clean up potential markdown code blocks
+    if "```json" in text_response:
+        text_response = text_response.split("```json")[1].split("```")[0]
+    elif "```" in text_response:
+        text_response = text_response.split("```")[1].split("```")[0]
+    return json.loads(text_response, parse_float=Decimal)
+
+def _parse_response(text_response):
+    """Parses the JSON object out of a single-receipt model response."""
+    data = _parse_json(text_response)
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    return data
+
+def _generate(model, contents, governor=None, images=1, metrics=None, file_name=None, config=None):
+    """
+    Sends a request to the model, through the request governor if one is given.
+    config is an optional generation config (e.g. a response schema).
+    With RunMetrics, the call is timed as the "api" stage and its token usage recorded.
+    """
+    kwargs = {"generation_config": config} if config is not None else {}
+    with timed(metrics, "api", file_name):
+        if governor is None:
+            response = model.generate_content(contents, **kwargs)
+        else:
+            response = governor.call(model.generate_content, contents, tokens=DEFAULT_REQUEST_TOKENS * images, **kwargs)
+    if metrics is not None:
+        metrics.record_usage(response, file_name, images)
+    return response
+
+def _request_fields(model, backend, image_part, fields, governor, metrics, file_name, stats, prompt=None):
+    """
+    Asks the model for some fields of one receipt. Backends with structured
+    output get the response schema for just those fields; others get the
+    full legacy prompt. Returns normalize_receipt's (data, failed).
+    """
+    if backend.structured_output:
+        contents = [prompt or field_retry_prompt(fields), image_part]
+        config = generation_config(fields)
+    else:
+        contents = [EXTRACTION_PROMPT, image_part]
+        config = None
+    response = _generate(model, contents, governor, metrics=metrics, file_name=file_name, config=config)
+    _count_tokens(stats, response)
+    with timed(metrics, "parse", file_name):
+        return normalize_receipt(_parse_response(response.text), fields)
+
+def _retry_failed_fields(model, backend, image_bytes, image_part, image_stats, data, failed,
+                         governor, metrics, file_name, stats):
+    """
+    Asks again for the fields that failed, merging any valid answers into data.
+    A reduced upload is retried at full resolution for every failed field;
+    otherwise only fields answered in an unusable form are retried, since a
+    genuinely absent field would come back missing again. data may be None
+    when the first answer could not be parsed at all. Returns the merged data.
+    """
+    retry_fields = [field for field in RECEIPT_FIELDS
+                    if field in failed and (image_stats["reduced"] or failed[field] == "invalid")]
+    if not retry_fields:
         return data
+
+    retry_part = original_image_part(image_bytes) if image_stats["reduced"] else image_part
+    try:
+        retry_data, retry_failed = _request_fields(model, backend, retry_part, retry_fields,
+                                                   governor, metrics, file_name, stats)
     except Exception as e:
-        print(f"DEBUG: Extraction Error for {image_path}: {e}")
-        return {
-            "Date": "Error",
-            "Item Category": "Error",
-            "Vendor Name": "Error",
-            "Item Name": "Error",
-            "Receipt_Invoice_No": "Error",
-            "Price Amount": "Error",
-            "File Name": os.path.basename(image_path),
-            "Error Details": str(e)
-        }
+        print(f"DEBUG: Field Retry Error for {file_name}: {e}")
+        return data
 
-def sanitize_filename(text):
-    """Removes illegal characters from a string to make it safe for a filename."""
-    return re.sub(r'[\\/*?:"<>|]', "", str(text))
+    if stats is not None:
+        stats["retried_fields"] = retry_fields
+        if image_stats["reduced"]:
+            stats["retried_full_resolution"] = True
+            stats["processed_bytes"] += len(image_bytes)
+            stats["bytes_saved"] -= len(image_bytes)
 
-def rename_file(original_path, data):
+    if data is None:
+        return retry_data
+    for field in retry_fields:
+        if field not in retry_failed:
+            data[field] = retry_data[field]
+            if field == "Price Amount":
+                data[CURRENCY_FIELD] = retry_data[CURRENCY_FIELD]
+    return data
+
+def flag_duplicate(dedup, image_bytes, data, file_name, scope, stats=None, metrics=None):
     """
-    Renames the file based on the extracted data.
-    Format: <Date> - <Item Category> - <Vendor Name> - <Item Name> - <Receipt/Invoice No.> - <Price Amount>
+    Records an extracted image in a PerceptualIndex and, if it repeats a
+    receipt processed before (see PerceptualIndex.record), names the
+    earlier file in the result's "Duplicate Of" key. Returns data.
     """
+    with timed(metrics, "dedup", file_name):
+        match = dedup.record(image_bytes, data, file_name, scope)
+    if match is not None:
+        original_name, distance = match
+        data['Duplicate Of'] = original_name
+        if stats is not None:
+            stats["duplicate_of"] = original_name
+            stats["duplicate_distance"] = distance
+    return data
+
+def _extract_image(image_bytes, file_name, backend, prompt, preprocess, max_edge, stats, governor, metrics):
+    """Preprocesses one image and sends it to the model, retrying failed fields. Returns the result or an error result."""
     try:
-        directory = os.path.dirname(original_path)
-        extension = os.path.splitext(original_path)[1]
-        
-        # Construct new filename
-        new_name_parts = [
-            data.get("Date", "Unknown"),
-            data.get("Item Category", "Unknown"),
-            data.get("Vendor Name", "Unknown"),
-            data.get("Item Name", "Unknown"),
-            data.get("Receipt_Invoice_No", "Unknown"),
-            str(data.get("Price Amount", "Unknown"))
-        ]
-        
-        # Sanitize each part
-        safe_parts = [sanitize_filename(part).strip() for part in new_name_parts]
-        new_filename = " - ".join(safe_parts) + extension
-        
-        new_path = os.path.join(directory, new_filename)
-        
-        # Handle duplicates
-        counter = 1
-        while os.path.exists(new_path):
-            new_filename = " - ".join(safe_parts) + f" ({counter})" + extension
-            new_path = os.path.join(directory, new_filename)
-            counter += 1
-            
-        os.rename(original_path, new_path)
-        return new_path
+        with timed(metrics, "preprocess", file_name):
+            if preprocess:
+                image_part, image_stats = prepare_image(image_bytes, max_edge)
+            else:
+                image_part = original_image_part(image_bytes)
+                image_stats = {"original_bytes": len(image_bytes), "processed_bytes": len(image_bytes),
+                               "bytes_saved": 0, "reduced": False}
     except Exception as e:
-        print(f"Error renaming file {original_path}: {e}")
-        return original_path
+        return error_result(file_name, f"Failed to open image: {e}")
+
+    if stats is not None:
+        stats.update(image_stats)
+
+    model = backend.get_model()
+
+    error = None
+    try:
+        data, failed = _request_fields(model, backend, image_part, RECEIPT_FIELDS,
+                                       governor, metrics, file_name, stats, prompt=prompt)
+    except ValueError as e: # Includes json.JSONDecodeError: an answer that could not be parsed is asked for again
+        print(f"DEBUG: Unreadable Response for {file_name}: {e}")
+        data, failed, error = None, dict.fromkeys(RECEIPT_FIELDS, "invalid"), e
+    except Exception as e: # API errors (quota, key, network) were already retried by the governor, if any
+        print(f"DEBUG: Extraction Error for {file_name}: {e}")
+        return error_result(file_name, e)
+
+    if failed:
+        data = _retry_failed_fields(model, backend, image_bytes, image_part, image_stats, data, failed,
+                                    governor, metrics, file_name, stats)
+    if data is None:
+        return error_result(file_name, error)
+
+    data['File Name'] = file_name
+    return data
+
+def _merge_page_stats(stats, page_stats, pdf_size):
+    """Sums the statistics of the pages of a PDF into stats; flags are set if any page set them."""
+    for page in page_stats:
+        for key, value in page.items():
+            if isinstance(value, bool):
+                stats[key] = stats.get(key, False) or value
+            elif isinstance(value, (int, float)):
+                stats[key] = stats.get(key, 0) + value
+    stats["original_bytes"] = pdf_size
+    stats["bytes_saved"] = pdf_size - stats.get("processed_bytes", 0)
+    stats["pages"] = len(page_stats)
 
-def extract_receipt_info(image_path):
+def _extract_pdf(pdf_bytes, file_name, backend, prompt, max_edge, stats, governor, metrics):
     """
-    Sends an image to Gemini and extracts receipt information.
-    Returns a dictionary with the extracted fields.
+    Extracts a PDF invoice page by page and merges the page results into one
+    receipt (see merge_page_results). Pages are rendered lazily by
+    pdfpages.iter_pages and extracted PDF_PAGE_WORKERS at a time; the next
+    page is only rendered once one in flight is done, which bounds memory
+    for documents of any length. Returns the result or an error result.
+
+    Pages are rendered at the size the model gets, so they skip
+    preprocessing. That also means a page is never retried at "full
+    resolution", so fields a page lacks are not asked for again; the merge
+    takes them from the other pages.
     """
-    model = genai.GenerativeModel('gemini-flash-latest')
-    
+    page_results = {}
+    page_stats = []
+
+    def extract_page(number, page_bytes):
+        page_stat = {}
+        data = _extract_image(page_bytes, f"{file_name} (page {number})", backend, prompt, False,
+                              max_edge, page_stat, governor, metrics)
+        return number, data, page_stat
+
+    def collect(futures):
+        for future in futures:
+            number, data, page_stat = future.result()
+            page_results[number] = data
+            page_stats.append(page_stat)
+
     try:
-        img = Image.open(image_path)
+        with ThreadPoolExecutor(max_workers=max(1, PDF_PAGE_WORKERS)) as executor:
+            in_flight = set()
+            pages = iter_pages(pdf_bytes, max_edge)
+            while True:
+                with timed(metrics, "render", file_name):
+                    page = next(pages, None)
+                if page is None:
+                    break
+                number, page_count, page_bytes = page
+                in_flight.add(executor.submit(extract_page, number, page_bytes))
+                if len(in_flight) >= PDF_PAGE_WORKERS:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+            collect(wait(in_flight)[0])
     except Exception as e:
-        return {"Error": f"Failed to open image: {e}"}
+        return error_result(file_name, f"Failed to read PDF: {e}")
 
-    prompt = """
-    Analyze this receipt/invoice image and extract the following information in JSON format:
-    - Date (YYYY-MM-DD format)
-    - Item Category (e.g., Food, Transport, Office Supplies, Inventory, Utilities, etc. Choose the most appropriate one.)
-    - Vendor Name
-    - Item Name (A concise summary of the main item or service. If multiple, summarize e.g., "Groceries" or "Office Stationery")
-    - Receipt_Invoice_No (The receipt or invoice number)
-    - Price Amount (The total amount in format "RM 0.00", e.g., "RM 150.00". If currency is missing, assume RM.)
+    if stats is not None:
+        _merge_page_stats(stats, page_stats, len(pdf_bytes))
+        stats["page_count"] = page_count if page_results else 0
+    data = merge_page_results([page_results[number] for number in sorted(page_results)])
+    if data is None:
+        errors = [page["Error Details"] for page in page_results.values() if "Error Details" in page]
+        return error_result(file_name, errors[0] if errors else "No pages could be read")
+    data['File Name'] = file_name
+    return data
 
-    Ensure the keys in the JSON are exactly: "Date", "Item Category", "Vendor Name", "Item Name", "Receipt_Invoice_No", "Price Amount".
-    If a field is missing or illegible, use "Unknown".
+def extract_receipt_info(image_path, cache=None, preprocess=True, max_edge=DEFAULT_MAX_EDGE, stats=None, governor=None,
+                         metrics=None, backend=None, dedup=None):
     """
+    Sends an image to the model and extracts receipt information.
+    Returns a dictionary with the extracted fields, normalized by
+    normalize_receipt (ISO date, two-decimal amount, separate currency).
+
+    image_path may also be bytes or a file-like object (e.g. a Streamlit
+    upload); its name attribute, if any, becomes the "File Name".
+
+    If an ExtractionCache is given, images already extracted with the same
+    model and prompt are answered from the cache without calling the API.
+
+    Backends with structured output are sent a compact prompt and a response
+    schema. Fields that come back missing or invalid are asked for again in
+    one follow-up request covering only those fields; with preprocess
+    enabled (downscaled, re-encoded upload) that request uses the
+    full-resolution original. Upload statistics and token usage are written
+    into the optional stats dictionary.
+
+    A RequestGovernor, if given, applies the shared rate limits and retries
+    quota and transient errors before they become an "Error" result.
+    RunMetrics, if given, receives per-stage timings and token usage.
+
+    backend is the ExtractorBackend to send the image to; it defaults to the
+    shared instance of the configured default backend (Gemini).
+
+    With a PerceptualIndex as dedup, an image that looks like one extracted
+    before and gives the same date and amount gets a "Duplicate Of" key
+    naming the earlier file, whether it was extracted or answered from the
+    cache. It is extracted (and billed) all the same, since receipts
+    printed from one template look alike whatever their totals; only exact
+    copies are spared a request, and only by the cache.
+
+    A PDF is rendered and extracted page by page, and the page results are
+    merged into one receipt (see _extract_pdf); dedup does not apply to it.
+    """
+    file_name = source_name(image_path)
+    backend = backend or get_backend()
+    prompt = COMPACT_PROMPT if backend.structured_output else EXTRACTION_PROMPT
 
     try:
-        response = model.generate_content([prompt, img])
-        text_response = response.text
-        # Clean up potential markdown code blocks
-        if "```json" in text_response:
-            text_response = text_response.split("```json")[1].split("```")[0]
-        elif "```" in text_response:
-            text_response = text_response.split("```")[1].split("```")[0]
-        
-        data = json.loads(text_response)
-        data['File Name'] = os.path.basename(image_path)
-        return data
+        with timed(metrics, "image_open", file_name):
+            image_bytes = read_source(image_path)
     except Exception as e:
-        print(f"DEBUG: Extraction Error for {image_path}: {e}")
-        return {
-            "Date": "Error",
-            "Item Category": "Error",
-            "Vendor Name": "Error",
-            "Item Name": "Error",
-            "Receipt_Invoice_No": "Error",
-            "Price Amount": "Error",
-            "File Name": os.path.basename(image_path),
-            "Error Details": str(e)
-        }
+        return error_result(file_name, f"Failed to open image: {e}")
+
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(image_bytes, backend.model_name, prompt)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            data, _ = normalize_receipt(cached)
+            data['File Name'] = file_name
+            if stats is not None:
+                stats["cached"] = True
+            if dedup is not None:
+                flag_duplicate(dedup, image_bytes, data, file_name, backend.model_name, stats, metrics)
+            return data
+
+    if is_pdf(image_bytes):
+        data = _extract_pdf(image_bytes, file_name, backend, prompt, max_edge, stats, governor, metrics)
+        if cache_key is not None and "Error Details" not in data:
+            cache.put(cache_key, data)
+        return data
+
+    data = _extract_image(image_bytes, file_name, backend, prompt, preprocess, max_edge, stats, governor, metrics)
+    if cache_key is not None and "Error Details" not in data:
+        cache.put(cache_key, data)
+    if dedup is not None:
+        flag_duplicate(dedup, image_bytes, data, file_name, backend.model_name, stats, metrics)
+    return data
+
+def extract_receipts_batch(image_paths, cache=None, preprocess=True, max_edge=DEFAULT_MAX_EDGE, stats=None, governor=None,
+                           metrics=None, backend=None, dedup=None):
+    """
+    Extracts several receipts with a single model request.
+    Returns one result dictionary per image, in the order of image_paths.
+    Like extract_receipt_info, it accepts paths, bytes or file-like objects.
+
+    The model is asked for a JSON array keyed by image number. Entries with
+    missing or invalid fields get a follow-up request for just those
+    fields; images whose entry is missing altogether, or the whole batch if
+    the answer cannot be parsed, fall back to single-image
+    extract_receipt_info calls. stats, if given, is a list with one
+    statistics dictionary per image. metrics, backend and dedup are
+    optional, as for extract_receipt_info.
+    """
+    backend = backend or get_backend()
+    prompt = COMPACT_PROMPT if backend.structured_output else EXTRACTION_PROMPT
+    if stats is None:
+        stats = [{} for _ in image_paths]
+    results = [None] * len(image_paths)
+    extracted = {} # position -> bytes of each image answered here, from the model or the cache
+    _extract_batch(image_paths, results, extracted, cache, preprocess, max_edge, stats, governor,
+                   metrics, backend, prompt)
+    if dedup is not None:
+        for position, image_bytes in extracted.items():
+            flag_duplicate(dedup, image_bytes, results[position], source_name(image_paths[position]),
+                           backend.model_name, stats[position], metrics)
+    return results
+
+def _extract_batch(image_paths, results, extracted, cache, preprocess, max_edge, stats, governor,
+                   metrics, backend, prompt):
+    """Fills in results for extract_receipts_batch, adding the bytes of every image but PDFs to extracted."""
+    pending = [] # (position, cache_key, image_bytes, image_part, image_stats) for images sent to the model
+    for position, image_path in enumerate(image_paths):
+        file_name = source_name(image_path)
+        try:
+            with timed(metrics, "image_open", file_name):
+                image_bytes = read_source(image_path)
+        except Exception as e:
+            results[position] = error_result(file_name, f"Failed to open image: {e}")
+            continue
+
+        if is_pdf(image_bytes):
+            # A PDF's pages are extracted on their own, in parallel
+            results[position] = extract_receipt_info(image_path, cache=cache, preprocess=preprocess,
+                                                     max_edge=max_edge, stats=stats[position],
+                                                     governor=governor, metrics=metrics, backend=backend)
+            continue
+
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(image_bytes, backend.model_name, prompt)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                data, _ = normalize_receipt(cached)
+                data['File Name'] = file_name
+                stats[position]["cached"] = True
+                results[position] = data
+                extracted[position] = image_bytes
+                continue
+
+        extracted[position] = image_bytes
+
+        try:
+            with timed(metrics, "preprocess", file_name):
+                if preprocess:
+                    image_part, image_stats = prepare_image(image_bytes, max_edge)
+                else:
+                    image_part = original_image_part(image_bytes)
+                    image_stats = {"original_bytes": len(image_bytes), "processed_bytes": len(image_bytes),
+                                   "bytes_saved": 0, "reduced": False}
+        except Exception as e:
+            results[position] = error_result(file_name, f"Failed to open image: {e}")
+            continue
+
+        stats[position].update(image_stats)
+        stats[position]["batched"] = True
+        pending.append((position, cache_key, image_bytes, image_part, image_stats))
+
+    entries = {}
+    model = backend.get_model()
+    if len(pending) > 1:
+        if backend.structured_output:
+            contents = [COMPACT_BATCH_PROMPT.format(count=len(pending))]
+            config = generation_config(batch=True)
+        else:
+            contents = [BATCH_EXTRACTION_PROMPT.format(count=len(pending))]
+            config = None
+        for number, (_, _, _, image_part, _) in enumerate(pending, start=1):
+            contents.append(f"Image {number}:")
+            contents.append(image_part)
+        try:
+            response = _generate(model, contents, governor, images=len(pending), metrics=metrics, config=config)
+            for position, *_ in pending:
+                _count_tokens(stats[position], response, share=len(pending))
+            with timed(metrics, "parse"):
+                parsed = _parse_json(response.text)
+            if not isinstance(parsed, list):
+                raise ValueError(f"Expected a JSON array, got {type(parsed).__name__}")
+            for entry in parsed:
+                if not isinstance(entry, dict):
+                    continue
+                try:
+                    entries[int(entry.pop("index"))] = entry
+                except (KeyError, TypeError, ValueError):
+                    continue
+        except Exception as e:
+            print(f"DEBUG: Batch Extraction Error for {len(pending)} images: {e}")
+
+    for number, (position, cache_key, image_bytes, image_part, image_stats) in enumerate(pending, start=1):
+        image_path = image_paths[position]
+        file_name = source_name(image_path)
+        entry = entries.get(number)
+        if entry is None:
+            # Fall back to a dedicated request for this image
+            stats[position]["batch_fallback"] = len(pending) > 1
+            results[position] = extract_receipt_info(image_path, cache=cache, preprocess=preprocess,
+                                                     max_edge=max_edge, stats=stats[position],
+                                                     governor=governor, metrics=metrics, backend=backend)
+            continue
+        data, failed = normalize_receipt(entry)
+        if failed:
+            data = _retry_failed_fields(model, backend, image_bytes, image_part, image_stats, data, failed,
+                                        governor, metrics, file_name, stats[position])
+        data['File Name'] = file_name
+        if cache_key is not None:
+            cache.put(cache_key, data)
+        results[position] = data
 
 def sanitize_filename(text):
     """Removes illegal characters from a string to make it safe for a filename."""
@@ -165,10 +540,11 @@ def generate_filename(data, extension, format_string="{Date} - {Item Category} -
         safe_data = {k: sanitize_filename(str(v)).strip() for k, v in data.items()}
         
         # Fill in missing keys with "Unknown" to prevent errors
-        keys = ["Date", "Item Category", "Vendor Name", "Item Name", "Receipt_Invoice_No", "Price Amount"]
-        for key in keys:
+        for key in RECEIPT_FIELDS:
             if key not in safe_data or not safe_data[key]:
                 safe_data[key] = "Unknown"
+        if not safe_data.get(CURRENCY_FIELD):
+            safe_data[CURRENCY_FIELD] = DEFAULT_CURRENCY
                 
         # Format the string
         new_filename = format_string.format(**safe_data)
@@ -185,6 +561,7 @@ def generate_filename(data, extension, format_string="{Date} - {Item Category} -
 def rename_file(original_path, data, format_string="{Date} - {Item Category} - {Vendor Name} - {Item Name} - {Receipt_Invoice_No} - RM{Price Amount}"):
     """
     Renames the file based on the extracted data and format string.
+    For many files, renamer.BulkRenamer avoids checking each candidate name on disk.
     """
     try:
         directory = os.path.dirname(original_path)
@@ -209,12 +586,13 @@ def rename_file(original_path, data, format_string="{Date} - {Item Category} - {
 def copy_and_rename_file(original_path, data, destination_folder, format_string="{Date} - {Item Category} - {Vendor Name} - {Item Name} - {Receipt_Invoice_No} - RM{Price Amount}"):
     """
     Copies the file to the destination folder and renames it based on the extracted data and format string.
+    original_path may also be a named file-like object, whose contents are written out directly.
     """
     try:
         if not os.path.exists(destination_folder):
             os.makedirs(destination_folder)
             
-        extension = os.path.splitext(original_path)[1]
+        extension = os.path.splitext(source_name(original_path))[1]
         
         new_filename = generate_filename(data, extension, format_string)
         new_path = os.path.join(destination_folder, new_filename)
@@ -226,7 +604,11 @@ def copy_and_rename_file(original_path, data, destination_folder, format_string=
             new_path = os.path.join(destination_folder, f"{name_part} ({counter}){extension}")
             counter += 1
             
-        shutil.copy2(original_path, new_path)
+        if isinstance(original_path, (str, os.PathLike)):
+            shutil.copy2(original_path, new_path)
+        else:
+            with open(new_path, 'wb') as f:
+                f.write(read_source(original_path))
         return new_path
     except Exception as e:
         print(f"Error copying file {original_path}: {e}")
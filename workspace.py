@@ -0,0 +1,147 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+# Root folder for per-session and per-job working files
+WORKSPACE_ROOT = os.getenv("RECEIPT_WORKSPACE_DIR", os.path.join(tempfile.gettempdir(), "receiptcompiler"))
+
+DEFAULT_QUOTA_MB = int(os.getenv("RECEIPT_WORKSPACE_QUOTA_MB", "2048"))
+DEFAULT_MAX_AGE_HOURS = float(os.getenv("RECEIPT_WORKSPACE_MAX_AGE_HOURS", "24"))
+
+# How long a measured disk usage is reported before the tree is walked again
+USAGE_TTL_SECONDS = 60
+
+
+def directory_size(path):
+    """Returns the total size in bytes of the files under path."""
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        total += directory_size(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return total
+
+
+class WorkspaceManager:
+    """
+    Owns the working directories of the app: one per browser session and one
+    per batch job, under a single root.
+
+    Directories are marked as used whenever they are handed out. Cleanup
+    removes directories idle for longer than max_age and, while the total size
+    exceeds the quota, evicts the least recently used ones. The total size
+    found by cleanup (or the last walk of the tree) is kept for
+    usage_ttl_seconds, so reporting it does not rescan every directory.
+    """
+
+    def __init__(self, root=WORKSPACE_ROOT, quota_bytes=DEFAULT_QUOTA_MB * 1024 * 1024,
+                 max_age_seconds=DEFAULT_MAX_AGE_HOURS * 3600, usage_ttl_seconds=USAGE_TTL_SECONDS):
+        self.root = root
+        self.sessions_dir = os.path.join(root, "sessions")
+        self.jobs_dir = os.path.join(root, "jobs")
+        self.quota_bytes = quota_bytes
+        self.max_age_seconds = max_age_seconds
+        self.usage_ttl_seconds = usage_ttl_seconds
+        self._usage = None # (time measured, bytes, directories)
+        self._lock = threading.Lock()
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def _child(self, parent, name):
+        """Returns the path of folder name directly inside parent, or None if name would resolve anywhere else."""
+        path = os.path.realpath(os.path.join(parent, name))
+        if os.path.dirname(path) != os.path.realpath(parent):
+            return None
+        return path
+
+    def _open(self, parent, name):
+        path = self._child(parent, name)
+        if path is None:
+            raise ValueError(f"Invalid workspace directory name: {name!r}")
+        os.makedirs(path, exist_ok=True)
+        os.utime(path) # Mark as recently used
+        return path
+
+    def session_dir(self, session_id):
+        """Returns (creating if needed) the directory of a browser session."""
+        return self._open(self.sessions_dir, session_id)
+
+    def job_dir(self, job_id):
+        """Returns (creating if needed) the directory of a batch job."""
+        return self._open(self.jobs_dir, job_id)
+
+    def touch(self, path):
+        """Marks a session or job directory as recently used."""
+        if os.path.isdir(path):
+            os.utime(path)
+
+    def remove_session(self, session_id, job_ids=()):
+        """
+        Deletes a session's directory and the directories of its jobs. Names
+        that would resolve outside the sessions and jobs folders are refused.
+        """
+        with self._lock:
+            for parent, name in [(self.sessions_dir, session_id), *((self.jobs_dir, job_id) for job_id in job_ids)]:
+                path = self._child(parent, name)
+                if path is None:
+                    print(f"DEBUG: Refusing to remove {name!r} outside {parent}")
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _entries(self):
+        """Returns (path, size, last_used) for every session and job directory."""
+        entries = []
+        for parent in (self.sessions_dir, self.jobs_dir):
+            try:
+                with os.scandir(parent) as children:
+                    for child in children:
+                        if child.is_dir(follow_symlinks=False):
+                            entries.append((child.path, directory_size(child.path), child.stat().st_mtime))
+            except OSError:
+                continue
+        return entries
+
+    def usage(self):
+        """Returns the workspace's disk usage in bytes (as of at most usage_ttl_seconds ago) and its quota."""
+        usage = self._usage
+        if usage is None or time.time() - usage[0] > self.usage_ttl_seconds:
+            entries = self._entries()
+            usage = self._usage = (time.time(), sum(size for _, size, _ in entries), len(entries))
+        return {
+            "bytes": usage[1],
+            "quota_bytes": self.quota_bytes,
+            "directories": usage[2],
+        }
+
+    def cleanup(self, protect=()):
+        """
+        Removes expired directories, then evicts least recently used ones until
+        the workspace fits its quota. Paths in protect are never removed.
+        Returns the number of directories removed.
+        """
+        # Compared resolved, as _child hands them out: the root may sit behind a symlink or a short name
+        protect = {os.path.realpath(path) for path in protect}
+        now = time.time()
+        removed = 0
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, last_used in entries:
+                if os.path.realpath(path) in protect:
+                    continue
+                if now - last_used > self.max_age_seconds or total > self.quota_bytes:
+                    shutil.rmtree(path, ignore_errors=True)
+                    total -= size
+                    removed += 1
+            self._usage = (now, total, len(entries) - removed)
+        return removed